@@ -0,0 +1,123 @@
+"""監査ログ (AuditLog) の確認とマイクロベンチマーク
+
+1. API を一通り呼び（受理・延長・完了・取り下げ・期限切れ・ゲームオーバー後のリセット）、
+   MemoryAuditSink に期待どおりのイベントが届くことを確認する
+2. ハンドラ側のコスト: record() 1回あたりの時間
+3. 書き込み側: SQLite の task_logs へ1件ずつ insert する場合と、AuditLog の複数行 insert の比較
+4. 溢れ: バッファより多く積むと古いものから捨てて数えることを確認する
+
+    cd backend && python bench/bench_audit_log.py --events 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+os.environ.pop("OPENAI_API_KEY", None)
+
+import main  # noqa: E402
+
+
+async def api_flow() -> None:
+    import httpx
+
+    sink = main.MemoryAuditSink()
+    main.audit_log = main.AuditLog(sink_factory=lambda user_id: sink, flush_interval=0.05)
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            async def accept(text: str, deadline: datetime | None = None) -> dict:
+                proposal = (await client.post("/tasks/propose", json={"text": text})).json()
+                if deadline:
+                    proposal["deadline_at"] = deadline.isoformat()
+                return (await client.post("/tasks/accept", json=proposal)).json()
+
+            a = await accept("レポートを書く")
+            await client.post("/tasks/extend", json={"task_id": a["id"], "extra_minutes": 30})
+            await client.post("/tasks/complete", json={"task_id": a["id"], "self_report": "提出した"})
+            b = await accept("メールを返信する")
+            await client.post("/tasks/withdraw", json={"task_id": b["id"]})
+            c = await accept("部屋を片付ける", datetime.now(timezone.utc) + timedelta(milliseconds=50))
+            await asyncio.sleep(0.1)
+            main._check_overdue(main.get_repo("local"), "local")
+            await client.post("/gameover/ack")
+    finally:
+        await main.app.router.shutdown()
+
+    types = [e.event_type for e in sink.events]
+    print(f"API flow: {len(types)} events in {sink.batches} batch(es)")
+    for e in sink.events:
+        print(f"  {e.event_type:<15} {e.task_id or '-':<36} {json.dumps(e.payload, ensure_ascii=False)[:70]}")
+    assert types == [
+        "task.accepted", "task.extended", "task.completed", "points.changed",
+        "task.accepted", "task.withdrawn", "points.changed",
+        "task.accepted", "task.overdue", "points.changed",
+        "profile.reset",
+    ], types
+    assert [e.task_id for e in sink.events if e.event_type == "task.overdue"] == [c["id"]]
+
+
+def record_cost(events: int) -> None:
+    log = main.AuditLog(sink_factory=lambda user_id: main.MemoryAuditSink(), capacity=events)
+    started = time.perf_counter()
+    for i in range(events):
+        log.record("bench", "task.accepted", "t", title="資料を整理する", estimate_minutes=90)
+    print(f"record():        {(time.perf_counter() - started) / events * 1e9:8.0f}ns per event")
+
+
+async def sqlite_write(events: int, batch_size: int) -> None:
+    db = main.LocalDB(os.path.join(tempfile.mkdtemp(), "audit.db"))
+    sink = main.SqliteAuditSink(db)
+    now = datetime.now(timezone.utc)
+    rows = [main.AuditEvent("bench", "task.accepted", f"t{i}", {"i": i}, now) for i in range(events)]
+
+    started = time.perf_counter()
+    for event in rows:
+        sink.write([event])
+    single = time.perf_counter() - started
+
+    log = main.AuditLog(sink_factory=lambda user_id: sink, capacity=events, batch_size=batch_size)
+    for event in rows:
+        log.record(event.user_id, event.event_type, event.task_id, **event.payload)
+    started = time.perf_counter()
+    await log.flush()
+    batched = time.perf_counter() - started
+    count = db.conn.execute("select count(*) from task_logs").fetchone()[0]
+    assert count == events * 2, count
+    print(f"sqlite, {events} events: one by one {single:.3f}s, batches of {batch_size} {batched:.3f}s "
+          f"({single / batched:.1f}x)")
+    main.get_db_executor().shutdown(wait=True)
+    main._db_executor = None
+
+
+async def overflow() -> None:
+    sink = main.MemoryAuditSink()
+    log = main.AuditLog(sink_factory=lambda user_id: sink, capacity=100, batch_size=30)
+    for i in range(250):
+        log.record("bench", "task.accepted", f"t{i}")
+    await log.flush()
+    print(f"overflow: capacity 100, 250 recorded -> {log.stats['written']} written, {log.stats['dropped']} dropped")
+    assert log.stats["dropped"] == 150 and sink.events[0].task_id == "t150"
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(api_flow())
+    record_cost(args.events)
+    asyncio.run(sqlite_write(args.events, args.batch_size))
+    asyncio.run(overflow())
+
+
+if __name__ == "__main__":
+    main_()
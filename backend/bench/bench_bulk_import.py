@@ -0,0 +1,71 @@
+"""一括 API (/tasks/propose/bulk) と1件ずつの /tasks/propose を比べる
+
+CLI 取り込みのように N 件を順に送る場合と、1リクエストにまとめた場合の
+所要時間と LLM 呼び出し回数を、偽LLMサーバーに対して測る。
+
+    cd backend && python bench/bench_bulk_import.py --items 50 --delay 0.3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+async def run(items: int, stats) -> None:
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        await client.post("/tasks/propose", json={"text": "ウォームアップ"})
+
+        calls_before = stats.calls
+        started = time.perf_counter()
+        for i in range(items):
+            await client.post("/tasks/propose", json={"text": f"一件ずつ 資料を整理する {i}"})
+        single_elapsed = time.perf_counter() - started
+        single_calls = stats.calls - calls_before
+
+        calls_before = stats.calls
+        started = time.perf_counter()
+        r = await client.post("/tasks/propose/bulk", json={"texts": [f"一括 資料を整理する {i}" for i in range(items)]})
+        bulk_elapsed = time.perf_counter() - started
+        bulk_calls = stats.calls - calls_before
+        ok = sum(1 for item in r.json() if item["proposal"])
+
+    print(f"items:             {items}")
+    print(f"one by one:        {single_elapsed:.2f}s, {single_calls} LLM calls, {items / single_elapsed:.1f} items/s")
+    print(f"bulk:              {bulk_elapsed:.2f}s, {bulk_calls} LLM calls, {items / bulk_elapsed:.1f} items/s ({ok} ok)")
+    print(f"speedup:           {single_elapsed / bulk_elapsed:.1f}x")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.3, help="fake LLM latency in seconds")
+    parser.add_argument("--per-item-delay", type=float, default=0.02, help="extra fake LLM latency per batched input")
+    args = parser.parse_args()
+
+    server, stats, base_url = start_fake_llm(0, args.delay, args.per_item_delay)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+    try:
+        asyncio.run(run(args.items, stats))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main_()
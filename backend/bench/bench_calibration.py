@@ -0,0 +1,220 @@
+"""実績による見積もり補正 (EstimateCalibrator) の確認とマイクロベンチマーク
+
+ユーザーごとに癖（見積もり帯ごとに 実績/見積もり がずれる）を持たせた履歴を合成して測る。
+
+1. バックフィル: build_calibrations（NumPy で一括集計）と、1件ずつ observe() で足し込む場合の
+   所要時間を比べ、統計が一致することを確認する
+2. 提案1件あたりの上乗せ: proposal_from_estimate を補正なし・補正あり・文面一致の判定込みで比べる
+3. 効果: 履歴の後に続くタスクについて、モデルの見積もりと補正後の見積もりの誤差 (|log(実績/見積もり)|)
+   と、同じ文面の繰り返しで LLM を呼ばずに済んだ割合
+4. API 経由: 初回の提案で履歴を読み込み、完了で統計が増えることを確認する
+
+    cd backend && python bench/bench_calibration.py --users 200 --history 300
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+os.environ.pop("OPENAI_API_KEY", None)
+
+import numpy as np  # noqa: E402
+
+import main  # noqa: E402
+
+ROUTINES = ["洗濯する", "皿洗い", "メール返信", "部屋の掃除", "買い物に行く"]
+ESTIMATES = [30, 45, 60, 90, 120, 180, 240, 360, 480, 720]
+
+
+class SyntheticUser:
+    """見積もり帯ごとのずれ (bias) と、毎回ほぼ同じ時間で終わる定型タスクを持つユーザー"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        base = rng.uniform(-0.5, 0.6)
+        self.bias = [base + rng.gauss(0, 0.2) for _ in range(main._CALIBRATION_BUCKETS)]
+        self.routine = {text: rng.choice([20, 30, 45, 60, 90]) for text in rng.sample(ROUTINES, 3)}
+        self.fail_rate = rng.uniform(0.0, 0.25)
+
+    def task(self, i: int) -> tuple:
+        """(title, モデルの見積もり分, 実績分 or None)"""
+        if self.rng.random() < 0.3:
+            title = self.rng.choice(list(self.routine))
+            return title, self.rng.choice(ESTIMATES[:5]), self.routine[title] * math.exp(self.rng.gauss(0, 0.1))
+        estimate = self.rng.choice(ESTIMATES)
+        if self.rng.random() < self.fail_rate:
+            return f"作業 {i}", estimate, None
+        bias = self.bias[main._calibration_bucket(estimate)]
+        return f"作業 {i}", estimate, estimate * math.exp(bias + self.rng.gauss(0, 0.3))
+
+
+def make_task(task_id: str, title: str, estimate: int, actual, created_at: datetime) -> main.Task:
+    failed = actual is None
+    return main.Task(
+        id=task_id, title=title, status=main.TaskStatus.FAILED if failed else main.TaskStatus.COMPLETED,
+        estimate_minutes=estimate, created_at=created_at, deadline_at=created_at + timedelta(hours=30),
+        completed_at=None if failed else created_at + timedelta(minutes=actual),
+        failed_at=created_at + timedelta(hours=30) if failed else None,
+    )
+
+
+def synthesize(users: int, history: int, seed: int) -> tuple:
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    people, histories = {}, {}
+    for u in range(users):
+        user_id = f"user-{u}"
+        person = people[user_id] = SyntheticUser(random.Random(rng.random()))
+        histories[user_id] = [
+            make_task(f"{user_id}-{i}", *person.task(i), start + timedelta(hours=i)) for i in range(history)
+        ]
+    return people, histories
+
+
+def best_of(n: int, fn) -> tuple:
+    times = []
+    for _ in range(n):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def check_backfill(histories: dict) -> dict:
+    rows = [
+        main._calibration_row(user_id, t)
+        for user_id, tasks in histories.items()
+        for t in sorted(tasks, key=lambda t: t.created_at, reverse=True)
+    ]
+    def one_by_one() -> dict:
+        result = {}
+        for user_id, tasks in histories.items():
+            calibration = result[user_id] = main.UserCalibration.empty()
+            for t in tasks:
+                calibration.observe(t)
+        return result
+
+    vec_s, vectorized = best_of(3, lambda: main.build_calibrations(rows))
+    inc_s, incremental = best_of(3, one_by_one)
+
+    for user_id, a in vectorized.items():
+        b = incremental[user_id]
+        assert np.allclose(a.done, b.done) and np.allclose(a.failed, b.failed), user_id
+        assert np.allclose(a.log_ratio, b.log_ratio), user_id
+        assert a.texts.keys() == b.texts.keys(), user_id
+        for key, h in a.texts.items():
+            g = b.texts[key]
+            assert (h.done, h.failed) == (g.done, g.failed), (user_id, key)
+            assert math.isclose(h.log_sum, g.log_sum, abs_tol=1e-6) and math.isclose(h.log_sq, g.log_sq, abs_tol=1e-6)
+    print(f"backfill {len(rows)} rows / {len(vectorized)} users: "
+          f"vectorized {vec_s * 1000:.1f}ms, one by one {inc_s * 1000:.1f}ms ({inc_s / vec_s:.1f}x), statistics match")
+    return vectorized
+
+
+def timeit(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - started) / repeat * 1e9
+
+
+def per_proposal_overhead(calibrations: dict, repeat: int) -> None:
+    user_ids = list(calibrations)
+    calibration = calibrations[user_ids[0]]
+    routine = next(h.title for h in calibration.texts.values() if calibration.match(h.title) is not None)
+    result = {"valid": True, "estimate_hours": 2.5, "comment": "了解"}
+    texts = [f"新しい作業 {i}" for i in range(1000)]
+    rows = [
+        ("proposal_from_estimate", lambda i: main.proposal_from_estimate(texts[i % 1000], 3, result)),
+        ("+ correction", lambda i: main.proposal_from_estimate(texts[i % 1000], 3, result, calibration)),
+        ("+ match check", lambda i: main.matched_proposal(texts[i % 1000], 3, calibration)
+         or main.proposal_from_estimate(texts[i % 1000], 3, result, calibration)),
+        ("matched (no LLM)", lambda i: main.matched_proposal(routine, 3, calibration)),
+    ]
+    print(f"{'per proposal':<24} {'time':>10} {'overhead':>10}")
+    base = None
+    for name, fn in rows:
+        ns = timeit(fn, repeat)
+        base = base or ns
+        print(f"{name:<24} {ns / 1000:>8.1f}us {(ns - base) / 1000:>+8.1f}us")
+
+
+def accuracy(people: dict, calibrations: dict, future: int, seed: int) -> None:
+    rng = random.Random(seed + 1)
+    raw_err, cal_err, matched, total = [], [], 0, 0
+    for user_id, person in people.items():
+        person.rng = random.Random(rng.random())
+        calibration = calibrations[user_id]
+        for i in range(future):
+            title, estimate, actual = person.task(10_000 + i)
+            total += 1
+            proposal = main.matched_proposal(title, 3, calibration)
+            if proposal is not None:
+                matched += 1
+            else:
+                result = {"valid": True, "estimate_hours": estimate / 60, "comment": ""}
+                proposal = main.proposal_from_estimate(title, 3, result, calibration)
+            if actual is None:
+                continue
+            raw_err.append(abs(math.log(actual / estimate)))
+            cal_err.append(abs(math.log(actual / proposal.estimate_minutes)))
+    print(f"future tasks: {total}, answered from history without the LLM: {matched / total:.1%}")
+    print(f"median |log(actual/estimate)|: model {np.median(raw_err):.3f} -> calibrated {np.median(cal_err):.3f}")
+    assert np.median(cal_err) < np.median(raw_err)
+
+
+async def api_flow() -> None:
+    import httpx
+
+    repo = main.get_repo("local")
+    now = datetime.now(timezone.utc)
+    for i in range(4):
+        task = main.Task(id=f"api-{i}", title="皿洗い", estimate_minutes=60, created_at=now - timedelta(hours=i + 1),
+                         deadline_at=now + timedelta(hours=6))
+        repo.add_task(task)
+        repo.settle_tasks([main.TaskTransition(task_id=task.id, status=main.TaskStatus.COMPLETED, points_delta=0,
+                                               completed_at=task.created_at + timedelta(minutes=40))])
+    main.estimate_calibrator = main.EstimateCalibrator()
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            proposal = (await client.post("/tasks/propose", json={"text": "皿洗い"})).json()
+            assert proposal["estimate_minutes"] == 40, proposal
+            assert main.estimate_calibrator.stats["loads"] == 1 and main.estimate_calibrator.stats["matches"] == 1
+            task = (await client.post("/tasks/accept", json=proposal)).json()
+            await client.post("/tasks/complete", json={"task_id": task["id"], "self_report": "全部洗った"})
+            assert main.estimate_calibrator.peek("local").texts["皿洗い"].done == 5
+            await client.post("/tasks/propose", json={"text": "皿洗い"})
+            assert main.estimate_calibrator.stats["loads"] == 1
+    finally:
+        await main.app.router.shutdown()
+    print("api: first proposal loads the history once, matched proposal, completion updates the statistics")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--history", type=int, default=300, help="finished tasks per user")
+    parser.add_argument("--future", type=int, default=50, help="tasks per user proposed after the history")
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    people, histories = synthesize(args.users, args.history, args.seed)
+    calibrations = check_backfill(histories)
+    per_proposal_overhead(calibrations, args.repeat)
+    accuracy(people, calibrations, args.future, args.seed)
+    asyncio.run(api_flow())
+
+
+if __name__ == "__main__":
+    main_()
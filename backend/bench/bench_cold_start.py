@@ -0,0 +1,167 @@
+"""コールドスタートの計測: import 時間と、プロセス起動から最初の /health・/status・/tasks/propose まで
+
+1. python -X importtime -c "import main" を --runs 回実行し、main の import 時間（中央値）と、
+   main から直接 import している重いモジュールを表示する
+2. uvicorn をサブプロセスで起動し、起動から /health が 200 を返すまでの時間を測る。
+   続けて --idle 秒おいてから（ヘルスチェック後に最初のユーザーが来るまでの間）、
+   最初の /status と /tasks/propose（偽LLM）の所要時間を測る。WARMUP_ON_STARTUP の有無で比べる
+
+--max-import / --max-health を指定すると、中央値がそれを超えたときに終了コード 1 で終わる（退行の検知用）。
+
+    cd backend && python bench/bench_cold_start.py --runs 5
+    cd backend && python bench/bench_cold_start.py --runs 5 --max-import 1.0 --max-health 2.0 --out /tmp/cold.json
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def base_env(**extra) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LOG_LEVEL": "WARNING",
+        "LOCAL_DB_PATH": os.path.join(tempfile.mkdtemp(), "cold.db"),
+        "OVERDUE_SWEEPER_ENABLED": "false",
+        "LLM_USER_RATE": "0",
+    })
+    env.update(extra)
+    return env
+
+
+def import_time(env: dict) -> tuple:
+    """(main の import 秒数, [(モジュール名, 秒数)] main 直下の重い順)"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = [m.groups() for m in map(_IMPORTTIME.match, out.splitlines()) if m]
+    # importtime は子が親より先に出る。main の行の直前に並ぶ1段深いモジュールが main 直下の import
+    children, total = [], 0.0
+    for _, cum, indent, name in rows:
+        if len(indent) == 1:
+            if name == "main":
+                total = int(cum) / 1e6
+                break
+            children = []
+        elif len(indent) == 3:
+            children.append((name, int(cum) / 1e6))
+    return total, sorted(children, key=lambda c: -c[1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, body: dict | None = None) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def serve_once(env: dict, idle: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if request(port, "GET", "/health") == 200:
+                    break
+            except OSError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited before /health answered")
+            time.sleep(0.005)
+        health = time.perf_counter() - started
+        time.sleep(idle)
+
+        t = time.perf_counter()
+        assert request(port, "GET", "/status") == 200
+        status = time.perf_counter() - t
+        t = time.perf_counter()
+        assert request(port, "POST", "/tasks/propose", {"text": "資料を整理する"}) == 200
+        propose = time.perf_counter() - t
+        return {"health": health, "first_status": status, "first_propose": propose}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def median_of(runs: list, key: str) -> float:
+    return round(statistics.median(r[key] for r in runs), 4)
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--idle", type=float, default=0.5, help="seconds between /health and the first user request")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="fake LLM latency in seconds")
+    parser.add_argument("--max-import", type=float, help="fail if the median import time exceeds this (seconds)")
+    parser.add_argument("--max-health", type=float, help="fail if the median time to /health exceeds this (seconds)")
+    parser.add_argument("--out", help="write the JSON result to this path")
+    args = parser.parse_args()
+
+    llm, _, llm_url = start_fake_llm(0, args.llm_delay)
+    env = base_env(OPENAI_API_KEY="sk-fake", OPENAI_BASE_URL=llm_url)
+    try:
+        imports = [import_time(env) for _ in range(args.runs)]
+        result = {"import_s": round(statistics.median(t for t, _ in imports), 4), "serve": {}}
+        print(f"import main: {result['import_s']:.3f}s (median of {args.runs})")
+        for name, seconds in imports[-1][1][:8]:
+            print(f"  {name:<24} {seconds:.3f}s")
+
+        print(f"{'':<10} {'/health':>9} {'status':>9} {'propose':>9}   (median; status/propose after {args.idle}s idle)")
+        for warmup in ("false", "true"):
+            runs = [serve_once(dict(env, WARMUP_ON_STARTUP=warmup), args.idle) for _ in range(args.runs)]
+            row = {key: median_of(runs, key) for key in ("health", "first_status", "first_propose")}
+            result["serve"][f"warmup={warmup}"] = row
+            print(f"{'warmup' if warmup == 'true' else 'cold':<10} {row['health']:>8.3f}s "
+                  f"{row['first_status']:>8.3f}s {row['first_propose']:>8.3f}s")
+    finally:
+        llm.shutdown()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"wrote {args.out}")
+    failures = []
+    if args.max_import is not None and result["import_s"] > args.max_import:
+        failures.append(f"import {result['import_s']}s > {args.max_import}s")
+    health = result["serve"]["warmup=false"]["health"]
+    if args.max_health is not None and health > args.max_health:
+        failures.append(f"/health {health}s > {args.max_health}s")
+    if failures:
+        print("cold start regressed: " + ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,131 @@
+"""LLM の流量制御 (LLMAdmission) を遅い偽LLMに対して確かめる
+
+1. 待ち行列: 遅い LLM に同時に多数の提案を送る。流量制御なしでは全員が LLM を待つが、
+   ありでは予測待ち時間が上限を超えた分をヒューリスティックな見積もりで即答する
+2. ユーザー別レート: 同じユーザーが連続で提案すると、バケットが空いた分は LLM を呼ばない
+3. ブレーカー: タイムアウトが続くと開いて LLM を呼ばなくなり、クールダウン後の試行が成功すれば閉じる
+
+各シナリオの結果を表示し、期待どおりでなければ AssertionError で止まる。
+
+    cd backend && python bench/bench_llm_admission.py --delay 2.0 --requests 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def use_llm(main, base_url: str) -> None:
+    main.settings.OPENAI_BASE_URL = base_url
+    main._llm_client = None
+
+
+async def propose(client, text: str, user: str) -> float:
+    started = time.perf_counter()
+    r = await client.post("/tasks/propose", json={"text": text}, headers={"X-User-ID": user})
+    assert r.status_code == 200, r.text
+    return time.perf_counter() - started
+
+
+async def queue_scenario(main, client, args, stats) -> None:
+    print(f"-- {args.requests} concurrent proposals, LLM delay {args.delay}s, "
+          f"{args.concurrency} slots, budget {args.budget}s")
+    print(f"{'':<14} {'p50':>7} {'p99':>7} {'LLM calls':>10} {'shed':>5}")
+    for label, admission in [
+        ("no admission", main.LLMAdmission(max_concurrency=10_000, queue_budget=1e9, user_rate=0)),
+        ("admission", main.LLMAdmission(max_concurrency=args.concurrency, queue_budget=args.budget, user_rate=0)),
+    ]:
+        main.llm_admission = admission
+        calls_before = stats.calls
+        latencies = await asyncio.gather(*[
+            propose(client, f"{label} 資料を整理する {i}", f"user-{i}") for i in range(args.requests)
+        ])
+        shed = admission.stats["shed_queue"]
+        print(f"{label:<14} {percentile(latencies, 0.5):>6.2f}s {percentile(latencies, 0.99):>6.2f}s "
+              f"{stats.calls - calls_before:>10} {shed:>5}")
+    assert shed > 0 and percentile(latencies, 0.5) < args.delay / 2
+
+
+async def user_rate_scenario(main, client, args) -> None:
+    main.llm_admission = admission = main.LLMAdmission(user_rate=0.01, user_burst=args.burst)
+    for i in range(args.burst * 2):
+        await propose(client, f"連投 メールを返信する {i}", "heavy-user")
+    await propose(client, "別のユーザーの提案", "other-user")
+    print(f"-- {args.burst * 2} proposals from one user (burst {args.burst}): "
+          f"{admission.stats['shed_user_rate']} shed by the per-user bucket")
+    assert admission.stats["shed_user_rate"] == args.burst
+
+
+async def breaker_scenario(main, client, args, fast_url: str) -> None:
+    main.llm_admission = admission = main.LLMAdmission(breaker_threshold=3, breaker_cooldown=args.cooldown, user_rate=0)
+    main.settings.LLM_PROPOSE_TIMEOUT = 0.2
+    timeline = []
+    for i in range(6):
+        latency = await propose(client, f"タイムアウト 資料を整理する {i}", "user")
+        timeline.append(f"{latency:.2f}s/{admission.breaker_state}")
+    print(f"-- LLM slower than the timeout: {' '.join(timeline)}")
+    assert admission.breaker_state == "open" and admission.stats["shed_breaker"] == 3
+
+    await asyncio.sleep(args.cooldown)
+    use_llm(main, fast_url)
+    main.settings.LLM_PROPOSE_TIMEOUT = 30.0
+    state = admission.breaker_state
+    await propose(client, "回復後 資料を整理する", "user")
+    print(f"-- after {args.cooldown}s cooldown: {state} -> probe -> {admission.breaker_state}")
+    assert state == "half_open" and admission.breaker_state == "closed"
+
+
+async def run(args, slow_url: str, fast_url: str, stats) -> None:
+    import httpx
+    import main
+
+    use_llm(main, slow_url)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        await queue_scenario(main, client, args, stats)
+        use_llm(main, fast_url)
+        await user_rate_scenario(main, client, args)
+        use_llm(main, slow_url)
+        await breaker_scenario(main, client, args, fast_url)
+        metrics = (await client.get("/metrics")).text
+    print("\n".join(line for line in metrics.splitlines() if line.startswith(("obey_llm_shed", "obey_llm_breaker"))))
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--delay", type=float, default=2.0, help="slow fake LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--budget", type=float, default=1.0, help="queue wait budget in seconds")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--cooldown", type=float, default=1.0)
+    args = parser.parse_args()
+
+    slow, stats, slow_url = start_fake_llm(0, args.delay)
+    fast, _, fast_url = start_fake_llm(0, 0.01)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+    try:
+        asyncio.run(run(args, slow_url, fast_url, stats))
+    finally:
+        slow.shutdown()
+        fast.shutdown()
+
+
+if __name__ == "__main__":
+    main_()
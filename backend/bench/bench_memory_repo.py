@@ -0,0 +1,85 @@
+"""MemoryRepo のマイクロベンチマーク
+
+全件走査・全件ソートしていた旧実装（ScanMemoryRepo として再現）と、
+ユーザー × ステータスのインデックスを持つ MemoryStore 版を比較する。
+
+    cd backend && python bench/bench_memory_repo.py --tasks 1000000 --users 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import MemoryRepo, MemoryStore, Task, TaskStatus  # noqa: E402
+
+
+class ScanMemoryRepo:
+    """旧 MemoryRepo と同じ走査ロジック（ユーザー分割なしの単一 dict）"""
+
+    def __init__(self, tasks: dict):
+        self.tasks = tasks
+
+    def get_active_tasks(self):
+        return [t for t in self.tasks.values() if t.status == TaskStatus.ACTIVE]
+
+    def recent(self):
+        return sorted(self.tasks.values(), key=lambda x: x.created_at, reverse=True)[:10]
+
+    def any_failed(self):
+        return any(t.status == TaskStatus.FAILED for t in self.tasks.values())
+
+
+def build(n_tasks: int, n_users: int):
+    rng = random.Random(0)
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    store = MemoryStore()
+    for i in range(n_tasks):
+        user_id = f"user-{i % n_users}"
+        status = rng.choice([TaskStatus.COMPLETED] * 6 + [TaskStatus.FAILED] + [TaskStatus.ACTIVE])
+        created = base + timedelta(seconds=i)
+        task = Task.model_construct(
+            id=str(uuid.UUID(int=rng.getrandbits(128))), title=f"task {i}", status=status,
+            estimate_minutes=60, created_at=created, deadline_at=created + timedelta(hours=6),
+            extension_used=False, weight=1, completed_at=None, self_report=None, failed_at=None,
+            ai_completion_comment=None,
+        )
+        MemoryRepo(store, user_id).add_task(task)
+    return store
+
+
+def timeit(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main_(n_tasks: int, n_users: int, repeat: int) -> None:
+    t0 = time.perf_counter()
+    store = build(n_tasks, n_users)
+    print(f"built {n_tasks} tasks / {n_users} users in {time.perf_counter() - t0:.1f}s")
+
+    # 旧実装は MemoryRepo 1つに全タスクを持っていたので、全件に対する走査コストを測る
+    all_tasks = {r.id: r for r in store.tasks.values()}
+    scan = ScanMemoryRepo(all_tasks)
+    indexed = MemoryRepo(store, "user-0")
+
+    print(f"{'operation':<18}{'scan (us)':>14}{'indexed (us)':>16}{'speedup':>10}")
+    for name in ("get_active_tasks", "recent", "any_failed"):
+        scan_us = timeit(getattr(scan, name), max(1, repeat // 100))
+        idx_us = timeit(getattr(indexed, name), repeat)
+        print(f"{name:<18}{scan_us:>14.1f}{idx_us:>16.1f}{scan_us / idx_us:>9.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+    main_(args.tasks, args.users, args.repeat)
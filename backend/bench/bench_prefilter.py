@@ -0,0 +1,98 @@
+"""ローカルの無意味入力フィルタ (gibberish_reason) の精度と効果を測る
+
+1. ラベル付きコーパス (bench/gibberish_corpus.jsonl) で precision / recall を出す
+2. 判定そのもののスループットを測る
+3. 偽LLMサーバーを使い、コーパス全件を /tasks/propose に流したときの
+   LLM 呼び出し回数と所要時間をフィルタ有効/無効で比較する
+
+    cd backend && python bench/bench_prefilter.py --delay 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+def load_corpus() -> list:
+    with open(os.path.join(HERE, "gibberish_corpus.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(main, corpus: list, stats, enabled: bool, concurrency: int) -> tuple:
+    import httpx
+
+    main.settings.GIBBERISH_PREFILTER_ENABLED = enabled
+    main.proposal_cache._entries.clear()
+    calls_before = stats.calls
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        async def one(text):
+            async with sem:
+                return await client.post("/tasks/propose", json={"text": text})
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(r["text"]) for r in corpus])
+        elapsed = time.perf_counter() - started
+    return elapsed, stats.calls - calls_before
+
+
+def main_(delay: float, concurrency: int) -> None:
+    server, stats, base_url = start_fake_llm(0, delay)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+    import main
+
+    corpus = load_corpus()
+    tp = fp = fn = tn = 0
+    for row in corpus:
+        predicted = main.gibberish_reason(row["text"]) is not None
+        if predicted and row["gibberish"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+            print(f"  false positive: {row['text']}")
+        elif row["gibberish"]:
+            fn += 1
+        else:
+            tn += 1
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    print(f"corpus:      {len(corpus)} texts ({tp + fn} gibberish)")
+    print(f"precision:   {precision:.3f}")
+    print(f"recall:      {recall:.3f}")
+
+    repeat = 200
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for row in corpus:
+            main.gibberish_reason(row["text"])
+    per_call_us = (time.perf_counter() - started) / (repeat * len(corpus)) * 1e6
+    print(f"classifier:  {per_call_us:.1f} us/text ({1e6 / per_call_us:,.0f} texts/s)")
+
+    off_elapsed, off_calls = asyncio.run(replay(main, corpus, stats, False, concurrency))
+    on_elapsed, on_calls = asyncio.run(replay(main, corpus, stats, True, concurrency))
+    print(f"propose (filter off): {off_calls} LLM calls, {off_elapsed:.2f}s, {len(corpus) / off_elapsed:.1f} req/s")
+    print(f"propose (filter on):  {on_calls} LLM calls, {on_elapsed:.2f}s, {len(corpus) / on_elapsed:.1f} req/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.3, help="fake LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    main_(args.delay, args.concurrency)
@@ -0,0 +1,96 @@
+"""見積もりのまとめ呼び出し (EstimateCoalescer) の効果を測る
+
+「やることリストの取り込み」を想定し、N件の /tasks/propose を spread 秒の間に
+ばらけて投げる。まとめ窓を変えながら、1件あたりのレイテンシ (p50 / p99) と
+提案1件あたりの LLM 呼び出し回数を比べる。偽LLMはまとめ件数に応じて遅くなる。
+
+    cd backend && python bench/bench_propose_batch.py --proposals 50 --spread 0.5 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def burst(main, client, stats, label: str, proposals: int, spread: float) -> tuple:
+    main.proposal_cache._entries.clear()
+    calls_before = stats.calls
+    rng = random.Random(0)
+    offsets = sorted(rng.uniform(0, spread) for _ in range(proposals))
+    latencies = []
+
+    async def one(i: int, offset: float):
+        await asyncio.sleep(offset)
+        started = time.perf_counter()
+        r = await client.post("/tasks/propose", json={"text": f"{label} 資料を整理する {i}"})
+        latencies.append(time.perf_counter() - started)
+        return r.status_code
+
+    started = time.perf_counter()
+    codes = await asyncio.gather(*[one(i, off) for i, off in enumerate(offsets)])
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for c in codes if c == 200)
+    return ok, elapsed, latencies, stats.calls - calls_before
+
+
+async def run(args) -> None:
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        # 接続プールを温めておく
+        await client.post("/tasks/propose", json={"text": "ウォームアップ"})
+        print(f"{'window':>8} {'max':>4} {'ok':>4} {'p50':>7} {'p99':>7} {'total':>7} {'calls':>6} {'calls/proposal':>15}")
+        for window in args.windows:
+            main.estimate_coalescer = main.EstimateCoalescer(window=window, max_batch=args.max_batch)
+            ok, elapsed, latencies, calls = await burst(
+                main, client, args.stats, f"w{window}", args.proposals, args.spread
+            )
+            print(
+                f"{window:>7.3f}s {args.max_batch:>4} {ok:>4} {percentile(latencies, 0.5):>6.3f}s "
+                f"{percentile(latencies, 0.99):>6.3f}s {elapsed:>6.2f}s {calls:>6} {calls / args.proposals:>15.3f}"
+            )
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--proposals", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=0.5, help="arrival spread of the burst in seconds")
+    parser.add_argument("--delay", type=float, default=0.5, help="fake LLM latency in seconds")
+    parser.add_argument("--per-item-delay", type=float, default=0.02, help="extra fake LLM latency per batched input")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.0, 0.02, 0.05, 0.1])
+    args = parser.parse_args()
+
+    server, stats, base_url = start_fake_llm(0, args.delay, args.per_item_delay)
+    args.stats = stats
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+    os.environ["GIBBERISH_PREFILTER_ENABLED"] = "false"
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main_()
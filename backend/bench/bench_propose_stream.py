@@ -0,0 +1,104 @@
+"""/tasks/propose と /tasks/propose/stream の「最初に使えるバイトまでの時間」を比べる
+
+httpx.ASGITransport はレスポンス本文をまとめて返すので、アプリは uvicorn で実際に起動する。
+偽LLMは --ttft 秒で最初のチャンクを返し、--delay 秒で生成を終える。
+通常版は応答全体、ストリーム版は estimate 行（期限）・最初の comment 行・done 行の到着時刻を測る。
+
+    cd backend && python bench/bench_propose_stream.py --requests 20 --delay 2.0 --ttft 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def start_app() -> tuple:
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def run(base_url: str, requests: int) -> None:
+    import httpx
+
+    plain, first_estimate, first_comment, done = [], [], [], []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/tasks/propose", json={"text": "ウォームアップ"})
+        for i in range(requests):
+            started = time.perf_counter()
+            r = await client.post("/tasks/propose", json={"text": f"通常 資料を整理する {i}"})
+            r.raise_for_status()
+            plain.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            seen = {}
+            async with client.stream("POST", "/tasks/propose/stream", json={"text": f"ストリーム 資料を整理する {i}"}) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if line:
+                        seen.setdefault(json.loads(line)["type"], time.perf_counter() - started)
+            first_estimate.append(seen["estimate"])
+            first_comment.append(seen.get("comment", seen["done"]))
+            done.append(seen["done"])
+
+    print(f"{'':<28} {'p50':>8} {'p95':>8}")
+    for label, values in [
+        ("/tasks/propose (response)", plain),
+        ("stream: estimate", first_estimate),
+        ("stream: first comment", first_comment),
+        ("stream: done", done),
+    ]:
+        print(f"{label:<28} {percentile(values, 0.5):>7.3f}s {percentile(values, 0.95):>7.3f}s")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=2.0, help="fake LLM generation time in seconds")
+    parser.add_argument("--ttft", type=float, default=0.2, help="fake LLM time to first chunk in seconds")
+    args = parser.parse_args()
+
+    llm, _, llm_url = start_fake_llm(0, args.delay, ttft=args.ttft)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = llm_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+    app_server, thread, base_url = start_app()
+    try:
+        asyncio.run(run(base_url, args.requests))
+    finally:
+        app_server.should_exit = True
+        thread.join()
+        llm.shutdown()
+
+
+if __name__ == "__main__":
+    main_()
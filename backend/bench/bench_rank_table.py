@@ -0,0 +1,119 @@
+"""ランク表 (RANK_TABLE) と組み立て済みプロンプトのマイクロベンチマーク
+
+毎回 RANK_THRESHOLDS を走査していた旧実装と、AI_PERSONAS から毎回 f-string で
+プロンプトを組み立てていた旧実装を再現し、表引き版と比べる。結果が一致することも確認する。
+
+    cd backend && python bench/bench_rank_table.py --repeat 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from main import AI_PERSONAS, MAX_POINTS, RANK_THRESHOLDS  # noqa: E402
+
+
+def legacy_rank(points: int) -> int:
+    rank = 1
+    for r, th in RANK_THRESHOLDS.items():
+        if points >= th:
+            rank = r
+    return rank
+
+
+def legacy_next_threshold(points: int) -> int:
+    next_th = 10
+    for r in sorted(RANK_THRESHOLDS):
+        th = RANK_THRESHOLDS[r]
+        if points < th:
+            next_th = th
+            break
+    return next_th
+
+
+def legacy_estimate_prompt(text: str, rank: int) -> str:
+    persona = AI_PERSONAS.get(rank, AI_PERSONAS[1])
+    max_len = 20
+    tone_instruction = "一言で冷たく"
+    if rank >= 7:
+        max_len = 80
+        tone_instruction = "親身に、長めの文章で"
+    elif rank >= 5:
+        max_len = 60
+        tone_instruction = "少し丁寧に"
+    elif rank >= 3:
+        max_len = 40
+        tone_instruction = "事務的に"
+    return f"""以下のテキストをタスクとして解析し、JSON形式で回答してください。
+
+入力: {text}
+
+キャラクター設定:
+{persona['prompt']}
+
+要件:
+1. valid: タスクとして成立するか判定（true/false）
+   - 拒否: 同じ文字の繰り返し、記号のみ、ランダム文字列、意味不明な文字列
+   - 許可: 作業の意図が読み取れればOK
+2. reason: validがfalseの場合の理由（日本語）
+3. estimate_hours: タスク完了にかかる現実的な時間（0.5〜24時間）。難易度ではなく純粋な所要時間。
+4. comment: キャラクター設定に基づいた、タスクに対するコメント。
+   - 長さ: {max_len}文字以内（{tone_instruction}）。文字数制限は厳守すること。
+   - 禁止: 「手伝いましょうか」「代わりましょうか」等のAIがタスクを実行・補助するような発言。あくまで管理者として振る舞うこと。
+
+回答フォーマット(JSON):
+{{
+  "valid": boolean,
+  "reason": "string",
+  "estimate_hours": number,
+  "comment": "string"
+}}
+"""
+
+
+def table_estimate_prompt(text: str, rank: int) -> str:
+    head, tail = main._ESTIMATE_PROMPTS.get(rank) or main._ESTIMATE_PROMPTS[1]
+    return head + text + tail
+
+
+def timeit(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - started) / repeat * 1e9
+
+
+def main_(repeat: int) -> None:
+    points_range = MAX_POINTS + 1
+    for p in range(points_range):
+        info = main.rank_info(p)
+        assert info.rank == legacy_rank(p), p
+        assert info.next_threshold == legacy_next_threshold(p), p
+    for rank in AI_PERSONAS:
+        assert table_estimate_prompt("レポートを書く", rank) == legacy_estimate_prompt("レポートを書く", rank), rank
+    print("table and prompts match the legacy implementation")
+
+    rows = [
+        ("rank", lambda i: legacy_rank(i % points_range), lambda i: main.rank_info(i % points_range).rank),
+        ("next_threshold", lambda i: legacy_next_threshold(i % points_range),
+         lambda i: main.rank_info(i % points_range).next_threshold),
+        ("estimate prompt", lambda i: legacy_estimate_prompt("レポートを書く", i % 7 + 1),
+         lambda i: table_estimate_prompt("レポートを書く", i % 7 + 1)),
+    ]
+    # ループと lambda 呼び出しそのものの時間は差し引く
+    overhead = timeit(lambda i: i % points_range, repeat)
+    print(f"{'':<16} {'legacy':>10} {'table':>10} {'speedup':>8}")
+    for name, legacy, table in rows:
+        before = timeit(legacy, repeat) - overhead
+        after = timeit(table, repeat) - overhead
+        print(f"{name:<16} {before:>8.0f}ns {after:>8.0f}ns {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200000)
+    args = parser.parse_args()
+    main_(args.repeat)
@@ -0,0 +1,70 @@
+"""user_status の行デコード: 1行ずつの _row_to_task と tasks_from_rows (TypeAdapter) を比べる
+
+/status 1回分（進行中3件 + 直近10件）の PostgREST 形式の行を何度もデコードし、
+1回あたりの時間を出す。両者の結果が一致することも確認する。
+
+    cd backend && python bench/bench_status_decode.py --repeat 20000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def sample_rows(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(n):
+        done = i >= 3
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'user_id': 'bench',
+            'title': f'週次レポートを書く {i}',
+            'status': main.TaskStatus.COMPLETED if done else main.TaskStatus.ACTIVE,
+            'estimate_minutes': 90,
+            'created_at': (now - timedelta(hours=i)).isoformat(),
+            'deadline_at': (now + timedelta(hours=2)).isoformat(),
+            'extension_used': False,
+            'weight': 1,
+            'completed_at': now.isoformat() if done else None,
+            'self_report': '提出した' if done else None,
+            'failed_at': None,
+            'ai_completion_comment': '確認しました。' if done else None,
+            'ai_completion_comment_pending': False,
+        })
+    return rows
+
+
+def timeit(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main_(repeat: int, rows_per_status: int) -> None:
+    repo = main.SupabaseRepo.__new__(main.SupabaseRepo)
+    rows = sample_rows(rows_per_status)
+    assert main.tasks_from_rows(rows) == [repo._row_to_task(r) for r in rows]
+    print("tasks_from_rows matches _row_to_task")
+
+    before = timeit(lambda: [repo._row_to_task(r) for r in rows], repeat)
+    after = timeit(lambda: main.tasks_from_rows(rows), repeat)
+    print(f"rows per /status: {rows_per_status}")
+    print(f"_row_to_task:     {before:8.1f}us")
+    print(f"tasks_from_rows:  {after:8.1f}us")
+    print(f"speedup:          {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=13, help="active + recent rows decoded per /status")
+    args = parser.parse_args()
+    main_(args.repeat, args.rows)
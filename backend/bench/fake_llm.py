@@ -0,0 +1,169 @@
+"""OpenAI互換のローカル偽LLMサーバー（負荷試験用）
+
+POST /v1/chat/completions に対して、指定した遅延の後に固定の応答を返す。
+同時に処理中のリクエスト数を記録し、並列に進んでいるかを確認できる。
+まとめ見積もり（入力(JSON配列): [...]）には入力数分の results を返し、
+1件増えるごとに --per-item-delay 秒だけ遅くなる（出力トークン増加の近似）。
+stream: true の場合は --ttft 秒後に最初のチャンクを送り、残りを delay までに均等に送る（SSE）。
+
+    python bench/fake_llm.py --port 8765 --delay 1.0
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.items = 0
+
+    def enter(self, items: int = 1):
+        with self.lock:
+            self.calls += 1
+            self.items += items
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+_ESTIMATE = {
+    "valid": True,
+    "reason": "",
+    "estimate_hours": 1.5,
+    "comment": "期限内に完了させなさい。",
+}
+_BATCH_MARKER = "入力(JSON配列): "
+_STREAM_CHUNK_CHARS = 4
+
+
+def _chunk(content: str) -> bytes:
+    data = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+def _batch_inputs(body: dict) -> list | None:
+    for message in body.get("messages", []):
+        for line in (message.get("content") or "").splitlines():
+            if line.startswith(_BATCH_MARKER):
+                return json.loads(line[len(_BATCH_MARKER):])
+    return None
+
+
+def make_handler(delay: float, stats: FakeLLMStats, per_item_delay: float = 0.0, ttft: float = 0.1):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            inputs = _batch_inputs(body)
+            items = len(inputs) if inputs is not None else 1
+            total_delay = delay + per_item_delay * (items - 1)
+            streaming = bool(body.get("stream"))
+            stats.enter(items)
+            try:
+                time.sleep(min(ttft, total_delay) if streaming else total_delay)
+                content = self._content(body, inputs)
+                if streaming:
+                    self._stream(content, max(0.0, total_delay - ttft))
+                    return
+            finally:
+                stats.leave()
+
+            payload = json.dumps(_completion(content), ensure_ascii=False).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # クライアントがタイムアウトや停止で先に切断した
+                pass
+
+        def _content(self, body: dict, inputs: list | None) -> str:
+            if inputs is not None:
+                return json.dumps({
+                    "results": [dict(_ESTIMATE, index=i) for i in range(len(inputs))],
+                }, ensure_ascii=False)
+            if (body.get("response_format") or {}).get("type") == "json_object":
+                return json.dumps(_ESTIMATE, ensure_ascii=False)
+            return "タスク完了を確認しました。よくできています。"
+
+        def _stream(self, content: str, duration: float):
+            pieces = [content[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(content), _STREAM_CHUNK_CHARS)]
+            gap = duration / max(1, len(pieces) - 1)
+            self.close_connection = True
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(gap)
+                    self.wfile.write(_chunk(piece))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_llm(port: int = 0, delay: float = 1.0, per_item_delay: float = 0.0, ttft: float = 0.1):
+    """バックグラウンドスレッドで起動し、(server, stats, base_url) を返す"""
+    stats = FakeLLMStats()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, stats, per_item_delay, ttft))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return server, stats, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--per-item-delay", type=float, default=0.0)
+    parser.add_argument("--ttft", type=float, default=0.1, help="time to first chunk for stream: true")
+    args = parser.parse_args()
+    server, _, base_url = start_fake_llm(args.port, args.delay, args.per_item_delay, args.ttft)
+    print(f"fake LLM listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,59 @@
+"""/tasks/propose の並行性を確認する負荷試験
+
+偽LLMサーバーを立ててアプリをプロセス内で動かし、N件を同時に投げる。
+LLM呼び出しがイベントループを塞いでいなければ、経過時間は
+delay × N ではなく delay 程度に収まる。
+
+    cd backend && python bench/load_propose.py --concurrency 20 --delay 1.0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+async def run(concurrency: int, delay: float) -> None:
+    server, stats, base_url = start_fake_llm(0, delay)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/tasks/propose", json={"text": f"レポートを書く {i}"})
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+        # 2周目はプール済みの keep-alive 接続を再利用するはず
+        await asyncio.gather(*[
+            client.post("/tasks/propose", json={"text": f"メール返信 {i}"})
+            for i in range(concurrency)
+        ])
+
+    server.shutdown()
+    ok = sum(1 for r in responses if r.status_code == 200)
+    print(f"requests:        {concurrency} ({ok} ok)")
+    print(f"llm delay:       {delay:.2f}s")
+    print(f"elapsed:         {elapsed:.2f}s (serial would be ~{delay * concurrency:.2f}s)")
+    print(f"peak in-flight:  {stats.peak_in_flight}")
+    pool = main.llm_pool_stats()
+    print(f"llm pool:        {pool['hits']} hits / {pool['misses']} misses")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.delay))
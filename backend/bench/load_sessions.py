@@ -0,0 +1,226 @@
+"""ユーザーセッションを再生する負荷試験ハーネス
+
+アプリをプロセス内 (httpx.ASGITransport) で動かし、外部サービスはローカルの代役に置き換える。
+
+- DB: 共有 MemoryStore 上の MemoryRepo。呼び出しごとに --db-latency 秒待ち、
+  DB ラウンドトリップとして数える（同期 Supabase クライアントと同じくイベントループを塞ぐ）
+- LLM: bench/fake_llm.py の OpenAI 互換サーバー
+
+1セッションの流れ: propose → accept → status を数回ポーリング → complete
+（--expire-ratio の割合は短い期限で受理し、スイーパーに失敗させる）。
+エンドポイントごとのスループット、p50/p95/p99、1リクエストあたりのラウンドトリップ数を
+JSON で出力する。コミット間の比較は --compare に以前の JSON を渡す。
+
+    cd backend && python bench/load_sessions.py --sessions 200 --concurrency 20 --out /tmp/before.json
+    cd backend && python bench/load_sessions.py --sessions 200 --concurrency 20 --compare /tmp/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_llm import start_fake_llm  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_repo_class(main, latency: float):
+    """MemoryRepo の各メソッドの前に latency 秒の待ちを入れたサブクラスを作る"""
+    names = [n for n, v in vars(main.Repo).items() if callable(v) and not n.startswith("_")]
+    attrs = {}
+    for name in names:
+        base = getattr(main.MemoryRepo, name)
+
+        def method(self, *args, _base=base, **kwargs):
+            main.count_db_round_trip()
+            if latency:
+                time.sleep(latency)
+            return _base(self, *args, **kwargs)
+
+        attrs[name] = method
+    return type("LatencyMemoryRepo", (main.MemoryRepo,), attrs)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list] = {}
+        self.errors: dict[str, int] = {}
+
+    async def call(self, label: str, request):
+        started = time.perf_counter()
+        response = await request
+        self.latencies.setdefault(label, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+
+async def session(client, rec: Recorder, i: int, args, rng: random.Random) -> None:
+    headers = {"X-User-ID": f"bench-{i}"}
+    r = await rec.call("POST /tasks/propose", client.post(
+        "/tasks/propose", json={"text": f"週次レポートを書く {i}"}, headers=headers))
+    if r.status_code != 200:
+        return
+    proposal = r.json()
+    expire = rng.random() < args.expire_ratio
+    if expire:
+        proposal["deadline_at"] = (datetime.now(timezone.utc) + timedelta(seconds=args.expire_after)).isoformat()
+    r = await rec.call("POST /tasks/accept", client.post("/tasks/accept", json=proposal, headers=headers))
+    if r.status_code != 200:
+        return
+    task = r.json()
+
+    etag = None
+    polls = args.polls + (int(args.expire_after / args.think) + 2 if expire else 0)
+    for _ in range(polls):
+        await asyncio.sleep(args.think * rng.uniform(0.5, 1.5))
+        poll_headers = dict(headers, **({"If-None-Match": etag} if etag else {}))
+        r = await rec.call("GET /status", client.get("/status", headers=poll_headers))
+        etag = r.headers.get("etag", etag)
+        if expire and r.status_code == 200 and not r.json()["active_tasks"]:
+            return
+
+    if not expire:
+        await rec.call("POST /tasks/complete", client.post(
+            "/tasks/complete", json={"task_id": task["id"], "self_report": "下書きを書いて提出した"}, headers=headers))
+
+
+def parse_round_trips(metrics_text: str) -> dict:
+    sums, counts = {}, {}
+    pattern = re.compile(r'^obey_http_request_db_round_trips_(sum|count)\{method="([^"]+)",route="([^"]+)"\} (\S+)$')
+    for line in metrics_text.splitlines():
+        m = pattern.match(line)
+        if m:
+            kind, method, route, value = m.groups()
+            (sums if kind == "sum" else counts)[f"{method} {route}"] = float(value)
+    return {k: sums[k] / counts[k] for k in counts if counts[k]}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=HERE, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> dict:
+    import httpx
+    import main
+
+    store = main.MemoryStore()
+    repo_cls = latency_repo_class(main, args.db_latency)
+    main.get_repo = lambda user_id="local": repo_cls(store, user_id)
+
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    sem = asyncio.Semaphore(args.concurrency)
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+            async def one(i: int):
+                async with sem:
+                    await session(client, rec, i, args, random.Random(rng.random()))
+
+            started = time.perf_counter()
+            await asyncio.gather(*[one(i) for i in range(args.sessions)])
+            elapsed = time.perf_counter() - started
+            metrics_text = (await client.get("/metrics")).text
+    finally:
+        await main.app.router.shutdown()
+
+    round_trips = parse_round_trips(metrics_text)
+    total = sum(len(v) for v in rec.latencies.values())
+    endpoints = {}
+    for label, values in sorted(rec.latencies.items()):
+        endpoints[label] = {
+            "count": len(values),
+            "errors": rec.errors.get(label, 0),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "round_trips": round(round_trips.get(label, 0.0), 2),
+        }
+    return {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "rps": round(total / elapsed, 2),
+        "sessions_per_s": round(args.sessions / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(result: dict, baseline: dict | None) -> None:
+    print(f"commit {result['commit']}: {result['requests']} requests in {result['elapsed_s']}s "
+          f"({result['rps']} req/s, {result['sessions_per_s']} sessions/s)")
+    print(f"{'endpoint':<22} {'count':>6} {'err':>4} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'rt/req':>7}")
+    for label, e in result["endpoints"].items():
+        print(f"{label:<22} {e['count']:>6} {e['errors']:>4} {e['rps']:>8} {e['p50_ms']:>7}ms "
+              f"{e['p95_ms']:>7}ms {e['p99_ms']:>7}ms {e['round_trips']:>7}")
+        old = (baseline or {}).get("endpoints", {}).get(label)
+        if old:
+            print(f"{'  vs ' + baseline['commit']:<22} {'':>6} {'':>4} {e['rps'] - old['rps']:>+8.2f} "
+                  f"{e['p50_ms'] - old['p50_ms']:>+7.2f}ms {e['p95_ms'] - old['p95_ms']:>+7.2f}ms "
+                  f"{e['p99_ms'] - old['p99_ms']:>+7.2f}ms {e['round_trips'] - old['round_trips']:>+7.2f}")
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--polls", type=int, default=3, help="status polls before completing")
+    parser.add_argument("--think", type=float, default=0.05, help="mean think time between polls in seconds")
+    parser.add_argument("--expire-ratio", type=float, default=0.2, help="share of sessions that let the task expire")
+    parser.add_argument("--expire-after", type=float, default=1.0, help="deadline of expiring tasks in seconds")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="injected latency per repo call in seconds")
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="fake LLM latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON result to this path")
+    parser.add_argument("--compare", help="previous JSON result to diff against")
+    args = parser.parse_args()
+
+    server, _, base_url = start_fake_llm(0, args.llm_delay)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # 1ユーザーからの連投を測るので、ユーザーごとの流量制限は外しておく（.env で有効にしていても）
+    os.environ["LLM_USER_RATE"] = "0"
+    os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["OVERDUE_SWEEP_INTERVAL"] = str(min(1.0, args.expire_after / 2))
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -1,40 +1,362 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Iterable
+from typing import AsyncIterator, Awaitable, Optional, List, Iterable, Callable, Tuple
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 
-from fastapi import FastAPI, HTTPException, Header
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter
 from pydantic_settings import BaseSettings
+import asyncio
+import atexit
+import concurrent.futures
+import bisect
+import contextlib
+import contextvars
+import functools
+import heapq
+import importlib
+import importlib.util
+import itertools
+import json
+import logging
+import logging.handlers
+import math
 import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 import uuid
 
-try:
-    from openai import OpenAI  # type: ignore
-except Exception:  # pragma: no cover
-    OpenAI = None  # type: ignore
 
-try:
-    from supabase import create_client, Client  # type: ignore
-except Exception:  # pragma: no cover
-    Client = None  # type: ignore
-    create_client = None  # type: ignore
+# openai / supabase / httpx は import だけで合わせて 0.5 秒以上かかる。scale-to-zero 環境の
+# コールドスタートを縮めるため、起動時には入っているかだけを確かめ、import は初回利用時に行う。
+def _installed(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:  # pragma: no cover
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def _lazy_import(name: str):
+    """name を import して返す（失敗したら None）。2回目以降はキャッシュを返す"""
+    try:
+        return importlib.import_module(name)
+    except Exception:  # pragma: no cover
+        return None
+
+
+OPENAI_AVAILABLE = _installed("openai")
+HTTPX_AVAILABLE = _installed("httpx")
+HTTP2_AVAILABLE = _installed("h2")  # httpx の HTTP/2 サポート
+SUPABASE_AVAILABLE = _installed("supabase") and _installed("postgrest")
+NUMPY_AVAILABLE = _installed("numpy")  # 見積もり補正の集計（無ければ補正なしで動く）
 
 app = FastAPI(title="Obey Backend", version="0.1.0")
 
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None  # OpenAI互換サーバー (ローカル負荷試験用など)
+    OPENAI_MODEL: str = "gpt-5-mini"
+    # LLM HTTP 接続プール / タイムアウト（秒）
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_PROPOSE_TIMEOUT: float = 30.0
+    LLM_COMPLETE_TIMEOUT: float = 30.0
+    # LLM 呼び出しの流量制御: 同時実行数、予測待ち時間の上限（秒、超えたらヒューリスティック/定型文で即答）、
+    # ユーザーごとのトークンバケット（1秒あたりの補充数と上限。既定は 0 = 無効。一括取り込みのような
+    # 短時間の連投もヒューリスティックに落とすので、有効にするなら十分大きくする）、
+    # 連続タイムアウトで開くサーキットブレーカー（回数と、半開にするまでの秒数）
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_QUEUE_BUDGET: float = 2.0
+    LLM_USER_RATE: float = 0.0
+    LLM_USER_BURST: int = 10
+    LLM_BREAKER_THRESHOLD: int = 5
+    LLM_BREAKER_COOLDOWN: float = 30.0
+    # 見積もり結果キャッシュ（秒）。PROPOSAL_CACHE_PATH を指定すると再起動後も残る
+    PROPOSAL_CACHE_SIZE: int = 5000
+    PROPOSAL_CACHE_TTL: float = 7 * 24 * 3600
+    PROPOSAL_CACHE_NEGATIVE_TTL: float = 24 * 3600
+    PROPOSAL_CACHE_PATH: Optional[str] = None
+    # 見積もりのまとめ呼び出し: 窓（秒）の間に届いた同ランクの提案を1回の LLM 呼び出しにまとめる。0 で無効
+    PROPOSE_BATCH_WINDOW: float = 0.0
+    PROPOSE_BATCH_MAX: int = 16
+    # 明らかに無意味な入力を LLM 呼び出し前に弾く
+    GIBBERISH_PREFILTER_ENABLED: bool = True
+    # 実績による見積もり補正: ユーザーごとに読む完了・失敗タスクの件数（新しい順）、保持するユーザー数と
+    # 読み直すまでの秒数、補正の縮小強度（この件数分だけ「補正なし」に寄せる）、補正を始める完了数、補正倍率の範囲
+    CALIBRATION_ENABLED: bool = True
+    CALIBRATION_HISTORY: int = 500
+    CALIBRATION_CACHE_SIZE: int = 10000
+    CALIBRATION_TTL: float = 3600.0
+    CALIBRATION_PRIOR: float = 5.0
+    CALIBRATION_MIN_SAMPLES: int = 5
+    CALIBRATION_MIN_RATIO: float = 0.5
+    CALIBRATION_MAX_RATIO: float = 2.0
+    # 同じ文面の過去タスクから LLM なしで提案する条件: 完了数の下限、log(実績) の標準偏差と失敗率の上限
+    CALIBRATION_MATCH_MIN_COUNT: int = 3
+    CALIBRATION_MATCH_MAX_SPREAD: float = 0.35
+    CALIBRATION_MATCH_MAX_FAILURE: float = 0.2
+    # 起動直後にバックグラウンドで全ユーザー分の統計を作る（しなければ各ユーザーの初回提案時に読む）
+    CALIBRATION_BACKFILL_ON_STARTUP: bool = False
+    # GET /events (SSE): クライアントごとのバッファ件数とハートビート間隔（秒）
+    EVENT_QUEUE_SIZE: int = 100  # 2 以上
+    EVENT_HEARTBEAT_SECONDS: float = 15.0
     SUPABASE_URL: Optional[str] = None
     SUPABASE_SERVICE_KEY: Optional[str] = None
+    # DB アクセスの同時実行数（非同期 PostgREST の接続数と、同期 Repo を回す共有スレッドプールの大きさ）
+    DB_MAX_CONCURRENCY: int = 16
+    DB_HTTP2: bool = True
+    DB_TIMEOUT: float = 10.0
+    # 作成済みプロフィールの user_id キャッシュ（リクエスト間で共有）
+    ENSURED_USER_CACHE_SIZE: int = 10000
+    ENSURED_USER_CACHE_TTL: float = 600.0
+    # ローカルモード / Supabase 未設定時の永続ストア (SQLite, WAL)
+    LOCAL_DB_PATH: str = os.path.join(os.path.dirname(__file__), "obey_local.db")
+    # 期限切れタスクのバックグラウンド失敗処理（秒）
+    OVERDUE_SWEEPER_ENABLED: bool = True
+    OVERDUE_SWEEP_INTERVAL: float = 15.0
+    OVERDUE_RESYNC_INTERVAL: float = 300.0
+    OVERDUE_SWEEP_BATCH: int = 200
+    # 一括 API (/tasks/*/bulk) の1リクエストあたりの最大件数
+    BULK_MAX_ITEMS: int = 100
+    # 完了コメントのバックグラウンド生成（ワーカー数、待ち行列、1回あたりの試行回数と再試行間隔（秒））
+    COMMENT_WORKERS: int = 4
+    COMMENT_QUEUE_SIZE: int = 1000
+    COMMENT_MAX_ATTEMPTS: int = 3
+    COMMENT_RETRY_BACKOFF: float = 1.0
+
+    # 監査ログ (task_logs): バッファの上限件数、1回の insert の件数、フラッシュ間隔（秒）
+    AUDIT_ENABLED: bool = True
+    AUDIT_BUFFER_SIZE: int = 10000
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+
+    # ログ: レベルと、リクエスト単位の DEBUG ログを出す割合 (0〜1)。WARNING 以上は常に出す
+    LOG_LEVEL: str = "INFO"
+    LOG_SAMPLE_RATE: float = 0.01
+
+    # 起動直後にバックグラウンドで SDK の import・クライアント作成・接続確立を済ませる（/health は待たせない）
+    WARMUP_ON_STARTUP: bool = False
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), ".env")
 
 
 settings = Settings()
-print(f"[STARTUP] Settings loaded:", flush=True)
-print(f"[STARTUP] OPENAI_API_KEY: {settings.OPENAI_API_KEY[:20] if settings.OPENAI_API_KEY else 'None'}...", flush=True)
-print(f"[STARTUP] SUPABASE_URL: {settings.SUPABASE_URL}", flush=True)
-print(f"[STARTUP] SUPABASE_SERVICE_KEY is set: {bool(settings.SUPABASE_SERVICE_KEY)}", flush=True)
+
+
+# ---- Logging and metrics ----
+# ログは1行1 JSON。書き出しは QueueListener のスレッドで行い、リクエスト処理中に stdout を待たない。
+# リクエストごとに出る DEBUG ログは sampled=True を付け、LOG_SAMPLE_RATE の割合だけ残す。
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+logger = logging.getLogger("obey")
+
+
+def _configure_logging() -> logging.handlers.QueueListener:
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonLogFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_event(level: int, msg: str, sampled: bool = False, exc_info: bool = False, **fields) -> None:
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, exc_info=exc_info, extra={"fields": fields, "sampled": sampled})
+
+
+_log_listener = _configure_logging()
+log_event(
+    logging.INFO, "settings loaded",
+    openai_api_key_set=bool(settings.OPENAI_API_KEY),
+    supabase_url=settings.SUPABASE_URL,
+    supabase_service_key_set=bool(settings.SUPABASE_SERVICE_KEY),
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32)
+
+
+def _prom_escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(names: Tuple[str, ...], values: tuple, le: Optional[str] = None) -> str:
+    parts = [f'{n}="{_prom_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Prometheus 形式で書き出せる最小限のヒストグラム（ラベルごとに累積バケットを持つ）"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [バケットごとの件数..., +Inf 件数, 合計]
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in sorted(self._series.items())]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_prom_labels(self.labels, labels, str(bound))} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_prom_labels(self.labels, labels, '+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{_prom_labels(self.labels, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_prom_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+http_request_seconds = Histogram(
+    "obey_http_request_duration_seconds", "HTTP request latency by route.",
+    ("method", "route", "status"), LATENCY_BUCKETS,
+)
+http_request_db_round_trips = Histogram(
+    "obey_http_request_db_round_trips", "DB round trips issued while serving one request.",
+    ("method", "route"), ROUND_TRIP_BUCKETS,
+)
+repo_call_seconds = Histogram(
+    "obey_repo_call_duration_seconds", "Repository method latency.",
+    ("backend", "method"), LATENCY_BUCKETS,
+)
+llm_call_seconds = Histogram(
+    "obey_llm_call_duration_seconds", "LLM chat completion latency.",
+    ("purpose", "outcome"), LATENCY_BUCKETS,
+)
+
+
+class RequestStats:
+    """1リクエスト分の計測値。ワーカースレッドからも加算される"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.db_round_trips = 0
+
+    def add_round_trip(self, n: int = 1) -> None:
+        with self._lock:
+            self.db_round_trips += n
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def count_db_round_trip(n: int = 1) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add_round_trip(n)
+
+
+def instrument_repo(cls):
+    """Repo の公開メソッドを計測付きに差し替えるクラスデコレータ"""
+    backend = cls.__name__
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or not callable(fn) or not hasattr(Repo, name):
+            continue
+
+        def make(fn=fn, name=name):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def timed_async(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        repo_call_seconds.observe(time.perf_counter() - started, backend, name)
+                return timed_async
+
+            @functools.wraps(fn)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    repo_call_seconds.observe(time.perf_counter() - started, backend, name)
+            return timed
+
+        setattr(cls, name, make())
+    return cls
+
+
+@app.middleware("http")
+async def _measure_request(request: Request, call_next):
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _request_stats.reset(token)
+        elapsed = time.perf_counter() - started
+        # パスそのものではなくルートのテンプレートで集計する（未定義のパスは1つにまとめる）
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_seconds.observe(elapsed, request.method, route, str(status))
+        http_request_db_round_trips.observe(stats.db_round_trips, request.method, route)
+        log_event(
+            logging.DEBUG, "request", sampled=True, method=request.method, route=route, status=status,
+            ms=round(elapsed * 1000, 2), db_round_trips=stats.db_round_trips,
+        )
 
 
 # ---- Domain Models ----
@@ -69,6 +391,9 @@ class Task(BaseModel):
     self_report: Optional[str] = None
     failed_at: Optional[datetime] = None
     ai_completion_comment: Optional[str] = None
+    ai_completion_comment_pending: bool = False  # 完了コメントをバックグラウンドで生成中
+    # 補正前のモデルの見積もり（分）。0 は実績から作った提案、None は不明（補正導入前の行や手入力）
+    ai_estimate_minutes: Optional[int] = None
 
 
 class CompleteRequest(BaseModel):
@@ -81,6 +406,33 @@ class ProposeRequest(BaseModel):
     text: str = Field(min_length=3)
 
 
+class BulkProposeRequest(BaseModel):
+    texts: List[str] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkAcceptRequest(BaseModel):
+    proposals: List[TaskProposal] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkCompleteRequest(BaseModel):
+    items: List[CompleteRequest] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkWithdrawRequest(BaseModel):
+    task_ids: List[str] = Field(min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkProposalResult(BaseModel):
+    """一括 API の1件分の結果。失敗した項目は error に理由が入る（入力と同じ順で返す）"""
+    proposal: Optional[TaskProposal] = None
+    error: Optional[str] = None
+
+
+class BulkTaskResult(BaseModel):
+    task: Optional[Task] = None
+    error: Optional[str] = None
+
+
 class ExtendRequest(BaseModel):
     task_id: str
     extra_minutes: int = Field(ge=5, le=24*60)
@@ -96,12 +448,26 @@ class Profile(BaseModel):
     
     @property
     def rank(self) -> int:
-        """ポイントに基づいてランクを自動計算"""
-        rank = 1
-        for r, th in RANK_THRESHOLDS.items():
-            if self.points >= th:
-                rank = r
-        return rank
+        """ポイントに基づいてランクを自動計算（RANK_TABLE を引くだけ）"""
+        return rank_info(self.points).rank
+
+
+class TaskTransition(BaseModel):
+    """タスクの状態遷移とポイント増減を1件分まとめたもの（Repo.settle_tasks の入力）"""
+    task_id: str
+    status: str
+    points_delta: int
+    completed_at: Optional[datetime] = None
+    failed_at: Optional[datetime] = None
+    self_report: Optional[str] = None
+    # True なら完了コメントを空にして「生成中」にする（CompletionCommentQueue が後で埋める）
+    comment_pending: bool = False
+
+
+class SettleResult(BaseModel):
+    profile: Profile
+    tasks: List[Task] = []  # 実際に ACTIVE から遷移したタスクのみ
+    points_delta: int = 0  # 実際に反映されたポイントの増減（0〜MAX_POINTS に丸めた後）
 
 
 class StatusResponse(BaseModel):
@@ -114,82 +480,334 @@ class StatusResponse(BaseModel):
 
 
 # ---- Repository layer: Memory (default) and Supabase (optional) ----
+class TaskNotFound(Exception):
+    """更新しようとしたタスクがこのユーザーの行として存在しないとき。HTTP への変換はハンドラ側で行う"""
+
+    def __init__(self, task_id: str):
+        super().__init__(task_id)
+        self.task_id = task_id
+
+
 class Repo:
     def get_profile(self) -> Profile: ...
     def set_profile(self, p: Profile) -> None: ...
     def get_active_tasks(self) -> List[Task]: ...
     def add_task(self, task: Task) -> Task: ...
+    def add_tasks(self, tasks: List[Task]) -> List[Task]: ...
     def update_task(self, task: Task) -> Task: ...
+    def settle_tasks(self, transitions: List[TaskTransition]) -> SettleResult: ...
+    def set_completion_comment(self, task_id: str, comment: str) -> Optional[Task]: ...
     def recent(self) -> List[Task]: ...
+    def finished_tasks(self, limit: int) -> List[Task]: ...
     def any_failed(self) -> bool: ...
     def clear_all(self) -> None: ...
+    def change_version(self) -> Optional[int]: ...
 
 
-class MemoryRepo(Repo):
+@dataclass(slots=True)
+class TaskRecord:
+    """MemoryStore 内部のタスク表現（Pydantic モデルより軽量）"""
+    id: str
+    user_id: str
+    title: str
+    status: str
+    estimate_minutes: int
+    created_at: datetime
+    deadline_at: datetime
+    extension_used: bool = False
+    weight: int = 1
+    completed_at: Optional[datetime] = None
+    self_report: Optional[str] = None
+    failed_at: Optional[datetime] = None
+    ai_completion_comment: Optional[str] = None
+    ai_completion_comment_pending: bool = False
+    ai_estimate_minutes: Optional[int] = None
+
+    @classmethod
+    def from_task(cls, user_id: str, task: Task) -> "TaskRecord":
+        return cls(
+            task.id, user_id, task.title, task.status, task.estimate_minutes, task.created_at,
+            task.deadline_at, task.extension_used, task.weight, task.completed_at, task.self_report,
+            task.failed_at, task.ai_completion_comment, task.ai_completion_comment_pending,
+            task.ai_estimate_minutes,
+        )
+
+    def to_task(self) -> Task:
+        # 保存時に検証済みなので再検証しない
+        return Task.model_construct(
+            id=self.id, title=self.title, status=self.status, estimate_minutes=self.estimate_minutes,
+            created_at=self.created_at, deadline_at=self.deadline_at, extension_used=self.extension_used,
+            weight=self.weight, completed_at=self.completed_at, self_report=self.self_report,
+            failed_at=self.failed_at, ai_completion_comment=self.ai_completion_comment,
+            ai_completion_comment_pending=self.ai_completion_comment_pending,
+            ai_estimate_minutes=self.ai_estimate_minutes,
+        )
+
+
+class MemoryStore:
+    """複数ユーザー分のタスクをインデックス付きで保持するインメモリストア
+
+    - ユーザー × ステータスごとの ID 集合 (get_active_tasks は O(アクティブ数))
+    - ユーザーごとの作成日時順リスト (recent は O(k))
+    - ユーザーごとの失敗件数 (any_failed は O(1))
+    """
+
     def __init__(self):
-        self.profile = Profile(user_id="local", points=10)
-        self.tasks: dict[str, Task] = {}
+        self.lock = threading.RLock()
+        self.tasks: dict[str, TaskRecord] = {}
+        self.points: dict[str, int] = {}
+        self.by_status: dict[str, dict[str, set[str]]] = {}
+        self.by_created: dict[str, List[Tuple[datetime, str]]] = {}
+        self.failed_count: dict[str, int] = {}
+        # ユーザーごとの変更バージョン（タスク・ポイントが変わるたびに増える）
+        self.versions: dict[str, int] = {}
+
+    def bump(self, user_id: str) -> None:
+        with self.lock:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def set_points(self, user_id: str, points: int) -> None:
+        with self.lock:
+            if self.points.get(user_id, 10) != points:
+                self.bump(user_id)
+            self.points[user_id] = points
+
+    def _index(self, rec: TaskRecord) -> None:
+        self.by_status.setdefault(rec.user_id, {}).setdefault(rec.status, set()).add(rec.id)
+        if rec.status == TaskStatus.FAILED:
+            self.failed_count[rec.user_id] = self.failed_count.get(rec.user_id, 0) + 1
+
+    def _unindex(self, rec: TaskRecord) -> None:
+        self.by_status[rec.user_id][rec.status].discard(rec.id)
+        if rec.status == TaskStatus.FAILED:
+            self.failed_count[rec.user_id] -= 1
+
+    def put(self, rec: TaskRecord) -> None:
+        with self.lock:
+            old = self.tasks.get(rec.id)
+            if old is not None:
+                self._unindex(old)
+            else:
+                created = self.by_created.setdefault(rec.user_id, [])
+                entry = (rec.created_at, rec.id)
+                # 通常は作成順に届くので末尾追加で済む
+                if not created or created[-1] <= entry:
+                    created.append(entry)
+                else:
+                    bisect.insort(created, entry)
+            self.tasks[rec.id] = rec
+            self._index(rec)
+            self.bump(rec.user_id)
+
+    def set_status(self, rec: TaskRecord, status: str) -> None:
+        with self.lock:
+            self._unindex(rec)
+            rec.status = status
+            self._index(rec)
+            self.bump(rec.user_id)
+
+    def ids(self, user_id: str, status: str) -> List[str]:
+        with self.lock:
+            return list(self.by_status.get(user_id, {}).get(status, ()))
+
+    def recent_ids(self, user_id: str, k: int) -> List[str]:
+        with self.lock:
+            created = self.by_created.get(user_id, [])
+            return [task_id for _, task_id in reversed(created[-k:])]
+
+    def clear_user(self, user_id: str) -> None:
+        with self.lock:
+            for _, task_id in self.by_created.pop(user_id, []):
+                self.tasks.pop(task_id, None)
+            self.by_status.pop(user_id, None)
+            self.failed_count.pop(user_id, None)
+            self.bump(user_id)
+
+
+@instrument_repo
+class MemoryRepo(Repo):
+    def __init__(self, store: Optional[MemoryStore] = None, user_id: str = "local"):
+        self.store = store if store is not None else MemoryStore()
+        self._user_id = user_id
 
     def get_profile(self) -> Profile:
-        return self.profile
+        return Profile(user_id=self._user_id, points=self.store.points.get(self._user_id, 10))
 
     def set_profile(self, p: Profile) -> None:
-        self.profile = p
+        self.store.set_points(self._user_id, p.points)
 
     def add_task(self, task: Task) -> Task:
-        self.tasks[task.id] = task
+        self.store.put(TaskRecord.from_task(self._user_id, task))
         return task
 
+    def add_tasks(self, tasks: List[Task]) -> List[Task]:
+        with self.store.lock:
+            for task in tasks:
+                self.store.put(TaskRecord.from_task(self._user_id, task))
+        return tasks
+
     def update_task(self, task: Task) -> Task:
-        self.tasks[task.id] = task
+        store = self.store
+        with store.lock:
+            rec = store.tasks.get(task.id)
+            if rec is None or rec.user_id != self._user_id:
+                raise TaskNotFound(task.id)
+            store.put(TaskRecord.from_task(self._user_id, task))
         return task
 
+    def settle_tasks(self, transitions: List[TaskTransition]) -> SettleResult:
+        store = self.store
+        settled = []
+        with store.lock:
+            points = before = store.points.get(self._user_id, 10)
+            for tr in transitions:
+                rec = store.tasks.get(tr.task_id)
+                if rec is None or rec.user_id != self._user_id or rec.status != TaskStatus.ACTIVE:
+                    continue
+                store.set_status(rec, tr.status)
+                rec.completed_at = tr.completed_at or rec.completed_at
+                rec.failed_at = tr.failed_at or rec.failed_at
+                rec.self_report = tr.self_report or rec.self_report
+                if tr.comment_pending:
+                    rec.ai_completion_comment = None
+                    rec.ai_completion_comment_pending = True
+                points = min(MAX_POINTS, max(0, points + tr.points_delta))
+                settled.append(rec.to_task())
+            store.set_points(self._user_id, points)
+        return SettleResult(profile=Profile(user_id=self._user_id, points=points), tasks=settled,
+                            points_delta=points - before)
+
+    def set_completion_comment(self, task_id: str, comment: str) -> Optional[Task]:
+        with self.store.lock:
+            rec = self.store.tasks.get(task_id)
+            if rec is None or rec.user_id != self._user_id:
+                return None
+            rec.ai_completion_comment = comment
+            rec.ai_completion_comment_pending = False
+            self.store.bump(self._user_id)
+            return rec.to_task()
+
+    # 読み取りも索引と tasks を同じロックの中で引く（clear_user と並ぶと索引にだけ残った ID で KeyError になる）
     def get_active_tasks(self) -> List[Task]:
-        return [t for t in self.tasks.values() if t.status == TaskStatus.ACTIVE]
+        store = self.store
+        with store.lock:
+            return [store.tasks[i].to_task() for i in store.ids(self._user_id, TaskStatus.ACTIVE)]
 
     def recent(self) -> List[Task]:
-        return sorted(self.tasks.values(), key=lambda x: x.created_at, reverse=True)[:10]
+        store = self.store
+        with store.lock:
+            return [store.tasks[i].to_task() for i in store.recent_ids(self._user_id, 10)]
+
+    def finished_tasks(self, limit: int) -> List[Task]:
+        store = self.store
+        with store.lock:
+            ids = store.ids(self._user_id, TaskStatus.COMPLETED) + store.ids(self._user_id, TaskStatus.FAILED)
+            recs = heapq.nlargest(limit, (store.tasks[i] for i in ids), key=lambda r: r.created_at)
+            return [r.to_task() for r in recs]
 
     def any_failed(self) -> bool:
-        return any(t.status == TaskStatus.FAILED for t in self.tasks.values())
+        return self.store.failed_count.get(self._user_id, 0) > 0
 
     def clear_all(self) -> None:
-        self.tasks.clear()
+        self.store.clear_user(self._user_id)
         # Reset points to default (10) as per requirement
-        self.profile = Profile(user_id="local", points=10)
+        self.store.set_points(self._user_id, 10)
+
+    def change_version(self) -> Optional[int]:
+        return self.store.versions.get(self._user_id, 0)
+
+
+class EnsuredUserCache:
+    """プロフィール行が存在すると確認済みの user_id を TTL + LRU で保持する"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            expires_at = self._entries.get(user_id)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return False
+            self._entries.move_to_end(user_id)
+            return True
+
+    def add(self, user_id: str) -> None:
+        with self._lock:
+            self._entries[user_id] = time.monotonic() + self.ttl
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+_ensured_users = EnsuredUserCache(settings.ENSURED_USER_CACHE_SIZE, settings.ENSURED_USER_CACHE_TTL)
+
+
+def _return_representation():
+    # SupabaseRepo はクライアント作成後にしか使われないので postgrest は読み込み済み
+    return _lazy_import("postgrest.types").ReturnMethod.representation
+
 
+def _return_minimal():
+    return _lazy_import("postgrest.types").ReturnMethod.minimal
 
+
+@instrument_repo
 class SupabaseRepo(Repo):
     def __init__(self, client, user_id: str):  # type: ignore
         self.client = client
         self._user_id = user_id
+        # リクエスト内で取得済みのプロフィール行（get_profile で再利用）
+        self._profile_row: Optional[dict] = None
+        # このリポジトリが発行した DB ラウンドトリップ数
+        self.round_trips = 0
+
+    def _execute(self, query):
+        self.round_trips += 1
+        count_db_round_trip()
+        return query.execute()
 
     def _ensure_user(self) -> str:
         """Ensure user profile exists for the given user_id"""
         if not self._user_id:
             raise ValueError("User ID is required")
+        if self._profile_row is not None or self._user_id in _ensured_users:
+            return self._user_id
         
         # Check if profile exists for this user_id
-        res = self.client.table('profiles').select('*').eq('user_id', self._user_id).execute()
+        res = self._execute(self.client.table('profiles').select('*').eq('user_id', self._user_id))
         data = res.data or []
         
         if data:
             # Profile exists
+            self._profile_row = data[0]
+            _ensured_users.add(self._user_id)
             return self._user_id
         
-        # Create new profile for this user_id
+        # Create new profile for this user_id (同時作成でも衝突しないよう upsert)
         try:
             now_iso = datetime.now(timezone.utc).isoformat()
-            self.client.table('profiles').insert({
+            res = self._execute(self.client.table('profiles').upsert({
                 'user_id': self._user_id, 
                 'points': 10, 
                 'created_at': now_iso
-            }).execute()
+            }, on_conflict='user_id', ignore_duplicates=True))
         except Exception as e:
-            print(f"Error creating profile for {self._user_id}: {e}")
+            log_event(logging.ERROR, "profile creation failed", user_id=self._user_id, error=repr(e))
             # Re-raise the exception to see it in the logs
             raise e
-            
+        if res.data:
+            self._profile_row = res.data[0]
+        _ensured_users.add(self._user_id)
         return self._user_id
 
     def _row_to_profile(self, row: dict) -> Profile:
@@ -209,20 +827,26 @@ class SupabaseRepo(Repo):
             self_report=row.get('self_report'),
             failed_at=datetime.fromisoformat(row['failed_at'].replace('Z', '+00:00')) if row.get('failed_at') else None,
             ai_completion_comment=row.get('ai_completion_comment'),
+            ai_completion_comment_pending=row.get('ai_completion_comment_pending', False),
+            ai_estimate_minutes=row.get('ai_estimate_minutes'),
         )
 
     def get_profile(self) -> Profile:
         uid = self._ensure_user()
-        res = self.client.table('profiles').select('*').eq('user_id', uid).single().execute()
-        return self._row_to_profile(res.data)
+        if self._profile_row is None:
+            res = self._execute(self.client.table('profiles').select('*').eq('user_id', uid).single())
+            self._profile_row = res.data
+        return self._row_to_profile(self._profile_row)
 
     def set_profile(self, p: Profile) -> None:
         uid = self._ensure_user()
-        self.client.table('profiles').update({'points': p.points}).eq('user_id', uid).execute()
+        res = self._execute(self.client.table('profiles').update({'points': p.points}).eq('user_id', uid))
+        self._profile_row = res.data[0] if res.data else None
 
-    def add_task(self, task: Task) -> Task:
-        uid = self._ensure_user()
-        ins = self.client.table('tasks').insert({
+    @staticmethod
+    def _insert_row(uid: str, task: Task) -> dict:
+        return {
+            'id': task.id,
             'user_id': uid,
             'title': task.title,
             'status': task.status,
@@ -231,13 +855,27 @@ class SupabaseRepo(Repo):
             'created_at': task.created_at.isoformat(),
             'deadline_at': task.deadline_at.isoformat(),
             'extension_used': task.extension_used,
-        }).execute()
-        # Fetch the created task
-        created = self.client.table('tasks').select('*').eq('user_id', uid).order('created_at', desc=True).limit(1).execute()
-        return self._row_to_task(created.data[0])
+            'ai_estimate_minutes': task.ai_estimate_minutes,
+        }
+
+    def add_task(self, task: Task) -> Task:
+        uid = self._ensure_user()
+        # return=representation で書き込んだ行をそのまま受け取る（再SELECTしない）
+        ins = self._execute(self.client.table('tasks').insert(
+            self._insert_row(uid, task), returning=_return_representation()))
+        return self._row_to_task(ins.data[0])
+
+    def add_tasks(self, tasks: List[Task]) -> List[Task]:
+        if not tasks:
+            return []
+        uid = self._ensure_user()
+        # 複数行を1回の INSERT で書き込む
+        ins = self._execute(self.client.table('tasks').insert(
+            [self._insert_row(uid, t) for t in tasks], returning=_return_representation()))
+        return [self._row_to_task(r) for r in ins.data]
 
     def update_task(self, task: Task) -> Task:
-        upd = self.client.table('tasks').update({
+        upd = self._execute(self.client.table('tasks').update({
             'title': task.title,
             'status': task.status,
             'estimate_minutes': task.estimate_minutes,
@@ -248,68 +886,587 @@ class SupabaseRepo(Repo):
             'self_report': task.self_report,
             'failed_at': task.failed_at.isoformat() if task.failed_at else None,
             'ai_completion_comment': task.ai_completion_comment,
-        }).eq('id', task.id).execute()
-        # Fetch the updated task
-        updated = self.client.table('tasks').select('*').eq('id', task.id).single().execute()
-        return self._row_to_task(updated.data)
+            'ai_completion_comment_pending': task.ai_completion_comment_pending,
+        }, returning=_return_representation()).eq('id', task.id))
+        if not upd.data:
+            raise TaskNotFound(task.id)
+        return self._row_to_task(upd.data[0])
+
+    def settle_tasks(self, transitions: List[TaskTransition]) -> SettleResult:
+        # 状態遷移とポイント加減算を DB 関数 settle_tasks で1トランザクションにまとめる
+        # (supabase/migration_settle_tasks.sql)。ACTIVE のタスクだけが遷移し、その分だけ加減算される。
+        uid = self._ensure_user()
+        res = self._execute(self.client.rpc('settle_tasks', {
+            'p_user_id': uid,
+            'p_transitions': [tr.model_dump(mode='json') for tr in transitions],
+            'p_max_points': MAX_POINTS,
+        }))
+        data = res.data or {}
+        self._profile_row = {'user_id': uid, 'points': data.get('points', 10)}
+        tasks = [self._row_to_task(r) for r in (data.get('tasks') or [])]
+        if 'points_delta' in data:
+            points_delta = data['points_delta']
+        else:
+            # migration_settle_points_delta.sql 適用前の関数は丸めた後の増減を返さない
+            settled = {t.id for t in tasks}
+            points_delta = sum(tr.points_delta for tr in transitions if tr.task_id in settled)
+        return SettleResult(profile=self._row_to_profile(self._profile_row), tasks=tasks, points_delta=points_delta)
+
+    def set_completion_comment(self, task_id: str, comment: str) -> Optional[Task]:
+        uid = self._ensure_user()
+        res = self._execute(self.client.table('tasks').update({
+            'ai_completion_comment': comment,
+            'ai_completion_comment_pending': False,
+        }, returning=_return_representation()).eq('id', task_id).eq('user_id', uid))
+        return self._row_to_task(res.data[0]) if res.data else None
 
     def get_active_tasks(self) -> List[Task]:
         uid = self._ensure_user()
-        res = self.client.table('tasks').select('*').eq('user_id', uid).eq('status', TaskStatus.ACTIVE).execute()
+        res = self._execute(self.client.table('tasks').select('*').eq('user_id', uid).eq('status', TaskStatus.ACTIVE))
         return [self._row_to_task(r) for r in (res.data or [])]
 
     def recent(self) -> List[Task]:
         uid = self._ensure_user()
-        res = self.client.table('tasks').select('*').eq('user_id', uid).order('created_at', desc=True).limit(10).execute()
+        res = self._execute(self.client.table('tasks').select('*').eq('user_id', uid).order('created_at', desc=True).limit(10))
+        return [self._row_to_task(r) for r in (res.data or [])]
+
+    def finished_tasks(self, limit: int) -> List[Task]:
+        uid = self._ensure_user()
+        res = self._execute(
+            self.client.table('tasks').select('*').eq('user_id', uid)
+            .in_('status', [TaskStatus.COMPLETED, TaskStatus.FAILED])
+            .order('created_at', desc=True).limit(limit)
+        )
         return [self._row_to_task(r) for r in (res.data or [])]
 
     def any_failed(self) -> bool:
         uid = self._ensure_user()
-        res = self.client.table('tasks').select('id').eq('user_id', uid).eq('status', TaskStatus.FAILED).limit(1).execute()
+        res = self._execute(self.client.table('tasks').select('id').eq('user_id', uid).eq('status', TaskStatus.FAILED).limit(1))
         return bool(res.data)
 
     def clear_all(self) -> None:
         uid = self._ensure_user()
         # delete all tasks and reset profile to initial state
-        self.client.table('tasks').delete().eq('user_id', uid).execute()
+        self._execute(self.client.table('tasks').delete().eq('user_id', uid))
         # Reset points to default (10) as per requirement
-        self.client.table('profiles').update({'points': 10}).eq('user_id', uid).execute()
+        res = self._execute(self.client.table('profiles').update({'points': 10}).eq('user_id', uid))
+        self._profile_row = res.data[0] if res.data else None
+
+    def change_version(self) -> Optional[int]:
+        # profiles.change_version はトリガーで更新される (supabase/migration_change_version.sql)。
+        # 取得した行は get_profile でそのまま使うので、変更があった場合も追加の往復は発生しない
+        uid = self._ensure_user()
+        res = self._execute(self.client.table('profiles').select('*').eq('user_id', uid))
+        if not res.data:
+            return None
+        self._profile_row = res.data[0]
+        return self._profile_row.get('change_version')
+
+
+# ---- Local persistent store (SQLite, WAL) ----
+# user_id == "local" と Supabase 未設定時のフォールバックで使う。
+# プロセス内で1つの接続を共有し、ロックで直列化する（WAL なので別プロセスの読み取りは並行に進む）。
+LOCAL_SCHEMA = """
+create table if not exists profiles (
+  user_id text primary key,
+  points integer not null default 10,
+  created_at text not null,
+  change_version integer not null default 0
+);
+
+create table if not exists tasks (
+  id text primary key,
+  user_id text not null references profiles(user_id) on delete cascade,
+  title text not null,
+  status text not null check (status in ('PENDING','ACTIVE','COMPLETED','FAILED')),
+  estimate_minutes integer not null,
+  weight integer not null default 1,
+  created_at text not null,
+  deadline_at text not null,
+  extension_used integer not null default 0,
+  completed_at text,
+  self_report text,
+  failed_at text,
+  ai_completion_comment text,
+  ai_completion_comment_pending integer not null default 0,
+  ai_estimate_minutes integer
+);
+
+create index if not exists tasks_user_active_idx on tasks(user_id) where status = 'ACTIVE';
+create index if not exists tasks_user_created_idx on tasks(user_id, created_at desc);
+create index if not exists tasks_active_deadline_idx on tasks(deadline_at) where status = 'ACTIVE';
+
+-- 監査ログ。タスク削除（ゲームオーバー後のリセット）後も残すので tasks への外部キーは張らない
+create table if not exists task_logs (
+  id integer primary key autoincrement,
+  task_id text,
+  user_id text not null,
+  event_type text not null,
+  payload text,
+  created_at text not null
+);
+
+create index if not exists task_logs_user_created_idx on task_logs(user_id, created_at desc);
+"""
+
+# タスクの変更・ポイントの変更で profiles.change_version を進める（Supabase 側と同じトリガー）
+LOCAL_TRIGGERS = """
+create trigger if not exists tasks_bump_version_ins after insert on tasks begin
+  update profiles set change_version = change_version + 1 where user_id = new.user_id;
+end;
+create trigger if not exists tasks_bump_version_upd after update on tasks begin
+  update profiles set change_version = change_version + 1 where user_id = new.user_id;
+end;
+create trigger if not exists tasks_bump_version_del after delete on tasks begin
+  update profiles set change_version = change_version + 1 where user_id = old.user_id;
+end;
+create trigger if not exists profiles_bump_version after update of points on profiles
+when new.points is not old.points begin
+  update profiles set change_version = change_version + 1 where user_id = new.user_id;
+end;
+"""
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    # 文字列比較で時刻順に並ぶよう UTC・マイクロ秒まで固定長で保存する
+    if dt is None:
+        return None
+    return dt.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+class LocalDB:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("pragma journal_mode=wal")
+            self.conn.execute("pragma synchronous=normal")
+            self.conn.execute("pragma foreign_keys=on")
+            self.conn.executescript(LOCAL_SCHEMA)
+            columns = {r['name'] for r in self.conn.execute("pragma table_info(profiles)")}
+            if 'change_version' not in columns:
+                self.conn.execute("alter table profiles add column change_version integer not null default 0")
+            columns = {r['name'] for r in self.conn.execute("pragma table_info(tasks)")}
+            if 'ai_completion_comment_pending' not in columns:
+                self.conn.execute("alter table tasks add column ai_completion_comment_pending integer not null default 0")
+            if 'ai_estimate_minutes' not in columns:
+                self.conn.execute("alter table tasks add column ai_estimate_minutes integer")
+            self.conn.executescript(LOCAL_TRIGGERS)
+        # プロフィール行を作成済みの user_id（Supabase 側と同じく件数と TTL で上限を切る）
+        self._ensured = EnsuredUserCache(settings.ENSURED_USER_CACHE_SIZE, settings.ENSURED_USER_CACHE_TTL)
+
+    def ensure_user(self, user_id: str) -> None:
+        if user_id in self._ensured:
+            return
+        with self.lock:
+            self.conn.execute(
+                "insert or ignore into profiles (user_id, points, created_at) values (?, 10, ?)",
+                (user_id, _iso(datetime.now(timezone.utc))),
+            )
+            self._ensured.add(user_id)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_local_db: Optional[LocalDB] = None
+_local_db_lock = threading.Lock()
+
+
+def get_local_db() -> LocalDB:
+    global _local_db
+    if _local_db is None:
+        with _local_db_lock:
+            if _local_db is None:
+                _local_db = LocalDB(settings.LOCAL_DB_PATH)
+    return _local_db
+
+
+@instrument_repo
+class SqliteRepo(Repo):
+    def __init__(self, db: LocalDB, user_id: str):
+        self.db = db
+        self._user_id = user_id
+        db.ensure_user(user_id)
+
+    def _row_to_task(self, row) -> Task:
+        return Task(
+            id=row['id'],
+            title=row['title'],
+            status=row['status'],
+            estimate_minutes=row['estimate_minutes'],
+            created_at=datetime.fromisoformat(row['created_at']),
+            deadline_at=datetime.fromisoformat(row['deadline_at']),
+            extension_used=bool(row['extension_used']),
+            weight=row['weight'],
+            completed_at=datetime.fromisoformat(row['completed_at']) if row['completed_at'] else None,
+            self_report=row['self_report'],
+            failed_at=datetime.fromisoformat(row['failed_at']) if row['failed_at'] else None,
+            ai_completion_comment=row['ai_completion_comment'],
+            ai_completion_comment_pending=bool(row['ai_completion_comment_pending']),
+            ai_estimate_minutes=row['ai_estimate_minutes'],
+        )
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        count_db_round_trip()
+        with self.db.lock:
+            return self.db.conn.execute(sql, params).fetchall()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """中の文をまとめて確定する（例外なら rollback）。往復数は中の文の側で数える"""
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("begin immediate")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("rollback")
+                raise
+            conn.execute("commit")
+
+    def get_profile(self) -> Profile:
+        rows = self._query("select points from profiles where user_id = ?", (self._user_id,))
+        return Profile(user_id=self._user_id, points=rows[0]['points'] if rows else 10)
+
+    def set_profile(self, p: Profile) -> None:
+        self._query("update profiles set points = ? where user_id = ?", (p.points, self._user_id))
+
+    def add_task(self, task: Task) -> Task:
+        self._query(
+            """insert into tasks (id, user_id, title, status, estimate_minutes, weight, created_at,
+                                  deadline_at, extension_used, ai_completion_comment, ai_estimate_minutes)
+               values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (task.id, self._user_id, task.title, task.status, task.estimate_minutes, task.weight,
+             _iso(task.created_at), _iso(task.deadline_at), int(task.extension_used), task.ai_completion_comment,
+             task.ai_estimate_minutes),
+        )
+        return task
+
+    def add_tasks(self, tasks: List[Task]) -> List[Task]:
+        if not tasks:
+            return []
+        # 複数行を1文で挿入する（1文なので途中で失敗しても部分的には残らない）
+        params: list = []
+        for task in tasks:
+            params += [task.id, self._user_id, task.title, task.status, task.estimate_minutes, task.weight,
+                       _iso(task.created_at), _iso(task.deadline_at), int(task.extension_used),
+                       task.ai_completion_comment, task.ai_estimate_minutes]
+        self._query(
+            """insert into tasks (id, user_id, title, status, estimate_minutes, weight, created_at,
+                                  deadline_at, extension_used, ai_completion_comment, ai_estimate_minutes)
+               values """ + ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"] * len(tasks)),
+            tuple(params),
+        )
+        return tasks
+
+    def update_task(self, task: Task) -> Task:
+        rows = self._query(
+            """update tasks set title = ?, status = ?, estimate_minutes = ?, weight = ?, deadline_at = ?,
+                                extension_used = ?, completed_at = ?, self_report = ?, failed_at = ?,
+                                ai_completion_comment = ?, ai_completion_comment_pending = ?
+               where id = ? and user_id = ? returning *""",
+            (task.title, task.status, task.estimate_minutes, task.weight, _iso(task.deadline_at),
+             int(task.extension_used), _iso(task.completed_at), task.self_report, _iso(task.failed_at),
+             task.ai_completion_comment, int(task.ai_completion_comment_pending), task.id, self._user_id),
+        )
+        if not rows:
+            raise TaskNotFound(task.id)
+        return self._row_to_task(rows[0])
+
+    def settle_tasks(self, transitions: List[TaskTransition]) -> SettleResult:
+        settled = []
+        count_db_round_trip()
+        with self._transaction() as conn:
+            row = conn.execute("select points from profiles where user_id = ?", (self._user_id,)).fetchone()
+            if row is None:
+                # 作成済みと覚えている間にプロフィール行が消えた: ensure_user と同じ初期値で作り直す
+                # （タスクは on delete cascade で一緒に消えているので、遷移するものはない）
+                conn.execute("insert into profiles (user_id, points, created_at) values (?, 10, ?)",
+                             (self._user_id, _iso(datetime.now(timezone.utc))))
+            points = before = row['points'] if row is not None else 10
+            for tr in transitions:
+                rows = conn.execute(
+                    """update tasks set status = ?,
+                                        completed_at = coalesce(?, completed_at),
+                                        failed_at = coalesce(?, failed_at),
+                                        self_report = coalesce(?, self_report),
+                                        ai_completion_comment = case when ? then null else ai_completion_comment end,
+                                        ai_completion_comment_pending = max(ai_completion_comment_pending, ?)
+                       where id = ? and user_id = ? and status = 'ACTIVE' returning *""",
+                    (tr.status, _iso(tr.completed_at), _iso(tr.failed_at), tr.self_report,
+                     int(tr.comment_pending), int(tr.comment_pending), tr.task_id, self._user_id),
+                ).fetchall()
+                if rows:
+                    points = min(MAX_POINTS, max(0, points + tr.points_delta))
+                    settled.append(self._row_to_task(rows[0]))
+            conn.execute("update profiles set points = ? where user_id = ?", (points, self._user_id))
+        return SettleResult(profile=Profile(user_id=self._user_id, points=points), tasks=settled,
+                            points_delta=points - before)
+
+    def set_completion_comment(self, task_id: str, comment: str) -> Optional[Task]:
+        rows = self._query(
+            """update tasks set ai_completion_comment = ?, ai_completion_comment_pending = 0
+               where id = ? and user_id = ? returning *""",
+            (comment, task_id, self._user_id),
+        )
+        return self._row_to_task(rows[0]) if rows else None
+
+    def get_active_tasks(self) -> List[Task]:
+        rows = self._query("select * from tasks where user_id = ? and status = 'ACTIVE'", (self._user_id,))
+        return [self._row_to_task(r) for r in rows]
+
+    def recent(self) -> List[Task]:
+        rows = self._query(
+            "select * from tasks where user_id = ? order by created_at desc limit 10", (self._user_id,)
+        )
+        return [self._row_to_task(r) for r in rows]
+
+    def finished_tasks(self, limit: int) -> List[Task]:
+        rows = self._query(
+            """select * from tasks where user_id = ? and status in ('COMPLETED', 'FAILED')
+               order by created_at desc limit ?""",
+            (self._user_id, limit),
+        )
+        return [self._row_to_task(r) for r in rows]
+
+    def any_failed(self) -> bool:
+        rows = self._query(
+            "select 1 from tasks where user_id = ? and status = 'FAILED' limit 1", (self._user_id,)
+        )
+        return bool(rows)
+
+    def clear_all(self) -> None:
+        # 途中で失敗してもタスクだけ消えて点数が残る、ということがないよう1トランザクションで行う
+        with self._transaction():
+            self._query("delete from tasks where user_id = ?", (self._user_id,))
+            # Reset points to default (10) as per requirement
+            self._query("update profiles set points = 10 where user_id = ?", (self._user_id,))
+
+    def change_version(self) -> Optional[int]:
+        rows = self._query("select change_version from profiles where user_id = ?", (self._user_id,))
+        return rows[0]['change_version'] if rows else None
 
 
 # Repo selector
 # Singleton Supabase client
 _supabase_client = None
+_supabase_warned = False
 
 def get_supabase_client():
-    global _supabase_client
+    global _supabase_client, _supabase_warned
     if _supabase_client is None:
-        if not settings.SUPABASE_URL:
-             print("[get_supabase_client] SUPABASE_URL is not set", flush=True)
-        if not settings.SUPABASE_SERVICE_KEY:
-             print("[get_supabase_client] SUPABASE_SERVICE_KEY is not set", flush=True)
-        if create_client is None:
-             print("[get_supabase_client] supabase package not installed or import failed", flush=True)
-
-        if settings.SUPABASE_URL and settings.SUPABASE_SERVICE_KEY and create_client is not None:
+        if not _supabase_warned:
+            # 未設定は毎リクエストで分かるので、警告は最初の1回だけ
+            _supabase_warned = True
+            if not settings.SUPABASE_URL:
+                log_event(logging.WARNING, "SUPABASE_URL is not set")
+            if not settings.SUPABASE_SERVICE_KEY:
+                log_event(logging.WARNING, "SUPABASE_SERVICE_KEY is not set")
+            if not SUPABASE_AVAILABLE:
+                log_event(logging.WARNING, "supabase package not installed")
+
+        if settings.SUPABASE_URL and settings.SUPABASE_SERVICE_KEY and SUPABASE_AVAILABLE:
             try:
-                _supabase_client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+                supabase = _lazy_import("supabase")
+                if supabase is None:
+                    raise ImportError("supabase import failed")
+                _supabase_client = supabase.create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
             except Exception as e:
-                print(f"Error creating Supabase client: {e}", flush=True)
+                log_event(logging.ERROR, "supabase client creation failed", error=repr(e))
     return _supabase_client
 
 def get_repo(user_id: str = "local") -> Repo:
-    print(f"[get_repo] user_id: {user_id}", flush=True)
     if user_id == "local":
-        print("[get_repo] Using MemoryRepo (LOCAL MODE)", flush=True)
-        return MemoryRepo()
+        log_event(logging.DEBUG, "repo selected", sampled=True, user_id=user_id, backend="sqlite", mode="local")
+        return SqliteRepo(get_local_db(), user_id)
         
     client = get_supabase_client()
     if client:
-        print(f"[get_repo] Using SupabaseRepo for user: {user_id}", flush=True)
+        log_event(logging.DEBUG, "repo selected", sampled=True, user_id=user_id, backend="supabase")
         return SupabaseRepo(client, user_id)
     
-    print("[get_repo] Supabase client not available, falling back to MemoryRepo", flush=True)
-    return MemoryRepo()
+    log_event(logging.DEBUG, "repo selected", sampled=True, user_id=user_id, backend="sqlite", mode="fallback")
+    return SqliteRepo(get_local_db(), user_id)
+
+
+
+# ---- Async data access ----
+# 読み取り API は AsyncRepo 経由で DB を待つ。同期 Repo はプロセス共有の有界スレッドプールで動かし
+# （リクエストごとにスレッドプールを作らない）、Supabase の読み取りは接続プール付きの
+# httpx.AsyncClient で PostgREST を直接叩く。どちらも同時実行数は DB_MAX_CONCURRENCY まで。
+_db_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_postgrest_http = None
+
+
+def get_db_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.DB_MAX_CONCURRENCY, thread_name_prefix="repo"
+        )
+    return _db_executor
+
+
+async def run_repo(fn: Callable, *args):
+    """同期 Repo の呼び出しを共有スレッドプールで実行する（計測用のコンテキストも引き継ぐ）"""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(get_db_executor(), functools.partial(ctx.run, fn, *args))
+
+
+def get_postgrest_http():
+    global _postgrest_http
+    if _postgrest_http is None:
+        httpx = _lazy_import("httpx")
+        key = settings.SUPABASE_SERVICE_KEY
+        _postgrest_http = httpx.AsyncClient(
+            base_url=f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}", "Accept": "application/json"},
+            http2=settings.DB_HTTP2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=settings.DB_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.DB_MAX_CONCURRENCY,
+            ),
+            timeout=settings.DB_TIMEOUT,
+        )
+    return _postgrest_http
+
+
+@dataclass(slots=True)
+class StatusSnapshot:
+    """GET /status に必要な読み取り結果一式（not_modified なら version 以外は空）"""
+    version: Optional[int]
+    profile: Optional[Profile] = None
+    active_tasks: Optional[List[Task]] = None
+    recent_tasks: Optional[List[Task]] = None
+    next_threshold: int = 10
+    not_modified: bool = False
+
+
+# user_status が返す行の配列を pydantic-core で一度に検証・変換する（行ごとの Task(...) 呼び出しより速い）
+_TASK_ROWS = TypeAdapter(List[Task])
+
+
+def tasks_from_rows(rows: list) -> List[Task]:
+    return _TASK_ROWS.validate_python(rows)
+
+
+class AsyncRepo:
+    """読み取り系 Repo メソッドの非同期版。既定の実装は同期 Repo を共有スレッドプールで呼ぶ"""
+
+    def __init__(self, repo: Repo):
+        self.repo = repo
+
+    async def change_version(self) -> Optional[int]:
+        return await run_repo(self.repo.change_version)
+
+    async def get_profile(self) -> Profile:
+        return await run_repo(self.repo.get_profile)
+
+    async def get_active_tasks(self) -> List[Task]:
+        return await run_repo(self.repo.get_active_tasks)
+
+    async def recent(self) -> List[Task]:
+        return await run_repo(self.repo.recent)
+
+    async def status_snapshot(self, if_version: Optional[int] = None) -> StatusSnapshot:
+        version = await self.change_version()
+        if version is not None and version == if_version:
+            return StatusSnapshot(version, not_modified=True)
+        active_tasks, profile, recent = await asyncio.gather(self.get_active_tasks(), self.get_profile(), self.recent())
+        return StatusSnapshot(version, profile, active_tasks, recent, rank_info(profile.points).next_threshold)
+
+
+@instrument_repo
+class AsyncSupabaseRepo(AsyncRepo):
+    """PostgREST を httpx.AsyncClient (HTTP/2, 接続プール共有) で直接読む。行の変換と
+    プロフィール行のキャッシュは同期の SupabaseRepo と共有する"""
+
+    def __init__(self, repo: SupabaseRepo, http):
+        super().__init__(repo)
+        self.http = http
+        self._ensuring: Optional[asyncio.Future] = None
+
+    async def _ensure_user(self) -> str:
+        repo = self.repo
+        if repo._profile_row is None and repo._user_id not in _ensured_users:
+            # 初回だけ同期側でプロフィールを確認・作成する（同時に呼ばれても1回にまとめる）
+            if self._ensuring is None:
+                self._ensuring = asyncio.ensure_future(run_repo(repo._ensure_user))
+            await self._ensuring
+        return repo._user_id
+
+    async def _select(self, table: str, params: dict) -> list:
+        self.repo.round_trips += 1
+        count_db_round_trip()
+        res = await self.http.get(f"/{table}", params=params)
+        res.raise_for_status()
+        return res.json()
+
+    async def change_version(self) -> Optional[int]:
+        uid = await self._ensure_user()
+        rows = await self._select('profiles', {'select': '*', 'user_id': f'eq.{uid}'})
+        if not rows:
+            return None
+        self.repo._profile_row = rows[0]
+        return rows[0].get('change_version')
+
+    async def get_profile(self) -> Profile:
+        uid = await self._ensure_user()
+        if self.repo._profile_row is None:
+            rows = await self._select('profiles', {'select': '*', 'user_id': f'eq.{uid}'})
+            if not rows:
+                raise HTTPException(404, 'プロフィールが見つかりません')
+            self.repo._profile_row = rows[0]
+        return self.repo._row_to_profile(self.repo._profile_row)
+
+    async def get_active_tasks(self) -> List[Task]:
+        uid = await self._ensure_user()
+        rows = await self._select('tasks', {'select': '*', 'user_id': f'eq.{uid}', 'status': f'eq.{TaskStatus.ACTIVE}'})
+        return [self.repo._row_to_task(r) for r in rows]
+
+    async def recent(self) -> List[Task]:
+        uid = await self._ensure_user()
+        rows = await self._select(
+            'tasks', {'select': '*', 'user_id': f'eq.{uid}', 'order': 'created_at.desc', 'limit': '10'}
+        )
+        return [self.repo._row_to_task(r) for r in rows]
+
+    async def status_snapshot(self, if_version: Optional[int] = None) -> StatusSnapshot:
+        # DB 関数 user_status (supabase/migration_user_status.sql) で1往復。プロフィールの作成もそこで行う
+        repo = self.repo
+        repo.round_trips += 1
+        count_db_round_trip()
+        res = await self.http.post('/rpc/user_status', json={
+            'p_user_id': repo._user_id,
+            'p_thresholds': sorted(RANK_THRESHOLDS.values()),
+            'p_recent_limit': 10,
+            'p_if_version': if_version,
+        })
+        res.raise_for_status()
+        data = res.json()
+        _ensured_users.add(repo._user_id)
+        repo._profile_row = data['profile']
+        version = data['profile'].get('change_version')
+        if data.get('not_modified'):
+            return StatusSnapshot(version, not_modified=True)
+        return StatusSnapshot(
+            version,
+            repo._row_to_profile(data['profile']),
+            tasks_from_rows(data['active_tasks']),
+            tasks_from_rows(data['recent_tasks']),
+            data['next_threshold'],
+        )
+
+
+def get_async_repo(user_id: str = "local") -> AsyncRepo:
+    repo = get_repo(user_id)
+    if isinstance(repo, SupabaseRepo) and HTTPX_AVAILABLE:
+        return AsyncSupabaseRepo(repo, get_postgrest_http())
+    return AsyncRepo(repo)
 
 
 
@@ -362,171 +1519,2149 @@ def classify_weight(text: str) -> int:
     return 5
 
 
-def propose_estimate_and_deadline(text: str, rank: int = 1) -> TaskProposal:
-    """
-    AIを使ってタスクの見積もりを行う
-    意味不明な入力は拒否する
-    """
-    if not settings.OPENAI_API_KEY or OpenAI is None:
-        # APIキーがない場合は従来のロジック（最低6時間）
-        weight = classify_weight(text)
-        estimate = max(360, weight * 100)  # 最低6時間
-        buffer_minutes = 360 # 6時間バッファ
-        now = datetime.now(timezone.utc)
-        deadline = now + timedelta(minutes=estimate + buffer_minutes)
-        return TaskProposal(title=text.strip(), estimate_minutes=estimate, deadline_at=deadline, weight=weight, buffer_minutes=buffer_minutes)
-    
+# ---- LLM layer (asyncio) ----
+# ハンドラは async def なので、同期クライアントで待つとイベントループ全体が止まる。
+# AsyncOpenAI を await してリクエスト同士を並行に進める。
+def llm_enabled() -> bool:
+    return bool(settings.OPENAI_API_KEY) and OPENAI_AVAILABLE and HTTPX_AVAILABLE
+
+
+# Singleton LLM client (接続プールをプロセス全体で共有し、TLSハンドシェイクを使い回す)
+_llm_client = None
+_llm_http = None  # _llm_client が使う httpx.AsyncClient（ウォームアップで接続を先に張る）
+
+# 接続プールの再利用状況: requests のうち new_connections 以外はプールヒット
+_llm_pool_stats = {"requests": 0, "new_connections": 0}
+
+
+def llm_pool_stats() -> dict:
+    requests = _llm_pool_stats["requests"]
+    misses = _llm_pool_stats["new_connections"]
+    return {"requests": requests, "hits": max(0, requests - misses), "misses": misses}
+
+
+async def _llm_trace(event_name: str, info: dict) -> None:
+    if event_name == "connection.connect_tcp.started":
+        _llm_pool_stats["new_connections"] += 1
+
+
+async def _llm_on_request(request) -> None:
+    _llm_pool_stats["requests"] += 1
+    request.extensions["trace"] = _llm_trace
+
+
+def get_llm_client():
+    global _llm_client, _llm_http
+    if _llm_client is None:
+        httpx = _lazy_import("httpx")
+        _llm_http = http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.LLM_PROPOSE_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+            event_hooks={"request": [_llm_on_request]},
+        )
+        _llm_client = _lazy_import("openai").AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+        )
+    return _llm_client
+
+
+# 完了コメントの待ち行列を止めてから閉じる（登録は CompletionCommentQueue の停止フックの後）
+async def _close_llm_client() -> None:
+    global _llm_client, _llm_http
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
+        _llm_http = None
+
+
+# ---- LLM admission control ----
+# モデルが遅くなったときに propose / complete が後ろに積み上がらないよう、全 LLM 呼び出しを
+# 同時実行数つきの待ち行列に通す。入口 (check) では予測待ち時間・ユーザーごとのバケット・
+# ブレーカーを見て、呼べないなら LLMOverloaded を投げる。呼び出し側はヒューリスティックな
+# 見積もりか定型文で即答する。
+class LLMOverloaded(Exception):
+    """LLM を呼ばずに代替の応答を返すべきとき。reason は queue / user_rate / breaker"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _is_llm_timeout(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    # httpx / openai の例外はそれらを読み込んだ後にしか起きないので、ここでの import はキャッシュ済み
+    httpx = _lazy_import("httpx") if HTTPX_AVAILABLE else None
+    openai = _lazy_import("openai") if OPENAI_AVAILABLE else None
+    return (httpx is not None and isinstance(exc, httpx.TimeoutException)) or (
+        openai is not None and isinstance(exc, openai.APITimeoutError)
+    )
+
+
+class LLMAdmission:
+    """LLM 呼び出しの同時実行数制限・待ち時間予測による負荷制限・ユーザー別レート制限・ブレーカー"""
+
+    SHED_REASONS = ("queue", "user_rate", "breaker")
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        queue_budget: float = 2.0,
+        user_rate: float = 0.0,
+        user_burst: int = 10,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+        max_users: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_budget = queue_budget
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_users = max_users
+        self.clock = clock
+        self.in_flight = 0
+        self.waiting = 0
+        # 1回の呼び出しにかかる時間の指数移動平均。計測前は 1 秒とみなす
+        self.avg_latency = 1.0
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._timeouts = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.stats = {"shed_queue": 0, "shed_user_rate": 0, "shed_breaker": 0, "breaker_trips": 0}
+
+    @property
+    def breaker_state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at >= self.breaker_cooldown:
+            return "half_open"
+        return "open"
+
+    def predicted_wait(self) -> float:
+        """いま並んだ場合に空きが出るまでの待ち時間の見込み（秒）"""
+        if self.in_flight + self.waiting < self.max_concurrency:
+            return 0.0
+        ahead = self.in_flight + self.waiting - self.max_concurrency + 1
+        return ahead * self.avg_latency / self.max_concurrency
+
+    def check(self, user_id: Optional[str] = None, budget: Optional[float] = None) -> None:
+        """入口での判定。呼べないなら LLMOverloaded を投げる（user_id を渡すとバケットを1つ使う）"""
+        if self.breaker_state == "open" or (self.breaker_state == "half_open" and self._probing):
+            self._shed("breaker")
+        if budget is not None and self.predicted_wait() > budget:
+            self._shed("queue")
+        if user_id is not None and self.user_rate > 0 and not self._take_token(user_id):
+            self._shed("user_rate")
+
+    def _shed(self, reason: str) -> None:
+        self.stats[f"shed_{reason}"] += 1
+        raise LLMOverloaded(reason)
+
+    def _take_token(self, user_id: str) -> bool:
+        now = self.clock()
+        tokens, updated = self._buckets.pop(user_id, (float(self.user_burst), now))
+        tokens = min(float(self.user_burst), tokens + (now - updated) * self.user_rate)
+        ok = tokens >= 1.0
+        self._buckets[user_id] = (tokens - 1.0 if ok else tokens, now)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return ok
+
+    def slot(self) -> "_LLMSlot":
+        """async with で LLM 呼び出しを囲む。空きを待ち、所要時間と結果をブレーカーに反映する"""
+        return _LLMSlot(self)
+
+    async def _enter(self) -> bool:
+        state = self.breaker_state
+        if state == "open" or (state == "half_open" and self._probing):
+            self._shed("breaker")
+        probe = state == "half_open"
+        if probe:
+            # 半開: 1件だけ通して様子を見る
+            self._probing = True
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        except BaseException:
+            self._probing = self._probing and not probe
+            raise
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return probe
+
+    def _exit(self, probe: bool, elapsed: float, exc: Optional[BaseException]) -> None:
+        self.in_flight -= 1
+        self._sem.release()
+        if probe:
+            self._probing = False
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            return
+        self.avg_latency += 0.2 * (elapsed - self.avg_latency)
+        if exc is None:
+            self._timeouts = 0
+            if probe:
+                self._opened_at = None
+                log_event(logging.WARNING, "llm circuit breaker closed")
+        elif probe or _is_llm_timeout(exc):
+            self._timeouts += 1
+            if probe or self._timeouts >= self.breaker_threshold:
+                self._trip()
+
+    def _trip(self) -> None:
+        if self.breaker_state != "open":
+            self.stats["breaker_trips"] += 1
+            log_event(logging.WARNING, "llm circuit breaker opened", consecutive_timeouts=self._timeouts,
+                      cooldown=self.breaker_cooldown)
+        self._opened_at = self.clock()
+
+
+class _LLMSlot:
+    def __init__(self, admission: LLMAdmission):
+        self.admission = admission
+        self.probe = False
+        self.started = 0.0
+
+    async def __aenter__(self) -> None:
+        self.probe = await self.admission._enter()
+        self.started = time.perf_counter()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        self.admission._exit(self.probe, time.perf_counter() - self.started, exc)
+        return False
+
+
+llm_admission = LLMAdmission(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    queue_budget=settings.LLM_QUEUE_BUDGET,
+    user_rate=settings.LLM_USER_RATE,
+    user_burst=settings.LLM_USER_BURST,
+    breaker_threshold=settings.LLM_BREAKER_THRESHOLD,
+    breaker_cooldown=settings.LLM_BREAKER_COOLDOWN,
+)
+
+
+async def llm_chat(
+    messages: List[dict], json_mode: bool = False, timeout: Optional[float] = None, purpose: str = "chat"
+) -> str:
+    """チャット補完を1回呼び出し、本文を返す（purpose ごとに所要時間を記録）"""
+    client = get_llm_client()
+    async with llm_admission.slot():
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=messages,
+                **_llm_kwargs(json_mode, timeout),
+            )
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            llm_call_seconds.observe(time.perf_counter() - started, purpose, outcome)
+    return response.choices[0].message.content
+
+
+async def llm_chat_stream(
+    messages: List[dict], json_mode: bool = False, timeout: Optional[float] = None, purpose: str = "chat"
+) -> AsyncIterator[str]:
+    """llm_chat のストリーム版。本文の増分を届いた順に返す（timeout は1チャンクごとの待ち時間）"""
+    client = get_llm_client()
+    async with llm_admission.slot():
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            stream = await client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=messages,
+                stream=True,
+                **_llm_kwargs(json_mode, timeout),
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            # クライアントが途中で切断した
+            outcome = "cancelled"
+            raise
+        finally:
+            llm_call_seconds.observe(time.perf_counter() - started, purpose, outcome)
+
+
+def _llm_kwargs(json_mode: bool, timeout: Optional[float]) -> dict:
+    kwargs = {}
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+    if timeout is not None:
+        kwargs["timeout"] = _lazy_import("httpx").Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT)
+    return kwargs
+
+
+def _fallback_proposal(text: str) -> TaskProposal:
+    weight = 3
+    estimate = 60
+    buffer_minutes = 360
+    deadline = datetime.now(timezone.utc) + timedelta(minutes=estimate + buffer_minutes)
+    return TaskProposal(
+        title=text.strip(), 
+        estimate_minutes=estimate, 
+        deadline_at=deadline, 
+        weight=weight, 
+        ai_comment="...",
+        buffer_minutes=buffer_minutes
+    )
+
+
+# ---- Proposal cache ----
+# 同じようなタスク（「洗濯」「メール返信」など）は何度も入力されるので、
+# 正規化したテキスト + ランク（ペルソナ）ごとにモデルの判定結果をキャッシュする。
+# 期限は時刻依存なのでキャッシュせず、proposal_from_estimate で毎回計算する。
+_CACHED_FIELDS = ("valid", "reason", "estimate_hours", "comment")
+
+
+def normalize_task_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = " ".join(text.split())
+    return text.strip(" 。、.,!！?？・")
+
+
+class ProposalCache:
+    """TTL + LRU のメモリキャッシュ。path を指定すると SQLite にも保存し再起動後も使う
+
+    SQLite の期限切れ行は、書き込みのついでに purge_interval 秒ごとにまとめて消す。
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, negative_ttl: float, path: Optional[str] = None, purge_interval: float = 600.0
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._disk = None
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("pragma journal_mode=wal")
+            self._disk.execute(
+                "create table if not exists proposal_cache (key text primary key, expires_at real not null, value text not null)"
+            )
+
+    def key(self, text: str, rank: int) -> str:
+        persona = AI_PERSONAS.get(rank, AI_PERSONAS[1])["name"]
+        return f"{rank}:{persona}:{normalize_task_text(text)}"
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._disk is not None:
+                row = self._disk.execute(
+                    "select expires_at, value from proposal_cache where key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    if entry[0] >= now:
+                        self._entries[key] = entry
+                        self._evict()
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry[1].get("valid", False):
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return entry[1]
+
+    def put(self, key: str, result: dict) -> None:
+        value = {k: result[k] for k in _CACHED_FIELDS if k in result}
+        # モデルが拒否した入力も短めの TTL でキャッシュする（同じゴミ入力の連打対策）
+        ttl = self.ttl if value.get("valid", False) else self.negative_ttl
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            self._evict()
+            if self._disk is not None:
+                self._disk.execute(
+                    "insert or replace into proposal_cache (key, expires_at, value) values (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, ensure_ascii=False)),
+                )
+                self._purge_disk(now)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _purge_disk(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        self._disk.execute("delete from proposal_cache where expires_at < ?", (now,))
+        self._next_purge = now + self.purge_interval
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+
+proposal_cache = ProposalCache(
+    settings.PROPOSAL_CACHE_SIZE,
+    settings.PROPOSAL_CACHE_TTL,
+    settings.PROPOSAL_CACHE_NEGATIVE_TTL,
+    settings.PROPOSAL_CACHE_PATH,
+)
+
+
+# ---- Estimate calibration ----
+# モデルの見積もり (estimate_hours) はユーザーごとの癖を知らない。完了・失敗したタスクの履歴から
+# ユーザーごとに「実績時間 / 見積もり」の比と見積もり帯ごとの失敗率を持ち、見積もりを補正する。
+# - 統計は見積もり帯ごと・正規化した文面ごとの累積（件数・和・二乗和）。初回読み込みとバックフィルは
+#   NumPy で全行をまとめて集計し、以後は精算のたびに足し込むだけ
+# - 帯ごとの log 比の平均は、件数が少ないうちは他の帯の平均（さらに「補正なし」）へ寄せる。
+#   完了数が CALIBRATION_MIN_SAMPLES に届くまでは補正しない
+# - 同じ文面のタスクを何度も安定した時間で終えていれば、LLM を呼ばずにその実績から提案を作る
+# 保存される estimate_minutes は補正後の値なので、提案時のモデルの元の見積もりを覚えておき、受理で
+# tasks.ai_estimate_minutes に保存する。精算時も DB からの読み直しでも、実績はこの値と比べる。
+_CALIBRATION_EDGES = (60, 120, 240, 480, 960)  # 見積もり帯の境界（分）: 1h 未満, 1〜2h, 2〜4h, 4〜8h, 8〜16h, 16h 以上
+_CALIBRATION_BUCKETS = len(_CALIBRATION_EDGES) + 1
+_CALIBRATION_RATIO_CLIP = (0.25, 4.0)  # 1件あたりの 実績/見積もり（押し忘れ・即完了の外れ値を抑える）
+_CALIBRATION_REMEMBER = 64  # ユーザーごとに覚えておく、受理前の提案の補正前の見積もりの件数
+CALIBRATED_PROPOSAL_COMMENT = "過去の実績から期限を設定しました。"
+
+
+def _calibration_bucket(estimate_minutes: float) -> int:
+    return bisect.bisect_right(_CALIBRATION_EDGES, estimate_minutes)
+
+
+@dataclass(slots=True)
+class TextHistory:
+    """同じ文面（normalize_task_text）のタスクの実績"""
+    title: str  # いちばん新しいタスクの表記
+    done: int = 0
+    failed: int = 0
+    log_sum: float = 0.0  # log(実績分) の和
+    log_sq: float = 0.0  # log(実績分) の二乗和
+
+    def minutes(self) -> float:
+        """実績時間の幾何平均（分）"""
+        return math.exp(self.log_sum / self.done)
+
+    def spread(self) -> float:
+        """log(実績分) の標準偏差（小さければ実績の変動係数とほぼ同じ）"""
+        mean = self.log_sum / self.done
+        return math.sqrt(max(0.0, self.log_sq / self.done - mean * mean))
+
+    def failure_rate(self) -> float:
+        return self.failed / (self.done + self.failed)
+
+
+class UserCalibration:
+    """1ユーザー分の補正統計。見積もり帯ごとの配列と、文面ごとの TextHistory を持つ"""
+
+    def __init__(self, done, log_ratio, failed, texts: dict):
+        self.done = done  # 見積もり帯ごとの完了数 (ndarray)
+        self.log_ratio = log_ratio  # 見積もり帯ごとの log(実績/見積もり) の和
+        self.failed = failed  # 見積もり帯ごとの失敗数
+        self.texts: dict[str, TextHistory] = texts
+        self.total_done = float(done.sum())
+        self.total_log_ratio = float(log_ratio.sum())
+        # 返した提案の、モデルの元の見積もり（分）。正規化した文面 -> 見積もりで、受理時にタスクの
+        # ai_estimate_minutes へ移す（精算時はタスクの行から読むので再読み込み・再起動をまたいでも同じ）
+        self.offered: "OrderedDict[str, int]" = OrderedDict()
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def empty(cls) -> "UserCalibration":
+        np = _lazy_import("numpy")
+        return cls(np.zeros(_CALIBRATION_BUCKETS), np.zeros(_CALIBRATION_BUCKETS), np.zeros(_CALIBRATION_BUCKETS), {})
+
+    def correction(self, estimate_minutes: float) -> Tuple[float, float]:
+        """(見積もりに掛ける倍率, その見積もり帯の失敗率)"""
+        prior = settings.CALIBRATION_PRIOR
+        min_samples = settings.CALIBRATION_MIN_SAMPLES
+        b = _calibration_bucket(estimate_minutes)
+        done = float(self.done[b])
+        failed = float(self.failed[b])
+        failure_rate = failed / (done + failed + prior) if done + failed >= min_samples else 0.0
+        if self.total_done < min_samples:
+            return 1.0, failure_rate
+        # 事前分布はこの帯を除いた平均（帯自身の件数を二重に数えない）
+        others = (self.total_log_ratio - float(self.log_ratio[b])) / (self.total_done - done + prior)
+        mean = (float(self.log_ratio[b]) + prior * others) / (done + prior)
+        ratio = min(settings.CALIBRATION_MAX_RATIO, max(settings.CALIBRATION_MIN_RATIO, math.exp(mean)))
+        return ratio, failure_rate
+
+    def match(self, text: str) -> Optional[TextHistory]:
+        """同じ文面を十分な回数、安定した時間で終えていればその実績を返す"""
+        history = self.texts.get(normalize_task_text(text))
+        if history is None or history.done < settings.CALIBRATION_MATCH_MIN_COUNT:
+            return None
+        if history.spread() > settings.CALIBRATION_MATCH_MAX_SPREAD:
+            return None
+        if history.failure_rate() > settings.CALIBRATION_MATCH_MAX_FAILURE:
+            return None
+        return history
+
+    def offer(self, text: str, estimate_minutes: Optional[int]) -> None:
+        """estimate_minutes は補正前のモデルの見積もり。実績から作った提案は None"""
+        key = normalize_task_text(text)
+        self.offered[key] = estimate_minutes or 0
+        self.offered.move_to_end(key)
+        while len(self.offered) > _CALIBRATION_REMEMBER:
+            self.offered.popitem(last=False)
+
+    def accept(self, task: Task) -> None:
+        """受理するタスクに、同じ文面で返した提案の元の見積もりを入れる（保存前に呼ぶ）"""
+        estimate = self.offered.pop(normalize_task_text(task.title), None)
+        if estimate is not None:
+            task.ai_estimate_minutes = estimate
+
+    def observe(self, task: Task) -> None:
+        """精算したタスク1件を統計に足す"""
+        key = normalize_task_text(task.title)
+        estimate = _calibration_baseline(task.estimate_minutes, task.ai_estimate_minutes)
+        history = self.texts.get(key)
+        if history is None:
+            history = self.texts[key] = TextHistory(task.title)
+        history.title = task.title
+        b = _calibration_bucket(estimate) if estimate is not None else None
+        if task.status == TaskStatus.COMPLETED and task.completed_at is not None:
+            actual = max(1.0, (task.completed_at - task.created_at).total_seconds() / 60)
+            log_actual = math.log(actual)
+            history.done += 1
+            history.log_sum += log_actual
+            history.log_sq += log_actual * log_actual
+            if b is not None:
+                low, high = _CALIBRATION_RATIO_CLIP
+                log_ratio = math.log(min(high, max(low, actual / estimate)))
+                self.done[b] += 1
+                self.log_ratio[b] += log_ratio
+                self.total_done += 1
+                self.total_log_ratio += log_ratio
+        elif task.status == TaskStatus.FAILED:
+            history.failed += 1
+            if b is not None:
+                self.failed[b] += 1
+
+    def summary(self) -> dict:
+        return {
+            "done": int(self.total_done),
+            "failed": int(self.failed.sum()),
+            "ratio": [round(self.correction(edge - 1)[0], 3) for edge in _CALIBRATION_EDGES + (24 * 60,)],
+            "failure_rate": [round(self.correction(edge - 1)[1], 3) for edge in _CALIBRATION_EDGES + (24 * 60,)],
+            "matchable_texts": sum(1 for key in self.texts if self.match(key) is not None),
+        }
+
+
+def _calibration_baseline(estimate_minutes: int, ai_estimate_minutes: Optional[int]) -> Optional[int]:
+    """実績と比べる見積もり: 補正前のモデルの見積もり。実績から作った提案 (0) は見積もり帯に入れないので None。
+    記録のない行（補正導入前など）は保存された見積もりをそのまま使う"""
+    if ai_estimate_minutes is None:
+        return estimate_minutes
+    return ai_estimate_minutes or None
+
+
+def build_calibrations(rows: Iterable[Tuple[str, str, Optional[int], Optional[float], bool]]) -> dict:
+    """完了・失敗したタスクの行 (user_id, title, 比べる見積もり or None, 実績分 or None, failed) から
+    全ユーザー分の UserCalibration をまとめて作る。行はユーザーごとに新しい順に並べて渡す。
+    見積もりが None の行（実績から作った提案）は文面ごとの集計にだけ入る"""
+    np = _lazy_import("numpy")
+    rows = list(rows)
+    if not rows:
+        return {}
+    user_ids = [r[0] for r in rows]
+    titles = [r[1] for r in rows]
+    estimates = np.asarray([r[2] for r in rows], dtype=float)  # None は nan
+    actual = np.asarray([r[3] for r in rows], dtype=float)  # None は nan
+    failed = np.asarray([r[4] for r in rows], dtype=bool)
+    done = ~failed & ~np.isnan(actual)
+    bucketed = ~np.isnan(estimates)
+
+    # 見積もり帯の集計: (ユーザー, 帯) を1次元の番号にして bincount で一度に数える
+    users, user_idx = np.unique(np.asarray(user_ids), return_inverse=True)
+    size = len(users) * _CALIBRATION_BUCKETS
+    cell = user_idx * _CALIBRATION_BUCKETS + np.searchsorted(_CALIBRATION_EDGES, estimates, side="right")
+    with np.errstate(invalid="ignore"):
+        log_ratio = np.log(np.clip(actual / estimates, *_CALIBRATION_RATIO_CLIP))
+        log_actual = np.log(np.maximum(actual, 1.0))
+    done_b = done & bucketed
+    failed_b = failed & bucketed
+    done_n = np.bincount(cell[done_b], minlength=size).reshape(-1, _CALIBRATION_BUCKETS).astype(float)
+    ratio_sum = np.bincount(cell[done_b], weights=log_ratio[done_b], minlength=size).reshape(-1, _CALIBRATION_BUCKETS)
+    failed_n = np.bincount(cell[failed_b], minlength=size).reshape(-1, _CALIBRATION_BUCKETS).astype(float)
+
+    # 文面ごとの集計: (ユーザー, 正規化した文面) に番号を振る。最初に出た行（いちばん新しい）の表記を残す
+    codes: dict = {}
+    normalized: dict = {}
+    first_title: List[str] = []
+    text_idx = []
+    for user_id, title in zip(user_ids, titles):
+        key = normalized.get(title)
+        if key is None:
+            key = normalized[title] = normalize_task_text(title)
+        code = codes.setdefault((user_id, key), len(codes))
+        if code == len(first_title):
+            first_title.append(title)
+        text_idx.append(code)
+    text_idx = np.asarray(text_idx, dtype=np.int64)
+    n_texts = len(codes)
+    text_done = np.bincount(text_idx[done], minlength=n_texts).tolist()
+    text_failed = np.bincount(text_idx[failed], minlength=n_texts).tolist()
+    text_sum = np.bincount(text_idx[done], weights=log_actual[done], minlength=n_texts).tolist()
+    text_sq = np.bincount(text_idx[done], weights=log_actual[done] ** 2, minlength=n_texts).tolist()
+
+    result = {
+        user_id: UserCalibration(done_n[u].copy(), ratio_sum[u].copy(), failed_n[u].copy(), {})
+        for u, user_id in enumerate(users.tolist())
+    }
+    for code, (user_id, key) in enumerate(codes):
+        result[user_id].texts[key] = TextHistory(
+            first_title[code], text_done[code], text_failed[code], text_sum[code], text_sq[code]
+        )
+    return result
+
+
+def _calibration_row(user_id: str, task: Task) -> Tuple[str, str, Optional[int], Optional[float], bool]:
+    actual = None
+    if task.status == TaskStatus.COMPLETED and task.completed_at is not None:
+        actual = (task.completed_at - task.created_at).total_seconds() / 60
+    baseline = _calibration_baseline(task.estimate_minutes, task.ai_estimate_minutes)
+    return (user_id, task.title, baseline, actual, task.status == TaskStatus.FAILED)
+
+
+def load_user_calibration(user_id: str) -> UserCalibration:
+    """1ユーザー分の履歴を読んで統計を作る（同期。run_repo で呼ぶ）"""
+    tasks = get_repo(user_id).finished_tasks(settings.CALIBRATION_HISTORY)
+    calibrations = build_calibrations(_calibration_row(user_id, t) for t in tasks)
+    return calibrations.get(user_id) or UserCalibration.empty()
+
+
+class EstimateCalibrator:
+    """ユーザーごとの UserCalibration を LRU + TTL で保持する
+
+    未読み込みのユーザーは最初の get() で履歴を読む（同じユーザーの同時読み込みは1回にまとめる）。
+    observe() は読み込み済みのユーザーにだけ足し込む（未読み込みなら次の読み込みで DB から入る）。
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], UserCalibration] = lambda user_id: load_user_calibration(user_id),
+        maxsize: int = 10000,
+        ttl: float = 3600.0,
+        enabled: bool = True,
+    ):
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._enabled = enabled
+        self._users: "OrderedDict[str, UserCalibration]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: dict[str, asyncio.Future] = {}
+        self.stats = {"loads": 0, "load_errors": 0, "observed": 0, "corrections": 0, "matches": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and NUMPY_AVAILABLE
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def items(self) -> List[Tuple[str, UserCalibration]]:
+        with self._lock:
+            return list(self._users.items())
+
+    def peek(self, user_id: str) -> Optional[UserCalibration]:
+        with self._lock:
+            calibration = self._users.get(user_id)
+            if calibration is None or calibration.loaded_at + self.ttl < time.monotonic():
+                return None
+            self._users.move_to_end(user_id)
+            return calibration
+
+    async def get(self, user_id: str) -> Optional[UserCalibration]:
+        if not self.enabled:
+            return None
+        calibration = self.peek(user_id)
+        if calibration is not None:
+            return calibration
+        future = self._loading.get(user_id)
+        if future is None:
+            future = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+            future.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, user_id: str) -> Optional[UserCalibration]:
+        try:
+            calibration = await run_repo(self.loader, user_id)
+        except Exception as e:
+            # 補正できなくても提案はできる
+            self.stats["load_errors"] += 1
+            log_event(logging.WARNING, "calibration load failed", user_id=user_id, error=repr(e))
+            return None
+        self.stats["loads"] += 1
+        self.put(user_id, calibration)
+        return calibration
+
+    def put(self, user_id: str, calibration: UserCalibration) -> None:
+        with self._lock:
+            old = self._users.get(user_id)
+            if old is not None:
+                # 読み直しても、未受理の提案の元の見積もりは引き継ぐ
+                calibration.offered = old.offered
+            self._users[user_id] = calibration
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def offered(self, user_id: Optional[str], text: str, estimate_minutes: Optional[int]) -> None:
+        """提案を返したときに呼ぶ。estimate_minutes は補正前のモデルの見積もり、実績から作った提案は None"""
+        with self._lock:
+            calibration = self._users.get(user_id) if user_id is not None else None
+            if calibration is None:
+                return
+            calibration.offer(text, estimate_minutes)
+            self.stats["corrections" if estimate_minutes is not None else "matches"] += 1
+
+    def accepted(self, user_id: str, tasks: Iterable[Task]) -> None:
+        """受理するタスクに ai_estimate_minutes を入れる。保存前に呼んで、元の見積もりを行に残す"""
+        with self._lock:
+            calibration = self._users.get(user_id)
+            if calibration is None:
+                return
+            for task in tasks:
+                calibration.accept(task)
+
+    def observe(self, user_id: str, tasks: Iterable[Task]) -> None:
+        with self._lock:
+            calibration = self._users.get(user_id)
+            if calibration is None:
+                return
+            for task in tasks:
+                calibration.observe(task)
+                self.stats["observed"] += 1
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+estimate_calibrator = EstimateCalibrator(
+    maxsize=settings.CALIBRATION_CACHE_SIZE,
+    ttl=settings.CALIBRATION_TTL,
+    enabled=settings.CALIBRATION_ENABLED,
+)
+_CALIBRATION_PAGE = 1000
+
+
+def load_finished_rows(limit_per_user: int) -> List[Tuple[str, str, Optional[int], Optional[float], bool]]:
+    """全ユーザーの完了・失敗タスクを、ユーザーごとに新しい順で limit_per_user 件まで build_calibrations の行で返す"""
+    rows = []
+    client = get_supabase_client()
+    if client is not None:
+        counts: dict = {}
+        start = 0
+        while True:
+            res = (
+                client.table('tasks')
+                .select('user_id,title,estimate_minutes,ai_estimate_minutes,status,created_at,completed_at')
+                .in_('status', [TaskStatus.COMPLETED, TaskStatus.FAILED])
+                .order('user_id')
+                .order('created_at', desc=True)
+                .range(start, start + _CALIBRATION_PAGE - 1)
+                .execute()
+            )
+            page = res.data or []
+            for r in page:
+                if counts.get(r['user_id'], 0) >= limit_per_user:
+                    continue
+                counts[r['user_id']] = counts.get(r['user_id'], 0) + 1
+                actual = None
+                if r['status'] == TaskStatus.COMPLETED and r.get('completed_at'):
+                    completed_at = datetime.fromisoformat(r['completed_at'].replace('Z', '+00:00'))
+                    created_at = datetime.fromisoformat(r['created_at'].replace('Z', '+00:00'))
+                    actual = (completed_at - created_at).total_seconds() / 60
+                baseline = _calibration_baseline(r['estimate_minutes'], r.get('ai_estimate_minutes'))
+                rows.append((r['user_id'], r['title'], baseline, actual, r['status'] == TaskStatus.FAILED))
+            if len(page) < _CALIBRATION_PAGE:
+                break
+            start += _CALIBRATION_PAGE
+    # ローカルストアは "local" ユーザーと、Supabase 未設定時の全ユーザーを持つ
+    db = get_local_db()
+    with db.lock:
+        local = db.conn.execute(
+            """select user_id, title, estimate_minutes, ai_estimate_minutes, status,
+                      (julianday(completed_at) - julianday(created_at)) * 1440 as actual_minutes
+               from (select *, row_number() over (partition by user_id order by created_at desc) as n
+                     from tasks where status in ('COMPLETED', 'FAILED'))
+               where n <= ? order by user_id, created_at desc""",
+            (limit_per_user,),
+        ).fetchall()
+    rows += [
+        (r['user_id'], r['title'], _calibration_baseline(r['estimate_minutes'], r['ai_estimate_minutes']),
+         r['actual_minutes'] if r['status'] == TaskStatus.COMPLETED else None, r['status'] == TaskStatus.FAILED)
+        for r in local
+        if client is None or r['user_id'] == "local"
+    ]
+    return rows
+
+
+def backfill_calibration() -> dict:
+    """既存の全タスクから統計を作り直して estimate_calibrator に入れる（同期のバッチ処理）"""
+    started = time.perf_counter()
+    rows = load_finished_rows(settings.CALIBRATION_HISTORY)
+    calibrations = build_calibrations(rows)
+    for user_id, calibration in calibrations.items():
+        estimate_calibrator.put(user_id, calibration)
+    summary = {"users": len(calibrations), "tasks": len(rows), "seconds": round(time.perf_counter() - started, 3)}
+    log_event(logging.INFO, "calibration backfill done", **summary)
+    return summary
+
+
+_calibration_backfill_task: Optional[asyncio.Task] = None
+
+
+async def _backfill_calibration_in_background() -> None:
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        await run_repo(backfill_calibration)
+    except Exception as e:
+        # 読み込めなかったユーザーは初回の提案時に個別に読む
+        log_event(logging.WARNING, "calibration backfill failed", error=repr(e))
+
+
+@app.on_event("startup")
+async def _start_calibration_backfill() -> None:
+    global _calibration_backfill_task
+    if settings.CALIBRATION_BACKFILL_ON_STARTUP and estimate_calibrator.enabled:
+        _calibration_backfill_task = asyncio.create_task(_backfill_calibration_in_background())
+
+
+@app.on_event("shutdown")
+async def _stop_calibration_backfill() -> None:
+    if _calibration_backfill_task is not None and not _calibration_backfill_task.done():
+        _calibration_backfill_task.cancel()
+
+
+# ---- Local gibberish pre-filter ----
+# 同じ文字の連打・記号のみ・ランダム文字列など、明らかに意味のない入力は
+# LLM を呼ぶ前にローカルで弾く。誤って正常な入力を弾かないよう、判定は保守的にする。
+_VOWELS = set("aeiouy")
+
+
+def _script_of(ch: str) -> str:
+    if ch.isdigit():
+        return "digit"
+    if not ch.isalpha():
+        return "other"
+    name = unicodedata.name(ch, "")
+    if name.startswith("HIRAGANA") or name.startswith("KATAKANA") or "PROLONGED SOUND" in name:
+        return "kana"
+    if name.startswith("CJK"):
+        return "han"
+    if name.startswith("LATIN"):
+        return "latin"
+    return name.split(" ")[0].lower()
+
+
+def _entropy(text: str) -> float:
+    counts: dict[str, int] = {}
+    for ch in text:
+        counts[ch] = counts.get(ch, 0) + 1
+    n = len(text)
+    return -sum(c / n * math.log2(c / n) for c in counts.values())
+
+
+def _looks_random_latin(word: str) -> bool:
+    vowel_ratio = sum(1 for ch in word if ch in _VOWELS) / len(word)
+    run = longest = 0
+    for ch in word:
+        run = 0 if ch in _VOWELS else run + 1
+        longest = max(longest, run)
+    return vowel_ratio < 0.1 or longest >= 6
+
+
+def gibberish_reason(text: str) -> Optional[str]:
+    """明らかに無意味な入力なら理由を返す。判断がつかなければ None（LLM に任せる）"""
+    chars = [ch for ch in unicodedata.normalize("NFKC", text) if not ch.isspace()]
+    n = len(chars)
+    if n == 0:
+        return "empty"
+    scripts = [_script_of(ch) for ch in chars]
+    letters = [ch for ch, sc in zip(chars, scripts) if sc not in ("digit", "other")]
+
+    # 記号・数字のみ
+    if not letters:
+        return "no_letters"
+    if len(letters) / n < 0.3:
+        return "mostly_symbols"
+
+    # 同じ文字の繰り返し（「ああああ」「wwwwww」）・短い周期の繰り返し（「abababab」）。
+    # 短いかな書きは同じ文字が多くても普通にある（「ママとママ友」）ので、1文字が 3/4 以上を占める場合だけ
+    if n >= 4:
+        top = max(chars.count(ch) for ch in set(chars))
+        if top / n >= 0.75:
+            return "repeated_char"
+        if n >= 6 and len(set(chars)) <= 2:
+            return "repeated_pattern"
+
+    # 4種類以上の文字体系が混在（ハングル・キリル文字・かな・ラテン…）
+    if len(set(sc for sc in scripts if sc not in ("digit", "other"))) >= 4:
+        return "script_mix"
+
+    # ラテン文字だけの入力: 小文字を含む長い語がどれも母音をほとんど持たない、
+    # または子音が長く続く（「asdfghjkl」「xkcdqzt」）。略語（HTML, CSS）は対象外
+    if all(sc in ("latin", "digit", "other") for sc in scripts):
+        words = [w for w in re.findall(r"[A-Za-z]+", text) if len(w) >= 5 and not w.isupper()]
+        if words and all(_looks_random_latin(w.lower()) for w in words):
+            return "random_latin"
+        # 大文字小文字・数字がランダムに混ざった高エントロピーな1語（「a8Kd2Qz9xP」）
+        if len(text.split()) == 1 and n >= 8 and _entropy(text) >= 3.0:
+            digits = sum(1 for sc in scripts if sc == "digit")
+            case_flips = sum(
+                1 for a, b in zip(text, text[1:])
+                if a.isalpha() and b.isalpha() and a.isupper() != b.isupper()
+            )
+            if digits >= 3 and case_flips >= 3:
+                return "random_token"
+    return None
+
+
+def heuristic_proposal(text: str) -> TaskProposal:
+    # APIキーがない場合は従来のロジック（最低6時間）
+    weight = classify_weight(text)
+    estimate = max(360, weight * 100)  # 最低6時間
+    buffer_minutes = 360 # 6時間バッファ
+    now = datetime.now(timezone.utc)
+    deadline = now + timedelta(minutes=estimate + buffer_minutes)
+    return TaskProposal(title=text.strip(), estimate_minutes=estimate, deadline_at=deadline, weight=weight, buffer_minutes=buffer_minutes)
+
+
+def _estimate_style(rank: int) -> Tuple[dict, int, str]:
+    """ランク別のキャラクター設定と、コメントの長さ・トーン"""
+    persona = AI_PERSONAS.get(rank, AI_PERSONAS[1])
+    if rank >= 7:
+        return persona, 80, "親身に、長めの文章で"
+    if rank >= 5:
+        return persona, 60, "少し丁寧に"
+    if rank >= 3:
+        return persona, 40, "事務的に"
+    return persona, 20, "一言で冷たく"
+
+
+_ESTIMATE_REQUIREMENTS = """要件:
+1. valid: タスクとして成立するか判定（true/false）
+   - 拒否: 同じ文字の繰り返し、記号のみ、ランダム文字列、意味不明な文字列
+   - 許可: 作業の意図が読み取れればOK
+2. reason: validがfalseの場合の理由（日本語）
+3. estimate_hours: タスク完了にかかる現実的な時間（0.5〜24時間）。難易度ではなく純粋な所要時間。
+4. comment: キャラクター設定に基づいた、タスクに対するコメント。
+   - 長さ: {max_len}文字以内（{tone_instruction}）。文字数制限は厳守すること。
+   - 禁止: 「手伝いましょうか」「代わりましょうか」等のAIがタスクを実行・補助するような発言。あくまで管理者として振る舞うこと。
+"""
+
+
+_ESTIMATE_SYSTEM = "あなたはタスク管理のAIアシスタントです。入力されたタスクを解析し、JSON形式で結果を返してください。"
+
+
+def _compile_estimate_prompt(rank: int) -> Tuple[str, str]:
+    """入力テキストの前後に来る固定部分 (head, tail)。ランクごとに起動時に1回だけ組み立てる"""
+    persona, max_len, tone_instruction = _estimate_style(rank)
+    head = """以下のテキストをタスクとして解析し、JSON形式で回答してください。
+
+入力: """
+    tail = f"""
+
+キャラクター設定:
+{persona['prompt']}
+
+{_ESTIMATE_REQUIREMENTS.format(max_len=max_len, tone_instruction=tone_instruction)}
+回答フォーマット(JSON):
+{{
+  "valid": boolean,
+  "reason": "string",
+  "estimate_hours": number,
+  "comment": "string"
+}}
+"""
+    return head, tail
+
+
+def _compile_estimate_batch_prompt(rank: int) -> Tuple[str, str]:
+    persona, max_len, tone_instruction = _estimate_style(rank)
+    head = """以下のテキストのそれぞれをタスクとして解析し、JSON形式で回答してください。
+入力は JSON 配列です。各要素を独立に判定し、index に配列内の位置（0始まり）を入れてください。
+
+入力(JSON配列): """
+    tail = f"""
+
+キャラクター設定:
+{persona['prompt']}
+
+{_ESTIMATE_REQUIREMENTS.format(max_len=max_len, tone_instruction=tone_instruction)}
+回答フォーマット(JSON):
+{{
+  "results": [
+    {{"index": number, "valid": boolean, "reason": "string", "estimate_hours": number, "comment": "string"}}
+  ]
+}}
+"""
+    return head, tail
+
+
+_ESTIMATE_PROMPTS = {rank: _compile_estimate_prompt(rank) for rank in AI_PERSONAS}
+_ESTIMATE_BATCH_PROMPTS = {rank: _compile_estimate_batch_prompt(rank) for rank in AI_PERSONAS}
+
+
+async def llm_estimate(text: str, rank: int) -> dict:
+    """モデルの判定結果 (valid / reason / estimate_hours / comment) をそのまま返す"""
+    # ランク別の固定部分は組み立て済み。入力テキストだけを差し込む
+    head, tail = _ESTIMATE_PROMPTS.get(rank) or _ESTIMATE_PROMPTS[1]
+
+    # 1回のAPI呼び出しで妥当性確認、見積もり、コメント生成を行う
+    content = await llm_chat(
+        [
+            {"role": "system", "content": _ESTIMATE_SYSTEM},
+            {"role": "user", "content": head + text + tail}
+        ],
+        json_mode=True,
+        timeout=settings.LLM_PROPOSE_TIMEOUT,
+        purpose="estimate",
+    )
+    
+    return json.loads(content)
+
+
+async def llm_estimate_batch(texts: List[str], rank: int) -> List[dict]:
+    """複数の入力を1回の呼び出しで判定する。結果は texts と同じ順で返す（揃わなければ例外）"""
+    head, tail = _ESTIMATE_BATCH_PROMPTS.get(rank) or _ESTIMATE_BATCH_PROMPTS[1]
+
+    content = await llm_chat(
+        [
+            {"role": "system", "content": _ESTIMATE_SYSTEM},
+            {"role": "user", "content": head + json.dumps(texts, ensure_ascii=False) + tail}
+        ],
+        json_mode=True,
+        timeout=settings.LLM_PROPOSE_TIMEOUT,
+        purpose="estimate_batch",
+    )
+
+    by_index = {}
+    for i, item in enumerate(json.loads(content).get("results") or []):
+        if isinstance(item, dict):
+            by_index[item.get("index", i)] = item
+    if set(by_index) != set(range(len(texts))):
+        raise ValueError(f"batch estimate returned {len(by_index)} results for {len(texts)} inputs")
+    return [by_index[i] for i in range(len(texts))]
+
+
+class EstimateCoalescer:
+    """短い窓の間に届いた見積もりをランクごとにまとめて1回の LLM 呼び出しにする
+
+    window <= 0 なら何もまとめずにそのまま llm_estimate を呼ぶ。max_batch 件たまった時点で
+    窓を待たずに送る。まとめ呼び出しが失敗したら、その回の入力を1件ずつ呼び直す。
+    """
+
+    def __init__(
+        self,
+        window: float = 0.0,
+        max_batch: int = 16,
+        estimate_one: Callable[[str, int], Awaitable[dict]] = llm_estimate,
+        estimate_batch: Callable[[List[str], int], Awaitable[List[dict]]] = llm_estimate_batch,
+    ):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.estimate_one = estimate_one
+        self.estimate_batch = estimate_batch
+        self._pending: dict[int, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+        self.stats = {"proposals": 0, "calls": 0, "batches": 0, "batch_failures": 0}
+
+    async def estimate(self, text: str, rank: int) -> dict:
+        self.stats["proposals"] += 1
+        if self.window <= 0 or self.max_batch == 1:
+            self.stats["calls"] += 1
+            return await self.estimate_one(text, rank)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        pending = self._pending.setdefault(rank, [])
+        pending.append((text, fut))
+        if len(pending) >= self.max_batch:
+            self._flush(rank)
+        elif len(pending) == 1:
+            self._timers[rank] = loop.call_later(self.window, self._flush, rank)
+        return await fut
+
+    def _flush(self, rank: int) -> None:
+        timer = self._timers.pop(rank, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(rank, None)
+        if items:
+            task = asyncio.create_task(self._run(rank, items))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, rank: int, items: List[Tuple[str, asyncio.Future]]) -> None:
+        # 同じ入力は1回だけ問い合わせる
+        texts = list(dict.fromkeys(text for text, _ in items))
+        try:
+            if len(texts) == 1:
+                self.stats["calls"] += 1
+                results = {texts[0]: await self.estimate_one(texts[0], rank)}
+            else:
+                self.stats["calls"] += 1
+                self.stats["batches"] += 1
+                results = dict(zip(texts, await self.estimate_batch(texts, rank)))
+        except Exception as e:
+            if len(texts) == 1:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            log_event(logging.WARNING, "batch estimate failed, retrying one by one", size=len(texts), error=repr(e))
+            self.stats["batch_failures"] += 1
+            self.stats["calls"] += len(texts)
+            outcomes = await asyncio.gather(*[self.estimate_one(t, rank) for t in texts], return_exceptions=True)
+            results = dict(zip(texts, outcomes))
+        for text, fut in items:
+            if fut.done():  # 待っていたリクエストが切断された
+                continue
+            outcome = results[text]
+            if isinstance(outcome, BaseException):
+                fut.set_exception(outcome)
+            else:
+                fut.set_result(outcome)
+
+
+estimate_coalescer = EstimateCoalescer(
+    window=settings.PROPOSE_BATCH_WINDOW,
+    max_batch=settings.PROPOSE_BATCH_MAX,
+)
+# 一括提案用: 1リクエスト分の入力は同じイベントループ周回で揃うので、短い窓で確実にまとめられる
+bulk_estimate_coalescer = EstimateCoalescer(
+    window=0.005,
+    max_batch=settings.PROPOSE_BATCH_MAX,
+)
+
+
+def _buffer_hours(now_utc: datetime) -> int:
+    # 締め切り時間（見積もり+6時間）
+    buffer_hours = 6
+    
+    # JST 20時以降ならさらに+6時間（睡眠時間考慮）
+    jst_offset = timedelta(hours=9)
+    now_jst = now_utc + jst_offset
+    if now_jst.hour >= 20:
+        buffer_hours += 6
+    return buffer_hours
+
+
+def cacheable_estimate(result: dict) -> bool:
+    """ProposalCache に入れてよい回答か。拒否はそのまま、受理は estimate_hours が数値のときだけ
+    （形の崩れた回答をキャッシュすると、TTL の間ずっと代替の提案を返し続ける）"""
+    valid = result.get("valid")
+    if valid is False:
+        return True
+    hours = result.get("estimate_hours")
+    return valid is True and isinstance(hours, (int, float)) and not isinstance(hours, bool)
+
+
+def model_estimate_minutes(result: dict) -> float:
+    """モデルの回答の見積もり（分、補正前）"""
+    return max(0.5, min(24, result.get("estimate_hours", 1))) * 60
+
+
+def proposal_from_estimate(
+    text: str, rank: int, result: dict, calibration: Optional[UserCalibration] = None
+) -> TaskProposal:
+    """モデルの判定結果から提案を組み立てる（期限は毎回現在時刻から計算する）"""
+    if not result.get("valid", False):
+        raise HTTPException(400, result.get("comment", "...何を言っているんですか？"))
+    
+    # AIの見積もり時間
+    ai_estimate_hours = model_estimate_minutes(result) / 60
+    failure_rate = 0.0
+    if calibration is not None:
+        # このユーザーの実績で補正する（元の見積もりは呼び出し側が estimate_calibrator.offered で覚える）
+        ratio, failure_rate = calibration.correction(ai_estimate_hours * 60)
+        ai_estimate_hours = max(0.5, min(24, ai_estimate_hours * ratio))
+    estimate_minutes = int(ai_estimate_hours * 60)
+    
+    # 失敗の多い見積もり帯は、失敗率の分だけ見積もりを期限に足す
+    buffer_hours = _buffer_hours(datetime.now(timezone.utc)) + ai_estimate_hours * failure_rate
+        
+    deadline_hours_from_now = ai_estimate_hours + buffer_hours
+    buffer_minutes = int(buffer_hours * 60)
         
-        # ランク別のキャラクター設定を取得
-        persona = AI_PERSONAS.get(rank, AI_PERSONAS[1])
+    weight = 3
+    
+    now = datetime.now(timezone.utc)
+    deadline = now + timedelta(hours=deadline_hours_from_now)
+    
+    ai_comment = result.get("comment", "...")
+    if rank == 1:
+        ai_comment = "...。"
+
+    return TaskProposal(
+        title=text.strip(), 
+        estimate_minutes=estimate_minutes, 
+        deadline_at=deadline, 
+        weight=weight,
+        ai_comment=ai_comment,
+        buffer_minutes=buffer_minutes
+    )
+
+
+def matched_proposal(text: str, rank: int, calibration: Optional[UserCalibration]) -> Optional[TaskProposal]:
+    """同じ文面の過去タスクの実績が安定していれば、LLM を呼ばずにそこから提案を作る"""
+    history = calibration.match(text) if calibration is not None else None
+    if history is None:
+        return None
+    estimate_minutes = round(max(30, min(24 * 60, history.minutes())))
+    buffer_minutes = _buffer_hours(datetime.now(timezone.utc)) * 60
+    return TaskProposal(
+        title=text.strip(),
+        estimate_minutes=estimate_minutes,
+        deadline_at=datetime.now(timezone.utc) + timedelta(minutes=estimate_minutes + buffer_minutes),
+        weight=3,
+        ai_comment="...。" if rank == 1 else CALIBRATED_PROPOSAL_COMMENT,
+        buffer_minutes=buffer_minutes,
+    )
+
+
+async def propose_estimate_and_deadline(
+    text: str,
+    rank: int = 1,
+    coalescer: Optional[EstimateCoalescer] = None,
+    user_id: Optional[str] = None,
+    calibration: Optional[UserCalibration] = None,
+) -> TaskProposal:
+    """
+    AIを使ってタスクの見積もりを行う
+    意味不明な入力は拒否する
+    LLM が混んでいる・止まっている場合はヒューリスティックな見積もりで即答する
+    calibration を渡すとユーザーの実績で見積もりを補正し、実績の安定した文面なら LLM を呼ばない
+    """
+    matched = matched_proposal(text, rank, calibration)
+    if matched is not None:
+        estimate_calibrator.offered(user_id, text, None)
+        return matched
+
+    if not llm_enabled():
+        return heuristic_proposal(text)
+
+    if settings.GIBBERISH_PREFILTER_ENABLED and gibberish_reason(text) is not None:
+        raise HTTPException(400, "...何を言っているんですか？")
+    
+    try:
+        key = proposal_cache.key(text, rank)
+        result = proposal_cache.get(key)
+        if result is None:
+            llm_admission.check(user_id, settings.LLM_QUEUE_BUDGET)
+            result = await (coalescer or estimate_coalescer).estimate(text, rank)
+            if cacheable_estimate(result):
+                proposal_cache.put(key, result)
+        proposal = proposal_from_estimate(text, rank, result, calibration)
+        if calibration is not None:
+            estimate_calibrator.offered(user_id, text, int(model_estimate_minutes(result)))
+        log_event(logging.DEBUG, "proposal", sampled=True, rank=rank, proposal=proposal.model_dump(mode="json"))
+        return proposal
         
-        # ランクに応じたコメントの長さとトーン
-        max_len = 20
-        tone_instruction = "一言で冷たく"
-        if rank >= 7:
-            max_len = 80
-            tone_instruction = "親身に、長めの文章で"
-        elif rank >= 5:
-            max_len = 60
-            tone_instruction = "少し丁寧に"
-        elif rank >= 3:
-            max_len = 40
-            tone_instruction = "事務的に"
-
-        # 1回のAPI呼び出しで妥当性確認、見積もり、コメント生成を行う
-        prompt = f"""以下のテキストをタスクとして解析し、JSON形式で回答してください。
-
-入力: {text}
+    except HTTPException:
+        raise
+    except LLMOverloaded as e:
+        log_event(logging.DEBUG, "llm overloaded, using heuristic proposal", sampled=True, reason=e.reason)
+        return heuristic_proposal(text)
+    except Exception as e:
+        log_event(logging.WARNING, "estimate failed, using fallback proposal", error=repr(e))
+        # Fallback
+        return _fallback_proposal(text)
+
+
+# ---- Streaming proposal ----
+# POST /tasks/propose/stream は見積もり JSON をストリームで受け取り、estimate_hours が読めた時点で
+# 期限まで計算して送り、続けて comment を増分で送る。回答フォーマットは valid → reason →
+# estimate_hours → comment の順なので、コメントの生成を待たずに期限を返せる。
+class EstimateStreamParser:
+    """ストリームで届く見積もり JSON を逐次読む
+
+    feed() に断片を渡すと、新たに値が確定した valid / estimate_hours と、comment の増分を返す。
+    """
+
+    _SCALAR = re.compile(r'"(valid|estimate_hours)"\s*:\s*(true|false|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\s*[,}]')
+    _COMMENT = re.compile(r'"comment"\s*:\s*"')
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self.comment = ""
+        self.comment_done = False
+        self._comment_pos: Optional[int] = None
+
+    def feed(self, chunk: str) -> Tuple[dict, str]:
+        self.buffer += chunk
+        found = {}
+        for m in self._SCALAR.finditer(self.buffer):
+            if m.group(1) not in self.fields:
+                self.fields[m.group(1)] = found[m.group(1)] = json.loads(m.group(2))
+        if self._comment_pos is None:
+            m = self._COMMENT.search(self.buffer)
+            if m:
+                self._comment_pos = m.end()
+        delta = ""
+        if self._comment_pos is not None and not self.comment_done:
+            delta = self._read_comment()
+            self.comment += delta
+        return found, delta
+
+    def _read_comment(self) -> str:
+        buf = self.buffer
+        start = end = self._comment_pos
+        while end < len(buf):
+            c = buf[end]
+            if c == '"':
+                self.comment_done = True
+                break
+            if c == '\\':
+                # エスケープは最後まで届いてから読む
+                size = 6 if buf[end + 1:end + 2] == 'u' else 2
+                if end + size > len(buf):
+                    break
+                end += size
+            else:
+                end += 1
+        text = json.loads(f'"{buf[start:end]}"', strict=False) if end > start else ""
+        if text and '\ud800' <= text[-1] <= '\udbff' and not self.comment_done:
+            # サロゲートペアの前半だけ届いた
+            text = text[:-1]
+            end -= 6
+        self._comment_pos = end
+        return text
+
+    def result(self) -> dict:
+        try:
+            return json.loads(self.buffer)
+        except ValueError:
+            return dict(self.fields, comment=self.comment)
+
+
+def _estimate_event(proposal: TaskProposal) -> dict:
+    return {"type": "estimate", "valid": True, **proposal.model_dump(mode="json", exclude={"ai_comment"})}
+
+
+def _proposal_events(proposal: TaskProposal) -> List[dict]:
+    # 見積もりが一度に分かる場合（ヒューリスティック・キャッシュ・フォールバック）
+    events = [_estimate_event(proposal)]
+    if proposal.ai_comment:
+        events.append({"type": "comment", "delta": proposal.ai_comment})
+    events.append({"type": "done", "proposal": proposal.model_dump(mode="json")})
+    return events
+
+
+async def stream_proposal(
+    text: str, rank: int = 1, user_id: Optional[str] = None, calibration: Optional[UserCalibration] = None
+) -> AsyncIterator[dict]:
+    """propose_estimate_and_deadline のストリーム版。イベントは estimate → comment* → done、
+    入力が拒否された場合は error（status / detail）で終わる"""
+    matched = matched_proposal(text, rank, calibration)
+    if matched is not None:
+        estimate_calibrator.offered(user_id, text, None)
+        for event in _proposal_events(matched):
+            yield event
+        return
+
+    if not llm_enabled():
+        for event in _proposal_events(heuristic_proposal(text)):
+            yield event
+        return
+
+    key = proposal_cache.key(text, rank)
+    result = proposal_cache.get(key)
+    if result is None:
+        try:
+            llm_admission.check(user_id, settings.LLM_QUEUE_BUDGET)
+        except LLMOverloaded:
+            for event in _proposal_events(heuristic_proposal(text)):
+                yield event
+            return
+        parser = EstimateStreamParser()
+        estimate: Optional[TaskProposal] = None
+        head, tail = _ESTIMATE_PROMPTS.get(rank) or _ESTIMATE_PROMPTS[1]
+        chunks = llm_chat_stream(
+            [
+                {"role": "system", "content": _ESTIMATE_SYSTEM},
+                {"role": "user", "content": head + text + tail}
+            ],
+            json_mode=True,
+            timeout=settings.LLM_PROPOSE_TIMEOUT,
+            purpose="estimate_stream",
+        )
+        try:
+            async for chunk in chunks:
+                _, delta = parser.feed(chunk)
+                if estimate is None and parser.fields.get("valid") is True and "estimate_hours" in parser.fields:
+                    estimate = proposal_from_estimate(text, rank, parser.fields, calibration)
+                    if calibration is not None:
+                        estimate_calibrator.offered(user_id, text, int(model_estimate_minutes(parser.fields)))
+                    yield _estimate_event(estimate)
+                    # 期限より先に届いていたコメントもここで送る
+                    delta = parser.comment
+                if estimate is not None and delta and rank != 1:
+                    yield {"type": "comment", "delta": delta}
+        except Exception as e:
+            log_event(logging.WARNING, "estimate stream failed", error=repr(e), estimate_sent=estimate is not None)
+            if estimate is None:
+                fallback = heuristic_proposal(text) if isinstance(e, LLMOverloaded) else _fallback_proposal(text)
+                for event in _proposal_events(fallback):
+                    yield event
+                return
+            # 期限は送信済みなので、届いた分のコメントで確定させる
+            result = dict(parser.fields, comment=parser.comment or "...")
+        finally:
+            await chunks.aclose()
+        if result is None:
+            result = parser.result()
+            if cacheable_estimate(result):
+                proposal_cache.put(key, result)
+        if estimate is not None:
+            ai_comment = "...。" if rank == 1 else result.get("comment", "...")
+            if rank == 1:
+                yield {"type": "comment", "delta": ai_comment}
+            yield {"type": "done", "proposal": estimate.model_copy(update={"ai_comment": ai_comment}).model_dump(mode="json")}
+            return
+
+    try:
+        proposal = proposal_from_estimate(text, rank, result, calibration)
+        if calibration is not None:
+            estimate_calibrator.offered(user_id, text, int(model_estimate_minutes(result)))
+    except HTTPException as e:
+        yield {"type": "error", "status": e.status_code, "detail": e.detail}
+        return
+    except Exception as e:
+        # 形の崩れた回答（estimate_hours が文字列など）は非ストリーム版と同じく代替の提案で返す
+        log_event(logging.WARNING, "estimate failed, using fallback proposal", error=repr(e))
+        proposal = _fallback_proposal(text)
+    for event in _proposal_events(proposal):
+        yield event
+
+
+COMPLETION_FALLBACK_COMMENT = "タスク完了を確認しました。"
+
+
+def _compile_completion_prompt(rank: int) -> Tuple[str, str, str]:
+    """(system, head, tail)。ユーザー入力は head + タスク名 + 完了レポート + tail の位置に入る"""
+    persona = AI_PERSONAS.get(rank, AI_PERSONAS[2])
+    system = f"{persona['prompt']} タスク完了に対するコメントを提供してください。ポイントや得点には言及せず、タスク内容と完了レポートに焦点を当ててください。"
+    head = """以下の完了したタスクについて、AIアシスタントとしてねぎらいや評価のコメントを作成してください。
+
+タスク: """
+    tail = f"""
+
+キャラクター設定:
+{persona['prompt']}
+
+重要:
+- 完了レポートの内容を踏まえて、具体的にコメントしてください
+- タスクの内容や作業の成果について言及してください
+- ポイントや得点については一切言及しないでください
+- 上記のキャラクター設定に基づいた口調で話してください
+- 80文字程度の日本語
+"""
+    return system, head, tail
+
+
+_COMPLETION_PROMPTS = {rank: _compile_completion_prompt(rank) for rank in AI_PERSONAS}
+
+
+async def llm_completion_comment(title: str, self_report: str, rank: int) -> str:
+    """完了コメントを LLM で生成する（失敗時は例外をそのまま投げる）"""
+    system, head, tail = _COMPLETION_PROMPTS.get(rank) or _COMPLETION_PROMPTS[2]
+    return await llm_chat([
+        {"role": "system", "content": system},
+        {"role": "user", "content": f"{head}{title}\n完了レポート: {self_report}{tail}"}
+    ], timeout=settings.LLM_COMPLETE_TIMEOUT, purpose="completion_comment")
+
+
+# ---- Points and rank system ----
+RANK_THRESHOLDS = {
+    1: 0,
+    2: 10,
+    3: 20,
+    4: 40,
+    5: 60,
+    6: 80,
+    7: 120,
+}
+
+MAX_POINTS = 120
+MAX_ACTIVE_TASKS = 3
+
+
+@dataclass(frozen=True, slots=True)
+class RankInfo:
+    rank: int
+    next_threshold: int
+
+
+def _build_rank_table() -> List[RankInfo]:
+    """ポイント 0..MAX_POINTS ごとのランク情報を起動時に1回だけ作る"""
+    table = []
+    for points in range(MAX_POINTS + 1):
+        rank = max(r for r, th in RANK_THRESHOLDS.items() if points >= th)
+        next_threshold = next((th for _, th in sorted(RANK_THRESHOLDS.items()) if points < th), 10)
+        # ランクごとのプロンプトは _ESTIMATE_PROMPTS / _COMPLETION_PROMPTS に組み立て済み
+        table.append(RankInfo(rank, next_threshold))
+    return table
+
+
+RANK_TABLE = _build_rank_table()
+
+
+def rank_info(points: int) -> RankInfo:
+    return RANK_TABLE[min(MAX_POINTS, max(0, points))]
+
+
+def points_delta_on_success(task: Task, remaining_seconds: int) -> int:
+    # 基本報酬: 見積もり時間に応じて1〜5pt（6時間→1pt、24時間→5pt）
+    estimated_hours = task.estimate_minutes / 60
+    base = min(5, max(1, int(estimated_hours / 6)))
+    # 時間ボーナス: 1時間(3600秒)残るごとに+1pt、最大+5ptまで
+    time_bonus = min(5, max(0, remaining_seconds // 3600))
+    return base + time_bonus
+
+
+def points_delta_on_failure(task: Task) -> int:
+    # 減点: 達成時の基本ポイントの3倍（見積もり時間ベース）
+    estimated_hours = task.estimate_minutes / 60
+    base_penalty = min(5, max(1, int(estimated_hours / 6)))
+    return -base_penalty * 3
+
+
+def success_transition(task: Task, completed_at: datetime, self_report: str, comment_pending: bool = False) -> TaskTransition:
+    remaining = max(0, int((task.deadline_at - completed_at).total_seconds()))
+    return TaskTransition(
+        task_id=task.id,
+        status=TaskStatus.COMPLETED,
+        points_delta=points_delta_on_success(task, remaining),
+        completed_at=completed_at,
+        self_report=self_report,
+        comment_pending=comment_pending,
+    )
+
+
+def failure_transition(task: Task, failed_at: datetime) -> TaskTransition:
+    return TaskTransition(
+        task_id=task.id,
+        status=TaskStatus.FAILED,
+        points_delta=points_delta_on_failure(task),
+        failed_at=failed_at,
+    )
+
+
+
+
+# ---- Event broker (SSE) ----
+# タスクの状態変化とポイント変化をユーザーごとに push する。クライアントはポーリングの代わりに
+# GET /events を1本張っておく。配送経路 (BrokerBackend) は差し替え可能で、
+# 既定のプロセス内配送は単一ワーカー向け。複数ワーカーで共有する場合は Redis Pub/Sub や
+# Postgres LISTEN/NOTIFY などで publish / 受信を実装した backend を渡す。
+class BrokerBackend:
+    def start(self, deliver: Callable[[str, dict], None]) -> None:
+        """他ワーカーから届いたイベントを deliver(user_id, event) で配る準備をする"""
+
+    def publish(self, user_id: str, event: dict) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessBackend(BrokerBackend):
+    def __init__(self):
+        self._deliver: Optional[Callable[[str, dict], None]] = None
+
+    def start(self, deliver: Callable[[str, dict], None]) -> None:
+        self._deliver = deliver
+
+    def publish(self, user_id: str, event: dict) -> None:
+        if self._deliver is not None:
+            self._deliver(user_id, event)
+
+
+class Subscription:
+    def __init__(self, user_id: str, maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+
+class EventBroker:
+    def __init__(self, backend: Optional[BrokerBackend] = None, queue_size: int = 100):
+        self.backend = backend or InProcessBackend()
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ids = itertools.count(1)
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self.backend.start(self._deliver_threadsafe)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        sub = Subscription(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.user_id]
+
+    def publish(self, user_id: str, event_type: str, data: dict) -> None:
+        """どのスレッドからでも呼べる（スイーパーはワーカースレッドから呼ぶ）"""
+        event = {"id": next(self._ids), "type": event_type, "data": data}
+        self.backend.publish(user_id, event)
+
+    def _deliver_threadsafe(self, user_id: str, event: dict) -> None:
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(user_id, event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, user_id, event)
+
+    def _deliver(self, user_id: str, event: dict) -> None:
+        for sub in list(self._subscribers.get(user_id, ())):
+            if sub.queue.full():
+                # 読み出しが追いつかないクライアント: 溜まったイベントを捨てて再取得 (GET /status) を促す
+                sub.dropped += sub.queue.qsize()
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait({"id": event["id"], "type": "resync", "data": {"dropped": sub.dropped}})
+            sub.queue.put_nowait(event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+
+event_broker = EventBroker(queue_size=settings.EVENT_QUEUE_SIZE)
+
+
+@app.on_event("startup")
+async def _start_event_broker() -> None:
+    event_broker.start(asyncio.get_running_loop())
+
+
+@app.on_event("shutdown")
+async def _stop_event_broker() -> None:
+    event_broker.backend.close()
+
+
+def publish_task_event(user_id: str, event_type: str, task: Task) -> None:
+    event_broker.publish(user_id, event_type, {"task": task.model_dump(mode="json")})
+
+
+def publish_settlement(user_id: str, result: SettleResult) -> None:
+    for task in result.tasks:
+        event_type = "task.completed" if task.status == TaskStatus.COMPLETED else "task.failed"
+        publish_task_event(user_id, event_type, task)
+    if result.tasks:
+        event_broker.publish(user_id, "profile.points", {"profile": result.profile.model_dump(), "rank": result.profile.rank})
+        if result.profile.points <= 0:
+            event_broker.publish(user_id, "game_over", {})
+
+
+def _sse_format(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+@app.get('/events')
+async def events(request: Request, x_user_id: str = Header(default="local", alias="X-User-ID")):
+    sub = event_broker.subscribe(x_user_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=settings.EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield _sse_format(event)
+        finally:
+            event_broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---- Audit log ----
+# 受理・延長・完了・取り下げ・期限切れ失敗・ポイント増減・ゲームオーバー後のリセットを task_logs に残す。
+# ハンドラはメモリ上のリングバッファに積むだけで待たない。バックグラウンドのフラッシャーが
+# AUDIT_BATCH_SIZE 件たまるか AUDIT_FLUSH_INTERVAL 秒ごとに、書き込み先ごとの複数行 insert にまとめる。
+# バッファが溢れたら古いものから押し出して数える。停止時には残りを書き切る。
+@dataclass(slots=True)
+class AuditEvent:
+    user_id: str
+    event_type: str
+    task_id: Optional[str]
+    payload: dict
+    created_at: datetime
+
+
+class MemoryAuditSink:
+    """書き込まれた監査イベントをメモリに貯める（テスト・ベンチマーク用）"""
+
+    def __init__(self):
+        self.events: List[AuditEvent] = []
+        self.batches = 0
+
+    def write(self, events: List[AuditEvent]) -> None:
+        self.events.extend(events)
+        self.batches += 1
+
+
+class SqliteAuditSink:
+    def __init__(self, db: LocalDB):
+        self.db = db
+
+    def write(self, events: List[AuditEvent]) -> None:
+        params = []
+        for e in events:
+            params += [e.task_id, e.user_id, e.event_type, json.dumps(e.payload, ensure_ascii=False), _iso(e.created_at)]
+        with self.db.lock:
+            self.db.conn.execute(
+                "insert into task_logs (task_id, user_id, event_type, payload, created_at) values "
+                + ", ".join(["(?, ?, ?, ?, ?)"] * len(events)),
+                params,
+            )
+
+
+class SupabaseAuditSink:
+    def __init__(self, client):
+        self.client = client
+
+    def write(self, events: List[AuditEvent]) -> None:
+        self.client.table('task_logs').insert([
+            {
+                'task_id': e.task_id,
+                'user_id': e.user_id,
+                'event_type': e.event_type,
+                'payload': e.payload,
+                'created_at': e.created_at.isoformat(),
+            }
+            for e in events
+        ], returning=_return_minimal()).execute()
+
+
+_audit_sinks: dict = {}
 
-キャラクター設定:
-{persona['prompt']}
 
-要件:
-1. valid: タスクとして成立するか判定（true/false）
-   - 拒否: 同じ文字の繰り返し、記号のみ、ランダム文字列、意味不明な文字列
-   - 許可: 作業の意図が読み取れればOK
-2. reason: validがfalseの場合の理由（日本語）
-3. estimate_hours: タスク完了にかかる現実的な時間（0.5〜24時間）。難易度ではなく純粋な所要時間。
-4. comment: キャラクター設定に基づいた、タスクに対するコメント。
-   - 長さ: {max_len}文字以内（{tone_instruction}）。文字数制限は厳守すること。
-   - 禁止: 「手伝いましょうか」「代わりましょうか」等のAIがタスクを実行・補助するような発言。あくまで管理者として振る舞うこと。
+def get_audit_sink(user_id: str = "local"):
+    """get_repo と同じ振り分けで書き込み先を返す（フラッシュ時に書き込み先ごとにまとめるため共有する）"""
+    client = None if user_id == "local" else get_supabase_client()
+    if client is not None:
+        sink = _audit_sinks.get(id(client))
+        if sink is None:
+            sink = _audit_sinks[id(client)] = SupabaseAuditSink(client)
+        return sink
+    db = get_local_db()
+    sink = _audit_sinks.get(id(db))
+    if sink is None:
+        sink = _audit_sinks[id(db)] = SqliteAuditSink(db)
+    return sink
 
-回答フォーマット(JSON):
-{{
-  "valid": boolean,
-  "reason": "string",
-  "estimate_hours": number,
-  "comment": "string"
-}}
-"""
 
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {"role": "system", "content": "あなたはタスク管理のAIアシスタントです。入力されたタスクを解析し、JSON形式で結果を返してください。"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        
-        if not result.get("valid", False):
-            raise HTTPException(400, result.get("comment", "...何を言っているんですか？"))
-        
-        # AIの見積もり時間
-        ai_estimate_hours = max(0.5, min(24, result.get("estimate_hours", 1)))
-        estimate_minutes = int(ai_estimate_hours * 60)
-        
-        # 締め切り時間（見積もり+6時間）
-        buffer_hours = 6
-        
-        # JST 20時以降ならさらに+6時間（睡眠時間考慮）
-        now_utc = datetime.now(timezone.utc)
-        jst_offset = timedelta(hours=9)
-        now_jst = now_utc + jst_offset
-        if now_jst.hour >= 20:
-            buffer_hours += 6
-            
-        deadline_hours_from_now = ai_estimate_hours + buffer_hours
-        buffer_minutes = int(buffer_hours * 60)
-            
-        weight = 3
-        
-        now = datetime.now(timezone.utc)
-        deadline = now + timedelta(hours=deadline_hours_from_now)
-        
-        ai_comment = result.get("comment", "...")
-        if rank == 1:
-            ai_comment = "...。"
-
-        proposal = TaskProposal(
-            title=text.strip(), 
-            estimate_minutes=estimate_minutes, 
-            deadline_at=deadline, 
-            weight=weight,
-            ai_comment=ai_comment,
-            buffer_minutes=buffer_minutes
-        )
-        print(f"DEBUG: Proposal: {proposal}")
-        return proposal
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"AI Error: {e}")
-        # Fallback
-        weight = 3
-        estimate = 60
-        buffer_minutes = 360
-        deadline = datetime.now(timezone.utc) + timedelta(minutes=estimate + buffer_minutes)
-        return TaskProposal(
-            title=text.strip(), 
-            estimate_minutes=estimate, 
-            deadline_at=deadline, 
-            weight=weight, 
-            ai_comment="...",
-            buffer_minutes=buffer_minutes
+class AuditLog:
+    """監査イベントのリングバッファとバックグラウンドのフラッシャー
+
+    record() はどのスレッドからでも呼べる（スイーパーはワーカースレッドで精算する）。
+    """
+
+    def __init__(
+        self,
+        sink_factory: Callable[[str], object] = lambda user_id: get_audit_sink(user_id),
+        capacity: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.sink_factory = sink_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._buffer: "deque[AuditEvent]" = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0, "flushes": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def record(self, user_id: str, event_type: str, task_id: Optional[str] = None, **payload) -> None:
+        if not self.enabled:
+            return
+        event = AuditEvent(user_id, event_type, task_id, payload, datetime.now(timezone.utc))
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                # いちばん古いイベントが押し出される
+                self.stats["dropped"] += 1
+            self._buffer.append(event)
+            self.stats["recorded"] += 1
+            full = len(self._buffer) >= self.batch_size
+        if full and self.running:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        if self.enabled and not self.running:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """フラッシャーを止め、残っているイベントを書き切る"""
+        if self.running:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                log_event(logging.ERROR, "audit flush failed", error=repr(e))
+
+    def _take(self) -> List[AuditEvent]:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+    async def flush(self) -> int:
+        """バッファを空になるまで書き込み、書けた件数を返す"""
+        written = 0
+        while True:
+            events = self._take()
+            if not events:
+                return written
+            batches: dict = {}
+            for event in events:
+                sink = self.sink_factory(event.user_id)
+                batches.setdefault(id(sink), (sink, []))[1].append(event)
+            for sink, batch in batches.values():
+                try:
+                    await run_repo(sink.write, batch)
+                except Exception as e:
+                    self.stats["write_errors"] += len(batch)
+                    log_event(logging.ERROR, "audit write failed", events=len(batch), error=repr(e))
+                    continue
+                self.stats["written"] += len(batch)
+                written += len(batch)
+            self.stats["flushes"] += 1
+
+
+audit_log = AuditLog(
+    capacity=settings.AUDIT_BUFFER_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    enabled=settings.AUDIT_ENABLED,
+)
+
+
+def _task_audit_payload(task: Task) -> dict:
+    return {
+        "status": task.status,
+        "completed_at": _iso(task.completed_at),
+        "failed_at": _iso(task.failed_at),
+        "self_report": task.self_report,
+    }
+
+
+def audit_settlement(user_id: str, result: SettleResult, transitions: Iterable[TaskTransition], event_type: str) -> None:
+    """精算したタスクごとのイベントと、ポイント増減のイベントを1件記録する"""
+    if not result.tasks:
+        return
+    deltas = {tr.task_id: tr.points_delta for tr in transitions}
+    for task in result.tasks:
+        audit_log.record(user_id, event_type, task.id, points_delta=deltas.get(task.id, 0), **_task_audit_payload(task))
+    audit_log.record(user_id, "points.changed", None, cause=event_type, points=result.profile.points,
+                     delta=result.points_delta)
+
+
+@app.on_event("startup")
+async def _start_audit_log() -> None:
+    audit_log.start()
+
+
+@app.on_event("shutdown")
+async def _stop_audit_log() -> None:
+    await audit_log.stop()
+
+
+# ---- Completion comment jobs ----
+# 完了 API はタスクとポイントだけ確定して即座に返し、AIコメントはワーカーが後から埋める。
+# 生成中のタスクは ai_completion_comment_pending = true。書き込み後に task.comment_ready を
+# push するので、クライアントは SSE か次回の GET /tasks/current・/status で受け取る。
+@dataclass(slots=True)
+class CommentJob:
+    user_id: str
+    task_id: str
+    title: str
+    self_report: Optional[str]
+    rank: int
+
+
+def load_pending_comments() -> List[Tuple[str, str, str, Optional[str]]]:
+    """コメント生成中のまま残っているタスクを (user_id, task_id, title, self_report) で返す"""
+    entries = []
+    client = get_supabase_client()
+    if client is not None:
+        res = (
+            client.table('tasks')
+            .select('id,user_id,title,self_report')
+            .eq('ai_completion_comment_pending', True)
+            .execute()
         )
+        entries += [(r['user_id'], r['id'], r['title'], r.get('self_report')) for r in (res.data or [])]
+    # ローカルストアは "local" ユーザーと、Supabase 未設定時の全ユーザーを持つ
+    db = get_local_db()
+    with db.lock:
+        rows = db.conn.execute(
+            "select id, user_id, title, self_report from tasks where ai_completion_comment_pending = 1"
+        ).fetchall()
+    entries += [
+        (r['user_id'], r['id'], r['title'], r['self_report'])
+        for r in rows
+        if client is None or r['user_id'] == "local"
+    ]
+    return entries
 
 
+class CompletionCommentQueue:
+    """プロセス内の有界キュー + 固定数ワーカー。generate / repo_factory / pending_source は差し替え可能"""
 
-# ---- Points and rank system ----
-RANK_THRESHOLDS = {
-    1: 0,
-    2: 10,
-    3: 20,
-    4: 40,
-    5: 60,
-    6: 80,
-    7: 120,
-}
+    def __init__(
+        self,
+        generate: Callable[[str, Optional[str], int], Awaitable[str]] = llm_completion_comment,
+        repo_factory: Callable[[str], Repo] = lambda user_id: get_repo(user_id),
+        pending_source: Callable[[], List[Tuple[str, str, str, Optional[str]]]] = load_pending_comments,
+        workers: int = 4,
+        maxsize: int = 1000,
+        max_attempts: int = 3,
+        timeout: float = 30.0,
+        retry_backoff: float = 1.0,
+    ):
+        self.generate = generate
+        self.repo_factory = repo_factory
+        self.pending_source = pending_source
+        self.workers = workers
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.retry_backoff = retry_backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.stats = {"done": 0, "retries": 0, "fallbacks": 0, "rejected": 0, "recovered": 0}
 
-MAX_POINTS = 120
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
 
+    def qsize(self) -> int:
+        return self._queue.qsize()
 
-def apply_points_on_success(profile: Profile, task: Task, remaining_seconds: int) -> Profile:
-    # 基本報酬: 見積もり時間に応じて1〜5pt（6時間→1pt、24時間→5pt）
-    estimated_hours = task.estimate_minutes / 60
-    base = min(5, max(1, int(estimated_hours / 6)))
-    # 時間ボーナス: 1時間(3600秒)残るごとに+1pt、最大+5ptまで
-    time_bonus = min(5, max(0, remaining_seconds // 3600))
-    profile.points = min(MAX_POINTS, profile.points + base + time_bonus)
-    return profile
+    def start(self) -> None:
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
 
+    def enqueue(self, job: CommentJob) -> bool:
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return False
 
-def apply_points_on_failure(profile: Profile, task: Task) -> Profile:
-    # 減点: 達成時の基本ポイントの3倍（見積もり時間ベース）
-    estimated_hours = task.estimate_minutes / 60
-    base_penalty = min(5, max(1, int(estimated_hours / 6)))
-    penalty = base_penalty * 3
-    profile.points = max(0, profile.points - penalty)
-    return profile
+    async def join(self) -> None:
+        """投入済みのジョブがすべて書き込まれるまで待つ"""
+        await self._queue.join()
+
+    async def stop(self) -> None:
+        # 生成が終わった瞬間の cancel は wait_for に握りつぶされることがある (Python 3.11)。
+        # その場合もワーカーが次のジョブを待たずに抜けるよう、先にフラグを立てる
+        self._stopping = True
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 残りは生成せず定型文で確定させる（pending のまま残さない）
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            await self._store(job, COMPLETION_FALLBACK_COMMENT)
+            self._queue.task_done()
+
+    async def recover(self) -> int:
+        """前のプロセスが落ちて pending のまま残ったコメントを積み直す。積めなければ定型文で確定する
+
+        複数ワーカー構成では他のワーカーが生成中の行も拾うが、どちらが書いても同じ扱いなので害はない。
+        """
+        rows = await run_repo(self.pending_source)
+        ranks: dict[str, int] = {}
+        for user_id, task_id, title, self_report in rows:
+            try:
+                if user_id not in ranks:
+                    ranks[user_id] = (await run_repo(self.repo_factory(user_id).get_profile)).rank
+                job = CommentJob(user_id, task_id, title, self_report, ranks[user_id])
+                if not (llm_enabled() and self.running and self.enqueue(job)):
+                    self.stats["fallbacks"] += 1
+                    await self._store(job, "...。" if job.rank == 1 else COMPLETION_FALLBACK_COMMENT)
+                self.stats["recovered"] += 1
+            except Exception as e:
+                log_event(logging.ERROR, "recovering completion comment failed", task_id=task_id, error=repr(e))
+        if rows:
+            log_event(logging.INFO, "recovered pending completion comments", count=len(rows))
+        return len(rows)
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job = await self._queue.get()
+            try:
+                try:
+                    comment = await self._comment_for(job)
+                except asyncio.CancelledError:
+                    # 停止中: 生成を打ち切って定型文で確定
+                    await self._store(job, COMPLETION_FALLBACK_COMMENT)
+                    raise
+                await self._store(job, comment)
+            except Exception as e:
+                log_event(logging.ERROR, "storing completion comment failed", task_id=job.task_id, error=repr(e))
+            finally:
+                self._queue.task_done()
+
+    async def _comment_for(self, job: CommentJob) -> str:
+        if job.rank == 1:
+            return "...。"
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                # 待ち時間の見込みが timeout を超える・ブレーカーが開いている場合は呼ばずに定型文
+                llm_admission.check(budget=self.timeout)
+                comment = await asyncio.wait_for(self.generate(job.title, job.self_report, job.rank), self.timeout)
+                if comment:
+                    return comment
+            except LLMOverloaded as e:
+                log_event(logging.INFO, "completion comment shed", task_id=job.task_id, reason=e.reason)
+                break
+            except Exception as e:
+                log_event(logging.WARNING, "completion comment attempt failed", task_id=job.task_id,
+                          attempt=attempt + 1, error=repr(e))
+        self.stats["fallbacks"] += 1
+        return COMPLETION_FALLBACK_COMMENT
+
+    async def _store(self, job: CommentJob, comment: str) -> None:
+        repo = self.repo_factory(job.user_id)
+        task = await run_repo(repo.set_completion_comment, job.task_id, comment)
+        self.stats["done"] += 1
+        if task is not None:
+            publish_task_event(job.user_id, "task.comment_ready", task)
+
+
+completion_comments = CompletionCommentQueue(
+    workers=settings.COMMENT_WORKERS,
+    maxsize=settings.COMMENT_QUEUE_SIZE,
+    max_attempts=settings.COMMENT_MAX_ATTEMPTS,
+    timeout=settings.LLM_COMPLETE_TIMEOUT,
+    retry_backoff=settings.COMMENT_RETRY_BACKOFF,
+)
+
+
+_comment_recovery_task: Optional[asyncio.Task] = None
+
+
+async def _recover_completion_comments() -> None:
+    try:
+        await completion_comments.recover()
+    except Exception as e:
+        log_event(logging.WARNING, "completion comment recovery failed", error=repr(e))
+
+
+@app.on_event("startup")
+async def _start_completion_comments() -> None:
+    global _comment_recovery_task
+    completion_comments.start()
+    _comment_recovery_task = asyncio.create_task(_recover_completion_comments())
+
+
+@app.on_event("shutdown")
+async def _stop_completion_comments() -> None:
+    if _comment_recovery_task is not None and not _comment_recovery_task.done():
+        _comment_recovery_task.cancel()
+    await completion_comments.stop()
 
 
+# 停止中のワーカーが LLM クライアントを使い終わってから閉じる
+app.add_event_handler("shutdown", _close_llm_client)
 
 
 # ---- API ----
@@ -534,14 +3669,50 @@ def apply_points_on_failure(profile: Profile, task: Task) -> Profile:
 async def propose(req: ProposeRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
     repo = get_repo(x_user_id)
     profile = repo.get_profile()
-    return propose_estimate_and_deadline(req.text, profile.rank)
+    calibration = await estimate_calibrator.get(x_user_id)
+    return await propose_estimate_and_deadline(req.text, profile.rank, user_id=x_user_id, calibration=calibration)
+
+
+@app.post('/tasks/propose/stream')
+async def propose_stream(req: ProposeRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
+    """/tasks/propose と同じ提案を NDJSON で少しずつ返す（1行1イベント）
+
+    {"type": "estimate", "valid": true, "estimate_minutes", "deadline_at", "buffer_minutes", ...}
+    {"type": "comment", "delta": "..."}  ← ai_comment の増分（0回以上）
+    {"type": "done", "proposal": {...}}   ← /tasks/accept にそのまま渡せる
+    入力が拒否された場合は {"type": "error", "status": 400, "detail": "..."} で終わる。
+    """
+    repo = get_repo(x_user_id)
+    profile = repo.get_profile()
+    if llm_enabled() and settings.GIBBERISH_PREFILTER_ENABLED and gibberish_reason(req.text) is not None:
+        raise HTTPException(400, "...何を言っているんですか？")
+    calibration = await estimate_calibrator.get(x_user_id)
+
+    async def lines():
+        async for event in stream_proposal(req.text, profile.rank, x_user_id, calibration):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _accept_audit_payload(task: Task) -> dict:
+    return {
+        "title": task.title,
+        "estimate_minutes": task.estimate_minutes,
+        "deadline_at": _iso(task.deadline_at),
+        "weight": task.weight,
+    }
 
 
 @app.post('/tasks/accept', response_model=Task)
 async def accept(req: TaskProposal, x_user_id: str = Header(default="local", alias="X-User-ID")):
     repo = get_repo(x_user_id)
     active_tasks = repo.get_active_tasks()
-    if len(active_tasks) >= 3:
+    if len(active_tasks) >= MAX_ACTIVE_TASKS:
         raise HTTPException(400, 'タスクは同時に3つまでしか持てません')
     
     # check game over
@@ -560,8 +3731,12 @@ async def accept(req: TaskProposal, x_user_id: str = Header(default="local", ali
         weight=1,
         ai_completion_comment=req.ai_comment
     )
+    estimate_calibrator.accepted(x_user_id, [task])
     try:
         created = repo.add_task(task)
+        overdue_sweeper.schedule(x_user_id, created)
+        publish_task_event(x_user_id, "task.accepted", created)
+        audit_log.record(x_user_id, "task.accepted", created.id, **_accept_audit_payload(created))
         return created
     except Exception as e:
         # Supabaseのトリガーエラーをキャッチ
@@ -584,10 +3759,38 @@ async def extend(req: ExtendRequest, x_user_id: str = Header(default="local", al
     
     task.deadline_at += timedelta(minutes=req.extra_minutes)
     task.extension_used = True
-    updated = repo.update_task(task)
+    try:
+        updated = repo.update_task(task)
+    except TaskNotFound:
+        # 一覧を読んだ後に別のリクエストで消された・確定した
+        raise HTTPException(404, '指定されたタスクが見つかりません')
+    overdue_sweeper.schedule(x_user_id, updated)
+    publish_task_event(x_user_id, "task.extended", updated)
+    audit_log.record(x_user_id, "task.extended", updated.id, extra_minutes=req.extra_minutes,
+                     deadline_at=_iso(updated.deadline_at))
     return updated
 
 
+def _attach_completion_comment(repo: Repo, user_id: str, task: Task, self_report: str, rank: int, defer: bool) -> Task:
+    # AI Comment Generation
+    if rank == 1:
+        return repo.set_completion_comment(task.id, "...。") or task
+    if defer:
+        try:
+            llm_admission.check(user_id)
+        except LLMOverloaded:
+            # ブレーカーが開いている・このユーザーの呼び出しが多すぎる: 定型文で即確定
+            return repo.set_completion_comment(task.id, COMPLETION_FALLBACK_COMMENT) or task
+        job = CommentJob(user_id, task.id, task.title, self_report, rank)
+        if not completion_comments.enqueue(job):
+            # 待ち行列が溢れている: 生成を諦めて定型文で確定
+            return repo.set_completion_comment(task.id, COMPLETION_FALLBACK_COMMENT) or task
+    elif llm_enabled():
+        # LLM はあるがワーカーが動いていない（起動前・停止後・起動失敗）: 誰も生成しないので定型文で確定
+        return repo.set_completion_comment(task.id, COMPLETION_FALLBACK_COMMENT) or task
+    return task
+
+
 @app.post('/tasks/complete', response_model=Task)
 async def complete(req: CompleteRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
     repo = get_repo(x_user_id)
@@ -599,52 +3802,22 @@ async def complete(req: CompleteRequest, x_user_id: str = Header(default="local"
 
     now = req.completed_at or datetime.now(timezone.utc)
 
-    # success
-    remaining = max(0, int((task.deadline_at - now).total_seconds()))
-    profile = apply_points_on_success(repo.get_profile(), task, remaining)
-    repo.set_profile(profile)
-    task.status = TaskStatus.COMPLETED
-    task.completed_at = now
-    task.self_report = req.self_report
-    
-    # AI Comment Generation
-    if profile.rank == 1:
-        task.ai_completion_comment = "...。"
-    elif settings.OPENAI_API_KEY:
-        try:
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            persona = AI_PERSONAS.get(profile.rank, AI_PERSONAS[2])
-            
-            completion_prompt = f"""以下の完了したタスクについて、AIアシスタントとしてねぎらいや評価のコメントを作成してください。
-
-タスク: {task.title}
-完了レポート: {req.self_report}
-
-キャラクター設定:
-{persona['prompt']}
-
-重要:
-- 完了レポートの内容を踏まえて、具体的にコメントしてください
-- タスクの内容や作業の成果について言及してください
-- ポイントや得点については一切言及しないでください
-- 上記のキャラクター設定に基づいた口調で話してください
-- 80文字程度の日本語
-"""
-            completion_response = client.chat.completions.create(
-                model="gpt-5-mini",
-                messages=[
-                    {"role": "system", "content": f"{persona['prompt']} タスク完了に対するコメントを提供してください。ポイントや得点には言及せず、タスク内容と完了レポートに焦点を当ててください。"},
-                    {"role": "user", "content": completion_prompt}
-                ],
-            )
-            task.ai_completion_comment = completion_response.choices[0].message.content
-        except Exception as e:
-            print(f"AI generation failed: {e}")
-            # Fallback
-            task.ai_completion_comment = "タスク完了を確認しました。"
+    # success: 状態遷移と加点を1回でまとめて確定。AIコメントは待たずに「生成中」で返す
+    defer = llm_enabled() and completion_comments.running
+    transition = success_transition(task, now, req.self_report, comment_pending=defer)
+    result = repo.settle_tasks([transition])
+    overdue_sweeper.forget(task.id)
+    if not result.tasks:
+        # 直前にスイーパーが失敗させた等
+        raise HTTPException(404, '指定されたタスクが見つかりません')
+    audit_settlement(x_user_id, result, [transition], "task.completed")
+    estimate_calibrator.observe(x_user_id, result.tasks)
+    task = result.tasks[0]
+    profile = result.profile
 
-    updated = repo.update_task(task)
-    return updated
+    task = _attach_completion_comment(repo, x_user_id, task, req.self_report, profile.rank, defer)
+    publish_settlement(x_user_id, SettleResult(profile=profile, tasks=[task]))
+    return task
 
 
 @app.post('/tasks/withdraw', response_model=Task)
@@ -655,69 +3828,475 @@ async def withdraw(req: WithdrawRequest, x_user_id: str = Header(default="local"
     if not task:
         raise HTTPException(404, '指定されたタスクが見つかりません')
     
-    task.status = TaskStatus.FAILED
-    task.failed_at = datetime.now(timezone.utc)
-    repo.update_task(task)
-    profile = apply_points_on_failure(repo.get_profile(), task)
-    repo.set_profile(profile)
-    return task
+    transition = failure_transition(task, datetime.now(timezone.utc))
+    result = repo.settle_tasks([transition])
+    overdue_sweeper.forget(task.id)
+    if not result.tasks:
+        raise HTTPException(404, '指定されたタスクが見つかりません')
+    audit_settlement(x_user_id, result, [transition], "task.withdrawn")
+    estimate_calibrator.observe(x_user_id, result.tasks)
+    publish_settlement(x_user_id, result)
+    return result.tasks[0]
 
 
-def _check_overdue(repo: Repo) -> List[Task]:
+def _check_overdue(repo: Repo, user_id: str, now: Optional[datetime] = None) -> List[Task]:
     # mark overdue as failed if necessary
     active_tasks = repo.get_active_tasks()
+    now = now or datetime.now(timezone.utc)
+    overdue = [t for t in active_tasks if now > t.deadline_at]
+    if overdue:
+        # まとめて1回で確定。他のワーカーが先に失敗させたタスクは遷移せず、減点も二重にならない
+        transitions = [failure_transition(t, now) for t in overdue]
+        result = repo.settle_tasks(transitions)
+        audit_settlement(user_id, result, transitions, "task.overdue")
+        estimate_calibrator.observe(user_id, result.tasks)
+        publish_settlement(user_id, result)
+    return [t for t in active_tasks if now <= t.deadline_at]
+
+
+# ---- Bulk API ----
+# カレンダー連携や CLI 取り込み向けに、複数件をまとめて処理する。上限チェックや精算は
+# リクエスト全体で1回だけ行い、結果は入力と同じ順に項目ごとに返す（失敗した項目は error）。
+@app.post('/tasks/propose/bulk', response_model=List[BulkProposalResult])
+async def propose_bulk(req: BulkProposeRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
+    repo = get_repo(x_user_id)
+    rank = repo.get_profile().rank
+    calibration = await estimate_calibrator.get(x_user_id)
+
+    async def one(text: str) -> BulkProposalResult:
+        if len(text) < 3:
+            return BulkProposalResult(error='3文字以上で入力してください')
+        try:
+            return BulkProposalResult(proposal=await propose_estimate_and_deadline(
+                text, rank, bulk_estimate_coalescer, user_id=x_user_id, calibration=calibration))
+        except HTTPException as e:
+            return BulkProposalResult(error=e.detail)
+
+    return await asyncio.gather(*[one(text) for text in req.texts])
+
+
+@app.post('/tasks/accept/bulk', response_model=List[BulkTaskResult])
+async def accept_bulk(req: BulkAcceptRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
+    repo = get_repo(x_user_id)
+    free = MAX_ACTIVE_TASKS - len(repo.get_active_tasks())
+    if repo.get_profile().points <= 0:
+        raise HTTPException(400, 'ゲームオーバー状態です。これ以上タスクを受けられません。')
+
     now = datetime.now(timezone.utc)
-    updated = False
-    for task in active_tasks:
-        if now > task.deadline_at:
-            task.status = TaskStatus.FAILED
-            task.failed_at = now
-            repo.update_task(task)
-            profile = apply_points_on_failure(repo.get_profile(), task)
-            repo.set_profile(profile)
-            updated = True
-            
-    if updated:
-        return repo.get_active_tasks()
-    return active_tasks
+    tasks = [
+        Task(
+            id=str(uuid.uuid4()),
+            title=p.title,
+            status=TaskStatus.ACTIVE,
+            estimate_minutes=p.estimate_minutes,
+            created_at=now,
+            deadline_at=p.deadline_at,
+            extension_used=False,
+            weight=1,
+            ai_completion_comment=p.ai_comment,
+        )
+        for p in req.proposals[:max(0, free)]
+    ]
+    estimate_calibrator.accepted(x_user_id, tasks)
+    try:
+        created = repo.add_tasks(tasks)
+    except Exception as e:
+        error_msg = str(e)
+        if 'already has an active task' in error_msg or 'already has 3 active tasks' in error_msg:
+            raise HTTPException(400, '既に3つのタスクが進行中です。データベーストリガーを更新してください。')
+        raise
+    for task in created:
+        overdue_sweeper.schedule(x_user_id, task)
+        publish_task_event(x_user_id, "task.accepted", task)
+        audit_log.record(x_user_id, "task.accepted", task.id, **_accept_audit_payload(task))
 
-@app.get('/tasks/current', response_model=List[Task])
-async def current_task(x_user_id: str = Header(default="local", alias="X-User-ID")):
+    results = [BulkTaskResult(task=task) for task in created]
+    results += [BulkTaskResult(error='タスクは同時に3つまでしか持てません')] * (len(req.proposals) - len(created))
+    return results
+
+
+@app.post('/tasks/complete/bulk', response_model=List[BulkTaskResult])
+async def complete_bulk(req: BulkCompleteRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
     repo = get_repo(x_user_id)
-    return _check_overdue(repo)
+    active = {t.id: t for t in repo.get_active_tasks()}
+    now = datetime.now(timezone.utc)
+    defer = llm_enabled() and completion_comments.running
+    transitions = []
+    for item in req.items:
+        task = active.pop(item.task_id, None)
+        if task is not None:
+            transitions.append(success_transition(task, item.completed_at or now, item.self_report, comment_pending=defer))
+    return _settle_bulk(repo, x_user_id, [item.task_id for item in req.items], transitions,
+                        {item.task_id: item.self_report for item in req.items}, defer)
 
 
-@app.get('/status', response_model=StatusResponse)
-async def status(x_user_id: str = Header(default="local", alias="X-User-ID")):
+@app.post('/tasks/withdraw/bulk', response_model=List[BulkTaskResult])
+async def withdraw_bulk(req: BulkWithdrawRequest, x_user_id: str = Header(default="local", alias="X-User-ID")):
     repo = get_repo(x_user_id)
-    
-    # Run DB queries in parallel
-    import concurrent.futures
-    
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # _check_overdue might update DB, so it should be careful. 
-        # But here we just want to fetch data.
-        # Actually _check_overdue updates tasks, so it might conflict if we fetch profile in parallel?
-        # Supabase handles concurrency, but let's be safe.
-        # Let's run _check_overdue first (it fetches active tasks), then fetch profile and recent in parallel.
-        
-        # 1. Check overdue and get active tasks
-        active_tasks = _check_overdue(repo)
-        
-        # 2. Fetch profile and recent tasks in parallel
-        future_profile = executor.submit(repo.get_profile)
-        future_recent = executor.submit(repo.recent)
-        
-        prof = future_profile.result()
-        recent = future_recent.result()
-    
-    next_th = 10
-    for r in sorted(RANK_THRESHOLDS):
-        th = RANK_THRESHOLDS[r]
-        if prof.points < th:
-            next_th = th
-            break
-            
+    active = {t.id: t for t in repo.get_active_tasks()}
+    now = datetime.now(timezone.utc)
+    transitions = []
+    for task_id in req.task_ids:
+        task = active.pop(task_id, None)
+        if task is not None:
+            transitions.append(failure_transition(task, now))
+    return _settle_bulk(repo, x_user_id, req.task_ids, transitions)
+
+
+def _settle_bulk(
+    repo: Repo,
+    user_id: str,
+    task_ids: List[str],
+    transitions: List[TaskTransition],
+    self_reports: Optional[dict] = None,
+    defer: bool = False,
+) -> List[BulkTaskResult]:
+    settled: dict[str, Task] = {}
+    if transitions:
+        result = repo.settle_tasks(transitions)
+        for tr in transitions:
+            overdue_sweeper.forget(tr.task_id)
+        audit_settlement(user_id, result, transitions, "task.completed" if self_reports is not None else "task.withdrawn")
+        estimate_calibrator.observe(user_id, result.tasks)
+        tasks = result.tasks
+        if self_reports is not None:
+            tasks = [
+                _attach_completion_comment(repo, user_id, t, self_reports[t.id], result.profile.rank, defer)
+                for t in tasks
+            ]
+        settled = {t.id: t for t in tasks}
+        publish_settlement(user_id, SettleResult(profile=result.profile, tasks=tasks))
+    results = []
+    for task_id in task_ids:
+        # 同じ task_id が重複していたら2件目以降は見つからない扱い
+        task = settled.pop(task_id, None)
+        results.append(BulkTaskResult(task=task) if task else BulkTaskResult(error='指定されたタスクが見つかりません'))
+    return results
+
+
+# ---- Overdue sweeper ----
+# 期限切れの判定は読み取り API ではなくバックグラウンドで行う。
+# 全ユーザーのアクティブタスクを期限順のヒープで保持し、期限を過ぎたものをまとめて失敗させる。
+_DEADLINE_PAGE = 1000
+
+
+def load_active_deadlines(until: datetime) -> List[Tuple[datetime, str, str]]:
+    """until までに期限を迎えるアクティブタスクを (deadline_at, user_id, task_id) で返す"""
+    entries = []
+    client = get_supabase_client()
+    if client is not None:
+        # PostgREST は1回の応答を max-rows で黙って切るので、ページに分けて読む
+        start = 0
+        while True:
+            res = (
+                client.table('tasks')
+                .select('id,user_id,deadline_at')
+                .eq('status', TaskStatus.ACTIVE)
+                .lte('deadline_at', until.isoformat())
+                .order('deadline_at')
+                .order('id')
+                .range(start, start + _DEADLINE_PAGE - 1)
+                .execute()
+            )
+            page = res.data or []
+            entries += [
+                (datetime.fromisoformat(r['deadline_at'].replace('Z', '+00:00')), r['user_id'], r['id'])
+                for r in page
+            ]
+            if len(page) < _DEADLINE_PAGE:
+                break
+            start += _DEADLINE_PAGE
+    # ローカルストアは "local" ユーザーと、Supabase 未設定時の全ユーザーを持つ
+    db = get_local_db()
+    with db.lock:
+        rows = db.conn.execute(
+            "select id, user_id, deadline_at from tasks where status = 'ACTIVE' and deadline_at <= ? order by deadline_at",
+            (_iso(until),),
+        ).fetchall()
+    entries += [
+        (datetime.fromisoformat(r['deadline_at']), r['user_id'], r['id'])
+        for r in rows
+        if client is None or r['user_id'] == "local"
+    ]
+    return entries
+
+
+class OverdueSweeper:
+    def __init__(
+        self,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+        source: Callable[[datetime], List[Tuple[datetime, str, str]]] = load_active_deadlines,
+        repo_factory: Callable[[str], Repo] = lambda user_id: get_repo(user_id),
+        batch_size: int = 200,
+        resync_interval: float = 300.0,
+    ):
+        self.clock = clock
+        self.source = source
+        self.repo_factory = repo_factory
+        self.batch_size = batch_size
+        self.resync_interval = resync_interval
+        self._heap: List[Tuple[datetime, str, str]] = []
+        # task_id -> 現在有効な期限（延長・完了で古くなったヒープ要素は取り出し時に捨てる）
+        self._deadlines: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._last_resync: Optional[datetime] = None
+        # run() 中だけ True。止まっている（OVERDUE_SWEEPER_ENABLED=false の API ワーカーなど）間は
+        # 誰も取り出さないので schedule() で積まない
+        self.running = False
+
+    def schedule(self, user_id: str, task: Task) -> None:
+        if not self.running or task.status != TaskStatus.ACTIVE:
+            return
+        with self._lock:
+            self._deadlines[task.id] = task.deadline_at
+            heapq.heappush(self._heap, (task.deadline_at, user_id, task.id))
+            self._compact()
+
+    def forget(self, task_id: str) -> None:
+        with self._lock:
+            self._deadlines.pop(task_id, None)
+            self._compact()
+
+    def _compact(self) -> None:
+        # 完了・延長で古くなった要素は取り出し時に捨てるが、期限が先のものはそれまで残るので、
+        # 有効な件数の倍を超えたら作り直す（呼び出し側で _lock を持っていること）
+        if len(self._heap) <= 2 * len(self._deadlines) + 64:
+            return
+        self._heap = [e for e in self._heap if self._deadlines.get(e[2]) == e[0]]
+        heapq.heapify(self._heap)
+
+    def resync(self) -> None:
+        """他ワーカーで受理されたタスクも拾えるよう、DB から期限の近いタスクを読み直す"""
+        now = self.clock()
+        horizon = now + timedelta(seconds=self.resync_interval * 2)
+        entries = self.source(horizon)
+        with self._lock:
+            for deadline, user_id, task_id in entries:
+                if self._deadlines.get(task_id) != deadline:
+                    self._deadlines[task_id] = deadline
+                    heapq.heappush(self._heap, (deadline, user_id, task_id))
+        self._last_resync = now
+
+    def _pop_expired(self, now: datetime) -> dict[str, List[str]]:
+        due: dict[str, List[str]] = {}
+        count = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] < now and count < self.batch_size:
+                deadline, user_id, task_id = heapq.heappop(self._heap)
+                if self._deadlines.get(task_id) != deadline:
+                    continue
+                del self._deadlines[task_id]
+                due.setdefault(user_id, []).append(task_id)
+                count += 1
+        return due
+
+    def sweep_once(self) -> int:
+        """期限切れタスクを1バッチ分 (最大 batch_size 件) 処理し、取り出したタスク数を返す"""
+        now = self.clock()
+        if self._last_resync is None or (now - self._last_resync).total_seconds() >= self.resync_interval:
+            self.resync()
+        due = self._pop_expired(now)
+        for user_id in due:
+            # ユーザー単位で現在の DB の状態から判定し直す（延長済みなら失敗させない）
+            _check_overdue(self.repo_factory(user_id), user_id, now)
+        return sum(len(task_ids) for task_ids in due.values())
+
+    async def run(self, interval: float) -> None:
+        self.running = True
+        try:
+            while True:
+                try:
+                    # バッチが埋まった間はまだ残っているので、interval を待たずに続けて処理する
+                    while True:
+                        tasks = await asyncio.to_thread(self.sweep_once)
+                        if tasks:
+                            log_event(logging.INFO, "settled overdue tasks", tasks=tasks)
+                        if tasks < self.batch_size:
+                            break
+                except Exception as e:
+                    log_event(logging.ERROR, "overdue sweep failed", error=repr(e))
+                await asyncio.sleep(interval)
+        finally:
+            self.running = False
+            with self._lock:
+                self._heap.clear()
+                self._deadlines.clear()
+            self._last_resync = None
+
+
+overdue_sweeper = OverdueSweeper(
+    batch_size=settings.OVERDUE_SWEEP_BATCH,
+    resync_interval=settings.OVERDUE_RESYNC_INTERVAL,
+)
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def _start_overdue_sweeper() -> None:
+    global _sweeper_task
+    if settings.OVERDUE_SWEEPER_ENABLED:
+        _sweeper_task = asyncio.create_task(overdue_sweeper.run(settings.OVERDUE_SWEEP_INTERVAL))
+
+
+@app.on_event("shutdown")
+async def _stop_overdue_sweeper() -> None:
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+
+
+# ---- Startup warmup ----
+# openai / supabase は初回利用時に import するので、何もしなければ最初の propose・status が
+# import・クライアント作成・TCP/TLS 接続の分だけ遅れる。WARMUP_ON_STARTUP=true なら起動直後に
+# バックグラウンドでそれらを先に済ませる。重い import は別スレッドで行い、イベントループは塞がない。
+_warmup_task: Optional[asyncio.Task] = None
+warmup_seconds: dict = {}  # ステップ名 -> 所要秒数
+
+
+async def _warmup_step(name: str, step: Callable[[], Awaitable[None]]) -> None:
+    started = time.perf_counter()
+    try:
+        await step()
+    except Exception as e:
+        log_event(logging.WARNING, "warmup step failed", step=name, error=repr(e))
+    warmup_seconds[name] = round(time.perf_counter() - started, 4)
+
+
+async def _warm_local_db() -> None:
+    await asyncio.to_thread(get_local_db)
+
+
+async def _warm_supabase() -> None:
+    if not (settings.SUPABASE_URL and settings.SUPABASE_SERVICE_KEY and SUPABASE_AVAILABLE):
+        return
+    await asyncio.to_thread(_lazy_import, "supabase")
+    client = get_supabase_client()
+    if client is None:
+        return
+    # 同期クライアント（書き込み系）と非同期 PostgREST（読み取り系）の両方の接続を張っておく
+    await run_repo(lambda: client.table('profiles').select('user_id').limit(1).execute())
+    if HTTPX_AVAILABLE:
+        await get_postgrest_http().get('/profiles', params={'select': 'user_id', 'limit': '1'})
+
+
+async def _warm_llm() -> None:
+    if not llm_enabled():
+        return
+    await asyncio.to_thread(_lazy_import, "openai")
+    client = get_llm_client()
+    # 応答の中身は問わない（401/404 でも接続はプールに残る）
+    await _llm_http.get(f"{client.base_url}models", headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"})
+
+
+async def _warm_numpy() -> None:
+    if estimate_calibrator.enabled:
+        await asyncio.to_thread(_lazy_import, "numpy")
+
+
+async def warmup() -> dict:
+    started = time.perf_counter()
+    await asyncio.gather(
+        _warmup_step("local_db", _warm_local_db),
+        _warmup_step("supabase", _warm_supabase),
+        _warmup_step("llm", _warm_llm),
+        _warmup_step("numpy", _warm_numpy),
+    )
+    warmup_seconds["total"] = round(time.perf_counter() - started, 4)
+    log_event(logging.INFO, "warmup done", **warmup_seconds)
+    return warmup_seconds
+
+
+@app.on_event("startup")
+async def _start_warmup() -> None:
+    global _warmup_task
+    if settings.WARMUP_ON_STARTUP:
+        _warmup_task = asyncio.create_task(warmup())
+
+
+@app.on_event("shutdown")
+async def _stop_warmup() -> None:
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+
+
+@app.on_event("shutdown")
+async def _close_db_pools() -> None:
+    # 他の停止処理（完了コメントの書き込みなど）がプールを使い終えてから閉じる
+    global _db_executor, _postgrest_http
+    if _postgrest_http is not None:
+        await _postgrest_http.aclose()
+        _postgrest_http = None
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=False)
+        _db_executor = None
+
+
+@app.on_event("shutdown")
+async def _close_local_db() -> None:
+    global _local_db
+    if _local_db is not None:
+        _local_db.close()
+        _local_db = None
+
+
+# ---- Conditional GET ----
+# ユーザーごとの変更バージョンを ETag にし、変わっていなければ tasks を読まずに 304 を返す
+def _etag(user_id: str, version: Optional[int]) -> Optional[str]:
+    if version is None:
+        return None
+    return f'W/"{user_id}-{version}"'
+
+
+def _etag_version(user_id: str, if_none_match: Optional[str]) -> Optional[int]:
+    """If-None-Match に含まれるこのユーザーの ETag からバージョンを取り出す"""
+    prefix = f'W/"{user_id}-'
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix):-1].isdigit():
+            return int(tag[len(prefix):-1])
+    return None
+
+
+def _not_modified(etag: Optional[str], if_none_match: Optional[str]) -> bool:
+    if etag is None or not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+@app.get('/tasks/current', response_model=List[Task])
+async def current_task(
+    response: Response,
+    x_user_id: str = Header(default="local", alias="X-User-ID"),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+):
+    repo = get_async_repo(x_user_id)
+    etag = _etag(x_user_id, await repo.change_version())
+    if _not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
+    return await repo.get_active_tasks()
+
+
+@app.get('/status', response_model=StatusResponse)
+async def status(
+    response: Response,
+    x_user_id: str = Header(default="local", alias="X-User-ID"),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+):
+    repo = get_async_repo(x_user_id)
+    # 期限切れの失敗処理は OverdueSweeper が行うので、ここは読み取りのみ（Supabase なら user_status の1往復）
+    snap = await repo.status_snapshot(_etag_version(x_user_id, if_none_match))
+    etag = _etag(x_user_id, snap.version)
+    if snap.not_modified or _not_modified(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
+
+    prof = snap.profile
+    active_tasks = snap.active_tasks
+    recent = snap.recent_tasks
+    next_th = snap.next_threshold
+
     ai_line = ""  # Frontend handles AI comments with _rankLine
     # game over condition: points <= 0
     game_over = prof.points <= 0
@@ -731,6 +4310,62 @@ async def status(x_user_id: str = Header(default="local", alias="X-User-ID")):
     )
 
 
+@app.get('/metrics')
+async def metrics():
+    """Prometheus テキスト形式の計測値"""
+    lines: List[str] = []
+    for hist in (http_request_seconds, http_request_db_round_trips, repo_call_seconds, llm_call_seconds):
+        lines += hist.render()
+
+    def metric(name: str, kind: str, help: str, value: float) -> None:
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+
+    pool = llm_pool_stats()
+    metric("obey_llm_pool_requests_total", "counter", "LLM HTTP requests.", pool["requests"])
+    metric("obey_llm_pool_hits_total", "counter", "LLM HTTP requests that reused a pooled connection.", pool["hits"])
+    metric("obey_llm_pool_misses_total", "counter", "LLM HTTP requests that opened a new connection.", pool["misses"])
+    cache = proposal_cache.stats()
+    metric("obey_proposal_cache_hits_total", "counter", "Proposal cache hits (valid results).", cache["hits"])
+    metric("obey_proposal_cache_negative_hits_total", "counter", "Proposal cache hits (rejected inputs).", cache["negative_hits"])
+    metric("obey_proposal_cache_misses_total", "counter", "Proposal cache misses.", cache["misses"])
+    metric("obey_proposal_cache_entries", "gauge", "Entries held in the proposal cache.", cache["size"])
+    metric("obey_estimate_proposals_total", "counter", "Proposals sent to the estimate coalescer.",
+           estimate_coalescer.stats["proposals"] + bulk_estimate_coalescer.stats["proposals"])
+    metric("obey_estimate_llm_calls_total", "counter", "LLM calls made by the estimate coalescer.",
+           estimate_coalescer.stats["calls"] + bulk_estimate_coalescer.stats["calls"])
+    metric("obey_event_subscribers", "gauge", "Open GET /events streams.", event_broker.subscriber_count())
+    metric("obey_completion_comment_queue_depth", "gauge", "Completion comments waiting for a worker.",
+           completion_comments.qsize())
+    for key in ("done", "retries", "fallbacks", "rejected"):
+        metric(f"obey_completion_comment_{key}_total", "counter", f"Completion comment jobs: {key}.",
+               completion_comments.stats[key])
+    metric("obey_llm_in_flight", "gauge", "LLM calls holding an admission slot.", llm_admission.in_flight)
+    metric("obey_llm_queue_depth", "gauge", "LLM calls waiting for an admission slot.", llm_admission.waiting)
+    metric("obey_llm_predicted_wait_seconds", "gauge", "Predicted wait for a new LLM call.",
+           round(llm_admission.predicted_wait(), 3))
+    lines += ["# HELP obey_llm_shed_total LLM calls answered by the heuristic or fallback path.",
+              "# TYPE obey_llm_shed_total counter"]
+    lines += [f'obey_llm_shed_total{{reason="{r}"}} {llm_admission.stats["shed_" + r]}' for r in LLMAdmission.SHED_REASONS]
+    metric("obey_llm_breaker_trips_total", "counter", "Times the LLM circuit breaker opened.",
+           llm_admission.stats["breaker_trips"])
+    state = llm_admission.breaker_state
+    lines += ["# HELP obey_llm_breaker_state LLM circuit breaker state (1 for the current state).",
+              "# TYPE obey_llm_breaker_state gauge"]
+    lines += [f'obey_llm_breaker_state{{state="{s}"}} {int(s == state)}' for s in ("closed", "open", "half_open")]
+    metric("obey_audit_pending", "gauge", "Audit events waiting to be flushed to task_logs.", audit_log.pending())
+    for key in ("recorded", "written", "dropped", "write_errors"):
+        metric(f"obey_audit_{key}_total", "counter", f"Audit events: {key}.", audit_log.stats[key])
+    metric("obey_calibration_users", "gauge", "Users with estimate calibration statistics in memory.",
+           len(estimate_calibrator))
+    for key in ("loads", "load_errors", "observed", "corrections", "matches"):
+        metric(f"obey_calibration_{key}_total", "counter", f"Estimate calibration: {key}.", estimate_calibrator.stats[key])
+    if warmup_seconds:
+        lines += ["# HELP obey_warmup_seconds Time spent in each startup warmup step.",
+                  "# TYPE obey_warmup_seconds gauge"]
+        lines += [f'obey_warmup_seconds{{step="{k}"}} {v}' for k, v in warmup_seconds.items()]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 @app.get('/health')
 async def health():
     return {"ok": True}
@@ -741,4 +4376,31 @@ async def gameover_ack(x_user_id: str = Header(default="local", alias="X-User-ID
     # purge all data and reset profile
     repo = get_repo(x_user_id)
     repo.clear_all()
+    estimate_calibrator.forget(x_user_id)
+    profile = repo.get_profile()
+    audit_log.record(x_user_id, "profile.reset", None, points=profile.points)
+    event_broker.publish(x_user_id, "profile.points", {"profile": profile.model_dump(), "rank": profile.rank})
     return {"ok": True}
+
+
+if __name__ == '__main__':
+    # API とは別プロセスでスイーパーだけを動かす場合:
+    #   OVERDUE_SWEEPER_ENABLED=false uvicorn main:app  （API ワーカー）
+    #   python main.py sweep                              （スイーパーワーカー）
+    # 既存のタスクから見積もり補正の統計を作り、ユーザーごとの要約を1行1 JSON で出す:
+    #   python main.py calibrate
+    import sys
+    if sys.argv[1:] == ['calibrate']:
+        print(json.dumps(backfill_calibration()))
+        for user_id, calibration in estimate_calibrator.items():
+            print(json.dumps({"user_id": user_id, **calibration.summary()}, ensure_ascii=False))
+    elif sys.argv[1:] == ['sweep']:
+        async def sweep_worker() -> None:
+            # 期限切れ失敗の監査ログもこのプロセスから書き出す
+            audit_log.start()
+            try:
+                await overdue_sweeper.run(settings.OVERDUE_SWEEP_INTERVAL)
+            finally:
+                await audit_log.stop()
+
+        asyncio.run(sweep_worker())
@@ -0,0 +1,45 @@
+"""テスト共通の設定
+
+main は import 時に Settings を読むので、環境変数はここで先に決めておく（一時ディレクトリの
+SQLite、LLM・Supabase なし、バックグラウンドのスイーパーなし）。
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["OVERDUE_SWEEPER_ENABLED"] = "false"
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["SUPABASE_URL"] = ""
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def repo():
+    repo = main.get_repo("local")
+    repo.clear_all()
+    yield repo
+    # shutdown フックで接続が閉じられているので開き直す
+    main.get_repo("local").clear_all()
+
+
+@pytest.fixture
+async def client(repo):
+    """startup / shutdown フックを通したアプリにつながるクライアント"""
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            yield client
+    finally:
+        await main.app.router.shutdown()
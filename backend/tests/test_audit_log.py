@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def sink():
+    return main.MemoryAuditSink()
+
+
+def audit_log(sink, **kwargs) -> main.AuditLog:
+    kwargs = {"capacity": 100, "batch_size": 10, "flush_interval": 60.0, **kwargs}
+    return main.AuditLog(sink_factory=lambda user_id: sink, **kwargs)
+
+
+class CountingSink(main.MemoryAuditSink):
+    """1回の write で受け取った件数を記録する"""
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = []
+
+    def write(self, events) -> None:
+        self.sizes.append(len(events))
+        super().write(events)
+
+
+async def test_events_are_written_in_batches():
+    sink = CountingSink()
+    log = audit_log(sink)
+    log.start()
+    try:
+        for i in range(25):
+            log.record("local", "task.accepted", f"t{i}")
+        # batch_size に達したので flush_interval (60秒) を待たずに書かれる
+        for _ in range(100):
+            if log.pending() == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert sink.sizes == [10, 10, 5]
+        assert [e.task_id for e in sink.events] == [f"t{i}" for i in range(25)]
+    finally:
+        await log.stop()
+    assert log.stats["written"] == 25 and log.stats["dropped"] == 0
+
+
+async def test_small_batches_wait_for_the_interval(sink):
+    log = audit_log(sink)
+    log.start()
+    try:
+        log.record("local", "task.accepted", "t1")
+        await asyncio.sleep(0.05)
+        assert sink.events == [] and log.pending() == 1
+    finally:
+        await log.stop()
+
+
+async def test_stop_flushes_remaining_events(sink):
+    log = audit_log(sink)
+    log.start()
+    for i in range(3):
+        log.record("local", "task.completed", f"t{i}", points_delta=1)
+    assert sink.events == []
+    await log.stop()
+    assert [e.task_id for e in sink.events] == ["t0", "t1", "t2"]
+    assert sink.events[0].payload == {"points_delta": 1}
+    assert log.pending() == 0 and not log.running
+
+
+async def test_overflow_drops_the_oldest_events(sink):
+    log = audit_log(sink, capacity=5)
+    for i in range(8):
+        log.record("local", "task.accepted", f"t{i}")
+    assert log.stats["dropped"] == 3 and log.pending() == 5
+    assert await log.flush() == 5
+    assert [e.task_id for e in sink.events] == ["t3", "t4", "t5", "t6", "t7"]
+
+
+async def test_disabled_log_records_nothing(sink):
+    log = audit_log(sink, enabled=False)
+    log.start()
+    log.record("local", "task.accepted", "t1")
+    await log.stop()
+    assert sink.events == [] and log.stats["recorded"] == 0
+
+
+async def test_api_events_reach_task_logs_on_shutdown(repo):
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            res = await client.post("/tasks/accept", json={
+                "title": "レポートを書く",
+                "estimate_minutes": 60,
+                "deadline_at": (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat(),
+            })
+            assert res.status_code == 200, res.text
+            task_id = res.json()["id"]
+    finally:
+        await main.app.router.shutdown()
+
+    db = main.get_local_db()
+    with db.lock:
+        rows = db.conn.execute("select event_type from task_logs where task_id = ?", (task_id,)).fetchall()
+    assert [r["event_type"] for r in rows] == ["task.accepted"]
+
+
+async def test_points_event_records_the_clamped_delta(repo, sink, monkeypatch):
+    log = audit_log(sink)
+    monkeypatch.setattr(main, "audit_log", log)
+    repo.set_profile(main.Profile(user_id="local", points=main.MAX_POINTS - 1))
+    now = datetime.now(timezone.utc)
+    task = repo.add_task(main.Task(id="t1", title="レポートを書く", estimate_minutes=60, created_at=now,
+                                   deadline_at=now + timedelta(hours=2)))
+    transition = main.success_transition(task, now, "書き終えた")
+    assert transition.points_delta > 1
+
+    result = repo.settle_tasks([transition])
+    main.audit_settlement("local", result, [transition], "task.completed")
+    await log.flush()
+    points = next(e for e in sink.events if e.event_type == "points.changed")
+    assert points.payload["points"] == main.MAX_POINTS
+    assert points.payload["delta"] == 1
@@ -0,0 +1,134 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+pytest.importorskip("numpy")
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def finished(task_id: str, title: str, estimate: int, actual) -> main.Task:
+    failed = actual is None
+    return main.Task(
+        id=task_id, title=title, status=main.TaskStatus.FAILED if failed else main.TaskStatus.COMPLETED,
+        estimate_minutes=estimate, created_at=NOW, deadline_at=NOW + timedelta(hours=30),
+        completed_at=None if failed else NOW + timedelta(minutes=actual),
+        failed_at=NOW + timedelta(hours=30) if failed else None,
+    )
+
+
+def calibration_of(*tasks: main.Task) -> main.UserCalibration:
+    return main.build_calibrations(main._calibration_row("u", t) for t in tasks)["u"]
+
+
+def test_no_correction_below_min_samples():
+    # 90分の見積もりを1分で終えた1件だけでは補正しない
+    calibration = calibration_of(finished("a", "メール返信", 90, 1))
+    assert calibration.correction(90) == (1.0, 0.0)
+    proposal = main.proposal_from_estimate("メール返信", 3, {"valid": True, "estimate_hours": 1.5}, calibration)
+    assert proposal.estimate_minutes == 90
+
+
+def test_per_sample_ratio_is_clipped():
+    calibration = calibration_of(finished("a", "メール返信", 90, 1))
+    low, high = main._CALIBRATION_RATIO_CLIP
+    assert calibration.log_ratio.sum() == pytest.approx(math.log(low))
+    calibration = calibration_of(finished("a", "メール返信", 30, 600))
+    assert calibration.log_ratio.sum() == pytest.approx(math.log(high))
+
+
+def test_bucket_prior_excludes_its_own_samples():
+    # 1〜2h の帯だけ 2 倍かかる履歴: 事前分布は他の帯（なし = 補正なし）なので、件数分だけ 1 倍へ寄る
+    tasks = [finished(str(i), f"作業 {i}", 90, 180) for i in range(5)]
+    calibration = calibration_of(*tasks)
+    prior = main.settings.CALIBRATION_PRIOR
+    expected = math.exp(5 * math.log(2) / (5 + prior))
+    assert calibration.correction(90)[0] == pytest.approx(expected)
+    # 他の帯の事前分布は、その1〜2h の帯の実績から作る
+    assert calibration.correction(300)[0] == pytest.approx(math.exp(5 * math.log(2) / (5 + prior)))
+
+
+def test_failure_rate_needs_min_samples():
+    calibration = calibration_of(finished("a", "作業", 90, None))
+    assert calibration.correction(90)[1] == 0.0
+    calibration = calibration_of(*[finished(str(i), "作業", 90, None) for i in range(5)])
+    assert calibration.correction(90)[1] == pytest.approx(5 / (5 + main.settings.CALIBRATION_PRIOR))
+
+
+def test_proposal_from_estimate_has_no_side_effects():
+    calibrator = main.EstimateCalibrator()
+    calibration = calibration_of(*[finished(str(i), f"作業 {i}", 90, 180) for i in range(5)])
+    calibrator.put("u", calibration)
+    main.proposal_from_estimate("新しい作業", 3, {"valid": True, "estimate_hours": 1.5}, calibration)
+    assert calibration.offered == {}
+    assert calibrator.stats["corrections"] == 0
+
+
+def test_accept_stores_the_model_estimate_on_the_task():
+    calibrator = main.EstimateCalibrator()
+    calibrator.put("u", main.UserCalibration.empty())
+    calibrator.offered("u", "皿洗い", 60)
+    assert calibrator.stats["corrections"] == 1
+
+    first = finished("first", "皿洗い", 120, 60)
+    second = finished("second", "皿洗い", 120, 60)
+    calibrator.accepted("u", [first])
+    calibrator.accepted("u", [second])
+    assert first.ai_estimate_minutes == 60 and second.ai_estimate_minutes is None
+
+    # 提案元のタスクはモデルの見積もり (60分) と、記録のないタスクは保存された見積もり (120分) と比べる
+    calibration = calibrator.peek("u")
+    calibrator.observe("u", [second])
+    assert calibration.done[main._calibration_bucket(120)] == 1
+    calibrator.observe("u", [first])
+    assert calibration.done[main._calibration_bucket(60)] == 1
+
+
+def test_matched_proposal_skips_bucket_statistics():
+    calibrator = main.EstimateCalibrator()
+    calibrator.put("u", main.UserCalibration.empty())
+    calibrator.offered("u", "皿洗い", None)
+    assert calibrator.stats["matches"] == 1
+    task = finished("t", "皿洗い", 40, 40)
+    calibrator.accepted("u", [task])
+    assert task.ai_estimate_minutes == 0
+    calibrator.observe("u", [task])
+    calibration = calibrator.peek("u")
+    assert calibration.total_done == 0
+    assert calibration.texts["皿洗い"].done == 1
+
+    # 行から作り直しても同じ
+    rebuilt = calibration_of(task)
+    assert rebuilt.total_done == 0 and rebuilt.texts["皿洗い"].done == 1
+
+
+def test_factor_is_stable_across_rebuilds():
+    # モデルは毎回 60 分と見積もり、実際はいつも 120 分かかるユーザー。
+    # 毎回行から作り直しても（再起動・TTL 切れ・別ワーカー）、倍率は 2 倍へ近づくだけで戻らない
+    tasks = []
+    ratios = []
+    for i in range(30):
+        calibration = calibration_of(*tasks) if tasks else main.UserCalibration.empty()
+        ratio = calibration.correction(60)[0]
+        ratios.append(ratio)
+        task = finished(str(i), f"作業 {i}", round(60 * ratio), 120)
+        task.ai_estimate_minutes = 60
+        tasks.insert(0, task)
+    assert ratios == sorted(ratios)
+    assert ratios[-1] > 1.8
+
+
+def test_rebuilt_rows_compare_with_the_model_estimate(repo):
+    # 保存される見積もりは補正後の 120 分、モデルの見積もりは 60 分で、実際は 120 分かかった
+    for i in range(5):
+        task = repo.add_task(main.Task(id=str(i), title=f"作業 {i}", estimate_minutes=120, created_at=NOW,
+                                       deadline_at=NOW + timedelta(hours=3), ai_estimate_minutes=60))
+        repo.settle_tasks([main.success_transition(task, NOW + timedelta(minutes=120), "終わった")])
+    user = main.load_user_calibration("local")
+    everyone = main.build_calibrations(main.load_finished_rows(100))["local"]
+    for calibration in (user, everyone):
+        assert calibration.done[main._calibration_bucket(60)] == 5
+        assert calibration.log_ratio.sum() == pytest.approx(5 * math.log(2))
@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+class StubLLM:
+    """gate が開くまで返さない完了コメント生成"""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.calls = []
+
+    async def __call__(self, title: str, self_report, rank: int) -> str:
+        self.calls.append(title)
+        await self.gate.wait()
+        return f"{title}、よくやった"
+
+
+@pytest.fixture
+def llm():
+    return StubLLM()
+
+
+@pytest.fixture
+def comments(llm, monkeypatch):
+    queue = main.CompletionCommentQueue(generate=llm, workers=1, maxsize=2, retry_backoff=0)
+    monkeypatch.setattr(main, "completion_comments", queue)
+    monkeypatch.setattr(main, "llm_enabled", lambda: True)
+    return queue
+
+
+@pytest.fixture
+async def client(comments, client):
+    # 差し替えたキューで startup フックが動くように comments を先に用意する
+    yield client
+
+
+async def accept(client) -> dict:
+    res = await client.post("/tasks/accept", json={
+        "title": "レポートを書く",
+        "estimate_minutes": 60,
+        "deadline_at": (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat(),
+    })
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+async def complete(client, task_id: str) -> dict:
+    res = await client.post("/tasks/complete", json={"task_id": task_id, "self_report": "書き終えた"})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def stored(repo, task_id: str) -> main.Task:
+    return next(t for t in repo.recent() if t.id == task_id)
+
+
+async def test_comment_is_filled_in_after_completion(client, repo, comments, llm):
+    task = await complete(client, (await accept(client))["id"])
+    assert task["ai_completion_comment_pending"] is True
+    assert task["ai_completion_comment"] is None
+
+    llm.gate.set()
+    await comments.join()
+    filled = stored(repo, task["id"])
+    assert filled.ai_completion_comment == "レポートを書く、よくやった"
+    assert filled.ai_completion_comment_pending is False
+    assert comments.stats["done"] == 1
+
+
+async def test_full_queue_falls_back_immediately(client, repo, comments, llm):
+    # ワーカーは1件目で gate 待ち、残りで待ち行列を埋める
+    while comments.enqueue(main.CommentJob("local", "missing", "埋め草", None, 3)):
+        await asyncio.sleep(0.01)
+
+    task = await complete(client, (await accept(client))["id"])
+    assert task["ai_completion_comment"] == main.COMPLETION_FALLBACK_COMMENT
+    assert task["ai_completion_comment_pending"] is False
+    assert comments.stats["rejected"] >= 1
+    assert "レポートを書く" not in llm.calls
+    llm.gate.set()
+
+
+async def test_shutdown_stores_fallback_for_unfinished_jobs(repo, comments, llm):
+    await main.app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            task = await complete(client, (await accept(client))["id"])
+            assert task["ai_completion_comment_pending"] is True
+    finally:
+        # gate は開けないまま止める: 生成中のジョブは打ち切られて定型文になる
+        await main.app.router.shutdown()
+
+    stopped = stored(main.get_repo("local"), task["id"])
+    assert stopped.ai_completion_comment == main.COMPLETION_FALLBACK_COMMENT
+    assert stopped.ai_completion_comment_pending is False
+
+
+def pending_task(repo) -> main.Task:
+    now = datetime.now(timezone.utc)
+    task = repo.add_task(main.Task(id="stuck", title="部屋の掃除", estimate_minutes=60, created_at=now,
+                                   deadline_at=now + timedelta(hours=2)))
+    repo.settle_tasks([main.success_transition(task, now, "片付けた", comment_pending=True)])
+    assert stored(repo, task.id).ai_completion_comment_pending is True
+    return task
+
+
+async def test_recover_requeues_pending_comments(repo, comments, llm):
+    task = pending_task(repo)
+    comments.start()
+    try:
+        llm.gate.set()
+        assert await comments.recover() == 1
+        await comments.join()
+    finally:
+        await comments.stop()
+    recovered = stored(repo, task.id)
+    assert recovered.ai_completion_comment == "部屋の掃除、よくやった"
+    assert recovered.ai_completion_comment_pending is False
+    assert comments.stats["recovered"] == 1
+
+
+async def test_recover_without_llm_stores_fallback(repo, comments, llm, monkeypatch):
+    monkeypatch.setattr(main, "llm_enabled", lambda: False)
+    task = pending_task(repo)
+    assert await comments.recover() == 1
+    recovered = stored(repo, task.id)
+    assert recovered.ai_completion_comment == main.COMPLETION_FALLBACK_COMMENT
+    assert recovered.ai_completion_comment_pending is False
+    assert llm.calls == []
+
+
+async def test_recovery_runs_on_startup(repo, comments, llm):
+    task = pending_task(repo)
+    llm.gate.set()
+    await main.app.router.startup()
+    try:
+        await main._comment_recovery_task
+        await comments.join()
+    finally:
+        await main.app.router.shutdown()
+    assert stored(main.get_repo("local"), task.id).ai_completion_comment == "部屋の掃除、よくやった"
+
+
+async def test_stopped_queue_stores_fallback(client, repo, comments, llm):
+    # LLM は使えるがワーカーが止まっている: 生成中のまま残さず定型文で確定する
+    await comments.stop()
+    task = await complete(client, (await accept(client))["id"])
+    assert task["ai_completion_comment"] == main.COMPLETION_FALLBACK_COMMENT
+    assert task["ai_completion_comment_pending"] is False
+    assert llm.calls == []
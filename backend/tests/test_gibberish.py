@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+import main
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "gibberish_corpus.jsonl")
+
+
+def load_corpus() -> list:
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_corpus_has_no_false_positives():
+    # 正常な入力を弾くと LLM にも聞かずに拒否してしまうので、コーパスの正常な入力は1件も弾かない
+    rejected = [(r["text"], main.gibberish_reason(r["text"])) for r in load_corpus() if not r["gibberish"]]
+    assert [r for r in rejected if r[1] is not None] == []
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("ママとママ友", None),
+    ("ああああああ", "repeated_char"),
+    ("wwwwwwww", "repeated_char"),
+    ("pppppp qqqq", "repeated_pattern"),
+    ("あいあいあいあい", "repeated_pattern"),
+    ("asdfghjkl", "random_latin"),
+])
+def test_reasons(text, reason):
+    assert main.gibberish_reason(text) == reason
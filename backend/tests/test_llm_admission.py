@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class SlowLLM:
+    """gate が開くまで返さない LLM 呼び出し。fail に例外を入れるとそれを投げる"""
+
+    def __init__(self, admission: main.LLMAdmission):
+        self.admission = admission
+        self.gate = asyncio.Event()
+        self.fail = None
+
+    async def __call__(self) -> str:
+        async with self.admission.slot():
+            await self.gate.wait()
+            if self.fail is not None:
+                raise self.fail
+            return "ok"
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+async def wait_until(condition) -> None:
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+async def test_sheds_when_predicted_wait_exceeds_the_budget():
+    admission = main.LLMAdmission(max_concurrency=2, queue_budget=1.0)
+    llm = SlowLLM(admission)
+    calls = [asyncio.ensure_future(llm()) for _ in range(2)]
+    await wait_until(lambda: admission.in_flight == 2)
+    # 枠は埋まっているが、1件分の待ち (1秒 / 2枠) は予算内
+    assert admission.predicted_wait() == pytest.approx(0.5)
+    admission.check(budget=1.0)
+
+    calls += [asyncio.ensure_future(llm()) for _ in range(2)]
+    await wait_until(lambda: admission.waiting == 2)
+    assert admission.predicted_wait() == pytest.approx(1.5)
+    with pytest.raises(main.LLMOverloaded) as excinfo:
+        admission.check(budget=1.0)
+    assert excinfo.value.reason == "queue" and admission.stats["shed_queue"] == 1
+
+    llm.gate.set()
+    assert await asyncio.gather(*calls) == ["ok"] * 4
+    assert admission.in_flight == 0 and admission.predicted_wait() == 0.0
+
+
+async def test_per_user_token_bucket(clock):
+    admission = main.LLMAdmission(user_rate=1.0, user_burst=2, clock=clock)
+    admission.check("heavy")
+    admission.check("heavy")
+    with pytest.raises(main.LLMOverloaded) as excinfo:
+        admission.check("heavy")
+    assert excinfo.value.reason == "user_rate" and admission.stats["shed_user_rate"] == 1
+    # 他のユーザーのバケットは別
+    admission.check("other")
+
+    clock.advance(1.0)
+    admission.check("heavy")
+    with pytest.raises(main.LLMOverloaded):
+        admission.check("heavy")
+
+
+async def test_breaker_opens_after_consecutive_timeouts(clock):
+    admission = main.LLMAdmission(breaker_threshold=3, breaker_cooldown=30.0, clock=clock)
+    llm = SlowLLM(admission)
+    llm.gate.set()
+
+    llm.fail = asyncio.TimeoutError()
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            await llm()
+    # 成功を挟むと数え直し、タイムアウト以外の失敗は数えない
+    llm.fail = None
+    await llm()
+    llm.fail = ValueError("bad request")
+    with pytest.raises(ValueError):
+        await llm()
+    llm.fail = asyncio.TimeoutError()
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            await llm()
+    assert admission.breaker_state == "closed"
+
+    with pytest.raises(asyncio.TimeoutError):
+        await llm()
+    assert admission.breaker_state == "open" and admission.stats["breaker_trips"] == 1
+    with pytest.raises(main.LLMOverloaded) as excinfo:
+        admission.check()
+    assert excinfo.value.reason == "breaker"
+    with pytest.raises(main.LLMOverloaded):
+        await llm()
+    assert admission.stats["shed_breaker"] == 2
+
+
+async def test_half_open_probe_closes_the_breaker(clock):
+    admission = main.LLMAdmission(breaker_threshold=1, breaker_cooldown=30.0, clock=clock)
+    llm = SlowLLM(admission)
+    llm.gate.set()
+    llm.fail = asyncio.TimeoutError()
+    with pytest.raises(asyncio.TimeoutError):
+        await llm()
+    assert admission.breaker_state == "open"
+
+    clock.advance(30.0)
+    assert admission.breaker_state == "half_open"
+    # 半開では1件だけ通し、その結果が出るまで他は断る
+    llm.gate.clear()
+    llm.fail = None
+    probe = asyncio.ensure_future(llm())
+    await wait_until(lambda: admission.in_flight == 1)
+    with pytest.raises(main.LLMOverloaded):
+        admission.check()
+    llm.gate.set()
+    assert await probe == "ok"
+    assert admission.breaker_state == "closed"
+    admission.check()
+
+
+async def test_failed_probe_reopens_the_breaker(clock):
+    admission = main.LLMAdmission(breaker_threshold=1, breaker_cooldown=30.0, clock=clock)
+    llm = SlowLLM(admission)
+    llm.gate.set()
+    admission._trip()
+    clock.advance(30.0)
+    # 半開の試行はタイムアウト以外の失敗でも開き直す
+    llm.fail = ValueError("still broken")
+    assert admission.breaker_state == "half_open"
+    with pytest.raises(ValueError):
+        await llm()
+    assert admission.breaker_state == "open"
+    assert admission.stats["breaker_trips"] == 2
+
+
+async def test_shed_proposal_uses_the_heuristic(client, monkeypatch):
+    admission = main.LLMAdmission(breaker_threshold=1)
+    admission._trip()
+    monkeypatch.setattr(main, "llm_admission", admission)
+    monkeypatch.setattr(main, "llm_enabled", lambda: True)
+    monkeypatch.setattr(main, "proposal_cache", main.ProposalCache(maxsize=10, ttl=60, negative_ttl=60))
+
+    async def unreachable(text, rank):
+        raise AssertionError("LLM must not be called while the breaker is open")
+
+    monkeypatch.setattr(main.estimate_coalescer, "estimate", unreachable)
+    text = "資料を整理する"
+    res = await client.post("/tasks/propose", json={"text": text})
+    assert res.status_code == 200, res.text
+    assert res.json()["estimate_minutes"] == main.heuristic_proposal(text).estimate_minutes
+    assert admission.stats["shed_breaker"] == 1
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+
+def test_ensured_users_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.settings, "ENSURED_USER_CACHE_SIZE", 2)
+    db = main.LocalDB(os.path.join(tmp_path, "local.db"))
+    try:
+        for i in range(5):
+            db.ensure_user(f"u{i}")
+        assert len(db._ensured._entries) == 2
+        assert "u4" in db._ensured and "u0" not in db._ensured
+        with db.lock:
+            assert db.conn.execute("select count(*) from profiles").fetchone()[0] == 5
+        # 押し出されたユーザーをもう一度確認しても行は増えない
+        db.ensure_user("u0")
+        with db.lock:
+            assert db.conn.execute("select count(*) from profiles").fetchone()[0] == 5
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = main.LocalDB(os.path.join(tmp_path, "local.db"))
+    yield db
+    db.close()
+
+
+def add_task(repo: main.SqliteRepo, task_id: str) -> main.Task:
+    now = datetime.now(timezone.utc)
+    return repo.add_task(main.Task(id=task_id, title="レポートを書く", estimate_minutes=60, created_at=now,
+                                   deadline_at=now + timedelta(hours=2)))
+
+
+def test_settle_recreates_a_missing_profile(db):
+    repo = main.SqliteRepo(db, "u1")
+    task = add_task(repo, "t1")
+    # ensure 済みと覚えたまま、プロフィール行（とタスク）が消えた
+    with db.lock:
+        db.conn.execute("delete from profiles where user_id = 'u1'")
+    result = repo.settle_tasks([main.failure_transition(task, datetime.now(timezone.utc))])
+    assert result.tasks == [] and result.profile.points == 10 and result.points_delta == 0
+    assert repo.get_profile().points == 10
+    with db.lock:
+        assert db.conn.execute("select count(*) from profiles where user_id = 'u1'").fetchone()[0] == 1
+
+
+def test_clear_all_is_atomic(db):
+    repo = main.SqliteRepo(db, "u1")
+    add_task(repo, "t1")
+    repo.set_profile(main.Profile(user_id="u1", points=30))
+    with db.lock:
+        db.conn.execute(
+            "create trigger fail_reset before update of points on profiles begin select raise(abort, 'boom'); end"
+        )
+    with pytest.raises(sqlite3.IntegrityError):
+        repo.clear_all()
+    # 点数の書き戻しに失敗したら、タスクの削除も取り消される
+    assert [t.id for t in repo.get_active_tasks()] == ["t1"]
+    assert repo.get_profile().points == 30
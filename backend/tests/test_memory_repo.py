@@ -0,0 +1,56 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+
+def make_task(i: int) -> main.Task:
+    now = datetime.now(timezone.utc)
+    return main.Task(id=f"t{i}", title=f"作業 {i}", estimate_minutes=60, created_at=now + timedelta(seconds=i),
+                     deadline_at=now + timedelta(hours=2))
+
+
+class ClearingStore(main.MemoryStore):
+    """索引を読んだ直後に、別スレッドの clear_user を割り込ませる"""
+
+    def __init__(self):
+        super().__init__()
+        self.clearers = []
+
+    def _interleave(self, user_id: str) -> None:
+        t = threading.Thread(target=self.clear_user, args=(user_id,))
+        self.clearers.append(t)
+        t.start()
+        # 読み取り側がロックを持っていれば clear_user はここでは終わらない
+        t.join(timeout=0.2)
+
+    def ids(self, user_id, status):
+        ids = super().ids(user_id, status)
+        self._interleave(user_id)
+        return ids
+
+    def recent_ids(self, user_id, k):
+        ids = super().recent_ids(user_id, k)
+        self._interleave(user_id)
+        return ids
+
+
+@pytest.mark.parametrize("read", ["get_active_tasks", "recent"])
+def test_read_is_consistent_with_concurrent_clear(read):
+    store = ClearingStore()
+    repo = main.MemoryRepo(store, "u")
+    repo.add_tasks([make_task(i) for i in range(3)])
+    tasks = getattr(repo, read)()
+    for t in store.clearers:
+        t.join()
+    assert len(tasks) == 3
+    assert repo.get_active_tasks() == []
+
+
+def test_reads_return_tasks_in_order():
+    repo = main.MemoryRepo(main.MemoryStore(), "u")
+    repo.add_tasks([make_task(i) for i in range(12)])
+    assert len(repo.get_active_tasks()) == 12
+    assert [t.id for t in repo.recent()] == [f"t{i}" for i in range(11, 1, -1)]
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime.now(timezone.utc)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, **kwargs) -> None:
+        self.now += timedelta(**kwargs)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def sweeper(clock, monkeypatch):
+    sweeper = main.OverdueSweeper(clock=clock)
+    # run() の中と同じ状態にして、ループの代わりに sweep_once をテストから呼ぶ
+    sweeper.running = True
+    monkeypatch.setattr(main, "overdue_sweeper", sweeper)
+    return sweeper
+
+
+async def accept(client, clock, hours: float, estimate_minutes: int = 720) -> dict:
+    res = await client.post("/tasks/accept", json={
+        "title": "レポートを書く",
+        "estimate_minutes": estimate_minutes,
+        "deadline_at": (clock.now + timedelta(hours=hours)).isoformat(),
+    })
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+async def test_accept_deadline_sweep_fails_task_and_deducts_points(client, repo, clock, sweeper):
+    task = await accept(client, clock, hours=1)
+    assert len(sweeper._heap) == 1
+
+    clock.advance(minutes=59)
+    assert sweeper.sweep_once() == 0
+    assert [t.id for t in repo.get_active_tasks()] == [task["id"]]
+
+    clock.advance(minutes=2)
+    assert sweeper.sweep_once() == 1
+    assert repo.get_active_tasks() == []
+    [failed] = repo.recent()
+    assert failed.status == main.TaskStatus.FAILED
+    # 12時間の見積もりの失敗は 2 * 3 = 6 点の減点
+    assert repo.get_profile().points == 10 - 6
+    assert sweeper._heap == [] and sweeper._deadlines == {}
+
+    clock.advance(hours=1)
+    assert sweeper.sweep_once() == 0
+    assert repo.get_profile().points == 4
+
+
+async def test_extended_task_is_not_failed_at_the_old_deadline(client, repo, clock, sweeper):
+    task = await accept(client, clock, hours=1)
+    res = await client.post("/tasks/extend", json={"task_id": task["id"], "extra_minutes": 60})
+    assert res.status_code == 200, res.text
+
+    clock.advance(minutes=90)
+    assert sweeper.sweep_once() == 0
+    assert [t.id for t in repo.get_active_tasks()] == [task["id"]]
+
+    clock.advance(minutes=31)
+    assert sweeper.sweep_once() == 1
+    assert repo.get_active_tasks() == []
+
+
+async def test_completed_task_is_forgotten(client, repo, clock, sweeper):
+    task = await accept(client, clock, hours=1)
+    res = await client.post("/tasks/complete", json={"task_id": task["id"], "self_report": "書き終えた"})
+    assert res.status_code == 200, res.text
+    assert sweeper._deadlines == {}
+
+    clock.advance(hours=2)
+    assert sweeper.sweep_once() == 0
+    assert repo.get_profile().points > 10
+
+
+async def test_schedule_is_a_noop_when_not_running(client, clock, sweeper):
+    sweeper.running = False
+    await accept(client, clock, hours=1)
+    assert sweeper._heap == [] and sweeper._deadlines == {}
+
+
+def test_forgotten_entries_are_compacted(clock):
+    sweeper = main.OverdueSweeper(clock=clock)
+    sweeper.running = True
+    for i in range(1000):
+        task = main.Task(id=f"t{i}", title="作業", estimate_minutes=60, created_at=clock.now,
+                         deadline_at=clock.now + timedelta(days=1, minutes=i))
+        sweeper.schedule("local", task)
+        sweeper.forget(task.id)
+    assert sweeper._deadlines == {}
+    assert len(sweeper._heap) <= 64
+
+
+async def test_run_keeps_sweeping_while_batches_are_full(clock, monkeypatch):
+    expired = [(clock.now - timedelta(minutes=i + 1), f"u{i}", f"t{i}") for i in range(5)]
+    swept = []
+    monkeypatch.setattr(main, "_check_overdue", lambda repo, user_id, now: swept.append(user_id))
+    sweeper = main.OverdueSweeper(clock=clock, source=lambda until: expired, repo_factory=lambda user_id: None,
+                                  batch_size=2)
+    # interval は1時間: 2件ずつのバッチが埋まっている間は待たずに続けるので、すぐに全件が終わる
+    runner = asyncio.ensure_future(sweeper.run(3600))
+    try:
+        for _ in range(100):
+            if len(swept) == 5:
+                break
+            await asyncio.sleep(0.01)
+        assert sorted(swept) == [f"u{i}" for i in range(5)]
+    finally:
+        runner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await runner
+
+
+class FakeTasksQuery:
+    """PostgREST のように、range がなければ max_rows 件で黙って切る tasks テーブル"""
+
+    def __init__(self, rows: list, max_rows: int):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.ranges = []
+        self._range = None
+
+    def table(self, name):
+        self._range = None
+        return self
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def lte(self, *args):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        self.ranges.append(self._range)
+        return self
+
+    def execute(self):
+        start, end = self._range or (0, len(self.rows) - 1)
+        data = self.rows[start:min(end + 1, start + self.max_rows)]
+        return type("Response", (), {"data": data})()
+
+
+def test_resync_reads_every_page(repo, clock, monkeypatch):
+    rows = [{"id": f"t{i}", "user_id": f"u{i}", "deadline_at": (clock.now + timedelta(minutes=i)).isoformat()}
+            for i in range(5)]
+    fake = FakeTasksQuery(rows, max_rows=2)
+    monkeypatch.setattr(main, "get_supabase_client", lambda: fake)
+    monkeypatch.setattr(main, "_DEADLINE_PAGE", 2)
+    entries = main.load_active_deadlines(clock.now + timedelta(hours=1))
+    assert [task_id for _, _, task_id in entries] == [f"t{i}" for i in range(5)]
+    assert fake.ranges == [(0, 1), (2, 3), (4, 5)]
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+import main
+
+
+def cache_at(path, **kwargs) -> main.ProposalCache:
+    kwargs = {"maxsize": 2, "ttl": 3600, "negative_ttl": 60, **kwargs}
+    return main.ProposalCache(path=str(path), **kwargs)
+
+
+def disk_keys(cache: main.ProposalCache) -> list:
+    return [r[0] for r in cache._disk.execute("select key from proposal_cache order by key")]
+
+
+def test_disk_loads_respect_maxsize(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first = cache_at(path, maxsize=10)
+    for key in ("a", "b", "c"):
+        first.put(key, {"valid": True, "estimate_hours": 1})
+
+    # 再起動後、ディスクから読み戻してもメモリ側は maxsize を超えない
+    second = cache_at(path)
+    for key in ("a", "b", "c"):
+        assert second.get(key) is not None
+    assert list(second._entries) == ["b", "c"]
+
+
+def test_expired_rows_are_purged_on_write(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(main.time, "time", lambda: now)
+    cache = cache_at(tmp_path / "cache.sqlite3", purge_interval=600)
+    cache.put("rejected", {"valid": False})
+    cache.put("ok", {"valid": True, "estimate_hours": 1})
+
+    # 拒否は 60 秒で切れるが、purge_interval が過ぎるまでは消しに行かない
+    now += 120
+    cache.put("other", {"valid": True, "estimate_hours": 2})
+    assert disk_keys(cache) == ["ok", "other", "rejected"]
+
+    now += 600
+    cache.put("later", {"valid": True, "estimate_hours": 3})
+    assert disk_keys(cache) == ["later", "ok", "other"]
+
+
+def test_expired_disk_row_is_a_miss(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(main.time, "time", lambda: now)
+    path = tmp_path / "cache.sqlite3"
+    cache_at(path).put("rejected", {"valid": False})
+
+    now += 120
+    reopened = cache_at(path)
+    assert reopened.get("rejected") is None
+    assert "rejected" not in reopened._entries
+
+
+@pytest.mark.parametrize("result, cacheable", [
+    ({"valid": True, "estimate_hours": 2, "comment": "了解"}, True),
+    ({"valid": True, "estimate_hours": 1.5}, True),
+    ({"valid": False, "comment": "意味がわかりません"}, True),
+    ({"valid": True, "estimate_hours": "2"}, False),
+    ({"valid": True, "comment": "了解"}, False),
+    ({"valid": True, "estimate_hours": True}, False),
+    ({"estimate_hours": 2}, False),
+])
+def test_cacheable_estimate(result, cacheable):
+    assert main.cacheable_estimate(result) is cacheable
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    cache = main.ProposalCache(maxsize=100, ttl=3600, negative_ttl=3600)
+    monkeypatch.setattr(main, "proposal_cache", cache)
+    monkeypatch.setattr(main, "llm_enabled", lambda: True)
+    return cache
+
+
+@pytest.mark.anyio
+async def test_malformed_answer_is_not_cached(client, empty_cache, monkeypatch):
+    calls = []
+
+    async def estimate(text, rank):
+        calls.append(text)
+        return {"valid": True, "estimate_hours": "2", "comment": "了解"}
+
+    monkeypatch.setattr(main.estimate_coalescer, "estimate", estimate)
+    for _ in range(2):
+        res = await client.post("/tasks/propose", json={"text": "レポートを書く"})
+        assert res.status_code == 200, res.text
+    # 2回目もキャッシュではなくモデルに聞き直す
+    assert len(calls) == 2 and empty_cache.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_malformed_stream_answer_is_not_cached(client, empty_cache, monkeypatch):
+    async def chat_stream(*args, **kwargs):
+        yield json.dumps({"valid": True, "comment": "了解"}, ensure_ascii=False)
+
+    monkeypatch.setattr(main, "llm_chat_stream", chat_stream)
+    res = await client.post("/tasks/propose/stream", json={"text": "レポートを書く"})
+    assert res.status_code == 200, res.text
+    assert json.loads(res.text.splitlines()[-1])["type"] == "done"
+    assert empty_cache.stats()["size"] == 0
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+TEXT = "レポートを書く"
+
+
+@pytest.fixture
+def cached(monkeypatch, repo):
+    """LLM の回答をキャッシュに置いて、ストリームを呼ばずに最後の組み立てだけ通す"""
+    cache = main.ProposalCache(maxsize=100, ttl=3600, negative_ttl=3600)
+    monkeypatch.setattr(main, "proposal_cache", cache)
+    monkeypatch.setattr(main, "llm_enabled", lambda: True)
+    rank = repo.get_profile().rank
+
+    def put(result: dict) -> None:
+        cache.put(cache.key(TEXT, rank), result)
+    return put
+
+
+async def stream(client) -> list:
+    res = await client.post("/tasks/propose/stream", json={"text": TEXT})
+    assert res.status_code == 200, res.text
+    return [json.loads(line) for line in res.text.splitlines()]
+
+
+async def test_malformed_result_falls_back_like_the_non_stream_path(client, cached):
+    cached({"valid": True, "estimate_hours": "2", "comment": "了解"})
+    events = await stream(client)
+    assert [e["type"] for e in events] == ["estimate", "comment", "done"]
+    done = events[-1]["proposal"]
+
+    res = await client.post("/tasks/propose", json={"text": TEXT})
+    assert res.status_code == 200, res.text
+    plain = res.json()
+    assert done["estimate_minutes"] == plain["estimate_minutes"] == main._fallback_proposal(TEXT).estimate_minutes
+    assert done["buffer_minutes"] == plain["buffer_minutes"]
+
+
+async def test_rejected_input_ends_with_error(client, cached):
+    cached({"valid": False, "comment": "意味がわかりません"})
+    events = await stream(client)
+    assert events == [{"type": "error", "status": 400, "detail": "意味がわかりません"}]
+
+
+async def test_cached_result_streams_estimate_comment_done(client, cached):
+    cached({"valid": True, "estimate_hours": 2, "comment": "了解"})
+    events = await stream(client)
+    assert [e["type"] for e in events] == ["estimate", "comment", "done"]
+    assert events[-1]["proposal"]["estimate_minutes"] == 120
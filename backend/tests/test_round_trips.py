@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+class RoundTrips:
+    """http_request_db_round_trips の代わりに、リクエストごとの往復数を記録する"""
+
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, value, method, route) -> None:
+        self.observed.append((method, route, value))
+
+    def render(self) -> list:
+        return []
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    recorder = RoundTrips()
+    monkeypatch.setattr(main, "http_request_db_round_trips", recorder)
+    return recorder
+
+
+async def test_local_status_round_trips(client, round_trips):
+    res = await client.get("/status")
+    assert res.status_code == 200
+    # 変更バージョン + アクティブタスク・プロフィール・最近のタスク
+    assert round_trips.observed == [("GET", "/status", 4)]
+
+    res = await client.get("/status", headers={"If-None-Match": res.headers["ETag"]})
+    assert res.status_code == 304
+    assert round_trips.observed[-1] == ("GET", "/status", 1)
+
+
+def user_status_payload(user_id: str, version: int) -> dict:
+    now = datetime.now(timezone.utc)
+    task = {
+        "id": "t1", "title": "レポートを書く", "status": main.TaskStatus.ACTIVE, "estimate_minutes": 60,
+        "created_at": now.isoformat(), "deadline_at": (now + timedelta(hours=2)).isoformat(),
+        "extension_used": False, "weight": 1,
+    }
+    return {
+        "profile": {"user_id": user_id, "points": 25, "change_version": version},
+        "active_tasks": [task],
+        "recent_tasks": [task],
+        "next_threshold": 40,
+    }
+
+
+@pytest.fixture
+def supabase_requests(monkeypatch):
+    """/status を Supabase (PostgREST) 経由で読ませ、発行された HTTP リクエストを記録する"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.method, request.url.path))
+        if request.url.path != "/rest/v1/rpc/user_status":
+            return httpx.Response(500)
+        body = request.read().decode()
+        if '"p_if_version":7' in body.replace(" ", ""):
+            return httpx.Response(200, json={"profile": {"user_id": "u-1", "points": 25, "change_version": 7},
+                                             "not_modified": True})
+        return httpx.Response(200, json=user_status_payload("u-1", 7))
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://supabase/rest/v1")
+    monkeypatch.setattr(
+        main, "get_async_repo", lambda user_id: main.AsyncSupabaseRepo(main.SupabaseRepo(None, user_id), http)
+    )
+    return requests
+
+
+async def test_supabase_status_is_one_round_trip(client, round_trips, supabase_requests):
+    res = await client.get("/status", headers={"X-User-ID": "u-1"})
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["profile"]["points"] == 25 and len(body["active_tasks"]) == 1
+    assert res.headers["ETag"] == 'W/"u-1-7"'
+    assert supabase_requests == [("POST", "/rest/v1/rpc/user_status")]
+    assert round_trips.observed == [("GET", "/status", 1)]
+
+    res = await client.get("/status", headers={"X-User-ID": "u-1", "If-None-Match": 'W/"u-1-7"'})
+    assert res.status_code == 304
+    assert len(supabase_requests) == 2
+    assert round_trips.observed[-1] == ("GET", "/status", 1)
+
+
+def test_local_clear_all_counts_its_round_trips(repo):
+    stats = main.RequestStats()
+    token = main._request_stats.set(stats)
+    try:
+        repo.clear_all()
+    finally:
+        main._request_stats.reset(token)
+    assert stats.db_round_trips == 2
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+def new_task(task_id: str) -> main.Task:
+    now = datetime.now(timezone.utc)
+    return main.Task(id=task_id, title="レポートを書く", estimate_minutes=60, created_at=now,
+                     deadline_at=now + timedelta(hours=2))
+
+
+@pytest.mark.parametrize("make_repo", [
+    lambda: main.get_repo("local"),
+    lambda: main.MemoryRepo(main.MemoryStore(), "u-1"),
+])
+def test_update_of_missing_task_raises_domain_error(repo, make_repo):
+    with pytest.raises(main.TaskNotFound) as excinfo:
+        make_repo().update_task(new_task("missing"))
+    assert excinfo.value.task_id == "missing"
+
+
+async def test_extend_maps_task_not_found_to_404(client, repo, monkeypatch):
+    task = repo.add_task(new_task("t1"))
+
+    def vanished(self, task):
+        raise main.TaskNotFound(task.id)
+
+    monkeypatch.setattr(type(repo), "update_task", vanished)
+    res = await client.post("/tasks/extend", json={"task_id": task.id, "extra_minutes": 30})
+    assert res.status_code == 404
+    assert res.json() == {"detail": "指定されたタスクが見つかりません"}
@@ -0,0 +1,6 @@
+-- 見積もり補正用: 補正前のモデルの見積もり（分）をタスクの行に残す
+-- estimate_minutes は補正後の値なので、実績と比べるとユーザーごとの倍率が 1 倍へ戻ってしまう。
+-- 受理時に main.py が提案時の元の見積もりを入れる。0 は実績から作った提案（見積もり帯の統計に入れない）、
+-- NULL は不明（このマイグレーション以前の行）で、その場合は estimate_minutes と比べる。
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS ai_estimate_minutes int;
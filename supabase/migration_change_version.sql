@@ -0,0 +1,33 @@
+-- ユーザーごとの変更バージョン（GET /status, /tasks/current の ETag に使う）
+-- tasks の追加・更新・削除、profiles.points の変更のたびに profiles.change_version を進める。
+-- バージョンが変わっていなければ API は tasks を読まずに 304 を返す。
+
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS change_version bigint NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_profile_version_from_task() RETURNS trigger AS $$
+BEGIN
+  UPDATE profiles
+    SET change_version = change_version + 1
+    WHERE user_id = coalesce(new.user_id, old.user_id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_profile_version_on_points() RETURNS trigger AS $$
+BEGIN
+  IF new.points IS DISTINCT FROM old.points THEN
+    new.change_version := old.change_version + 1;
+  END IF;
+  RETURN new;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tasks_bump_version ON tasks;
+CREATE TRIGGER trg_tasks_bump_version
+  AFTER INSERT OR UPDATE OR DELETE ON tasks
+  FOR EACH ROW EXECUTE PROCEDURE bump_profile_version_from_task();
+
+DROP TRIGGER IF EXISTS trg_profiles_bump_version ON profiles;
+CREATE TRIGGER trg_profiles_bump_version
+  BEFORE UPDATE ON profiles
+  FOR EACH ROW EXECUTE PROCEDURE bump_profile_version_on_points();
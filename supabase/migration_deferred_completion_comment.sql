@@ -0,0 +1,47 @@
+-- 完了コメントをバックグラウンドで生成するための列と settle_tasks の更新
+-- complete はタスクとポイントだけを確定して即座に返し、AIコメントは後からワーカーが書き込む。
+-- 生成待ちのタスクは ai_completion_comment_pending = true（コメントは NULL）。
+--
+-- p_transitions の各要素に "comment_pending": true があれば、遷移と同時に
+-- 受理時のコメントを消して pending を立てる。
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS ai_completion_comment text;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS ai_completion_comment_pending boolean NOT NULL DEFAULT false;
+
+CREATE OR REPLACE FUNCTION settle_tasks(p_user_id uuid, p_transitions jsonb, p_max_points int DEFAULT 120)
+RETURNS jsonb AS $$
+DECLARE
+  tr jsonb;
+  settled_row tasks%ROWTYPE;
+  settled jsonb := '[]'::jsonb;
+  new_points int;
+BEGIN
+  -- 同一ユーザーの精算を直列化する
+  SELECT points INTO new_points FROM profiles WHERE user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile not found for user %', p_user_id;
+  END IF;
+
+  FOR tr IN SELECT * FROM jsonb_array_elements(p_transitions) LOOP
+    UPDATE tasks SET
+      status = tr->>'status',
+      completed_at = coalesce((tr->>'completed_at')::timestamptz, completed_at),
+      failed_at = coalesce((tr->>'failed_at')::timestamptz, failed_at),
+      self_report = coalesce(tr->>'self_report', self_report),
+      ai_completion_comment = CASE WHEN (tr->>'comment_pending')::boolean THEN NULL ELSE ai_completion_comment END,
+      ai_completion_comment_pending = ai_completion_comment_pending OR coalesce((tr->>'comment_pending')::boolean, false)
+    WHERE id = (tr->>'task_id')::uuid
+      AND user_id = p_user_id
+      AND status = 'ACTIVE'
+    RETURNING * INTO settled_row;
+
+    IF FOUND THEN
+      new_points := least(p_max_points, greatest(0, new_points + (tr->>'points_delta')::int));
+      settled := settled || jsonb_build_array(to_jsonb(settled_row));
+    END IF;
+  END LOOP;
+
+  UPDATE profiles SET points = new_points WHERE user_id = p_user_id;
+  RETURN jsonb_build_object('points', new_points, 'tasks', settled);
+END;
+$$ LANGUAGE plpgsql;
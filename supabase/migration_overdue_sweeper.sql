@@ -0,0 +1,4 @@
+-- 期限切れスイーパー用: 全ユーザーのアクティブタスクを期限順に引くためのインデックス
+-- (OverdueSweeper.resync が status = 'ACTIVE' and deadline_at <= now + horizon を期限順に読む)
+
+CREATE INDEX IF NOT EXISTS tasks_active_deadline_idx ON tasks(deadline_at) WHERE status = 'ACTIVE';
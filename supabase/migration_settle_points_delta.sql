@@ -0,0 +1,44 @@
+-- settle_tasks が実際に反映したポイントの増減を返すようにする
+-- 遷移ごとの points_delta は 0〜p_max_points に丸めながら足すので、その合計とは一致しないことがある。
+-- 監査ログの points.changed は丸めた後の増減を記録する（main.py の audit_settlement）。
+-- 戻り値: {"points": 新しいポイント, "points_delta": 新しいポイント - 精算前のポイント, "tasks": [...]}
+
+CREATE OR REPLACE FUNCTION settle_tasks(p_user_id uuid, p_transitions jsonb, p_max_points int DEFAULT 120)
+RETURNS jsonb AS $$
+DECLARE
+  tr jsonb;
+  settled_row tasks%ROWTYPE;
+  settled jsonb := '[]'::jsonb;
+  old_points int;
+  new_points int;
+BEGIN
+  -- 同一ユーザーの精算を直列化する
+  SELECT points INTO old_points FROM profiles WHERE user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile not found for user %', p_user_id;
+  END IF;
+  new_points := old_points;
+
+  FOR tr IN SELECT * FROM jsonb_array_elements(p_transitions) LOOP
+    UPDATE tasks SET
+      status = tr->>'status',
+      completed_at = coalesce((tr->>'completed_at')::timestamptz, completed_at),
+      failed_at = coalesce((tr->>'failed_at')::timestamptz, failed_at),
+      self_report = coalesce(tr->>'self_report', self_report),
+      ai_completion_comment = CASE WHEN (tr->>'comment_pending')::boolean THEN NULL ELSE ai_completion_comment END,
+      ai_completion_comment_pending = ai_completion_comment_pending OR coalesce((tr->>'comment_pending')::boolean, false)
+    WHERE id = (tr->>'task_id')::uuid
+      AND user_id = p_user_id
+      AND status = 'ACTIVE'
+    RETURNING * INTO settled_row;
+
+    IF FOUND THEN
+      new_points := least(p_max_points, greatest(0, new_points + (tr->>'points_delta')::int));
+      settled := settled || jsonb_build_array(to_jsonb(settled_row));
+    END IF;
+  END LOOP;
+
+  UPDATE profiles SET points = new_points WHERE user_id = p_user_id;
+  RETURN jsonb_build_object('points', new_points, 'points_delta', new_points - old_points, 'tasks', settled);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,44 @@
+-- タスクの状態遷移とポイント加減算を1トランザクションで行う関数
+-- complete / withdraw / 期限切れ処理が get_profile → 計算 → set_profile と
+-- 読み書きを分けていたため、同時に走ると加減算が失われていた。
+--
+-- p_transitions: [{"task_id", "status", "points_delta", "completed_at", "failed_at", "self_report"}, ...]
+-- status = 'ACTIVE' のタスクだけが遷移し、遷移したタスクの points_delta だけが
+-- 0〜p_max_points の範囲に丸めながら順に加算される（既に処理済みのタスクは無視）。
+-- 戻り値: {"points": 新しいポイント, "tasks": [遷移したタスク行, ...]}
+
+CREATE OR REPLACE FUNCTION settle_tasks(p_user_id uuid, p_transitions jsonb, p_max_points int DEFAULT 120)
+RETURNS jsonb AS $$
+DECLARE
+  tr jsonb;
+  settled_row tasks%ROWTYPE;
+  settled jsonb := '[]'::jsonb;
+  new_points int;
+BEGIN
+  -- 同一ユーザーの精算を直列化する
+  SELECT points INTO new_points FROM profiles WHERE user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile not found for user %', p_user_id;
+  END IF;
+
+  FOR tr IN SELECT * FROM jsonb_array_elements(p_transitions) LOOP
+    UPDATE tasks SET
+      status = tr->>'status',
+      completed_at = coalesce((tr->>'completed_at')::timestamptz, completed_at),
+      failed_at = coalesce((tr->>'failed_at')::timestamptz, failed_at),
+      self_report = coalesce(tr->>'self_report', self_report)
+    WHERE id = (tr->>'task_id')::uuid
+      AND user_id = p_user_id
+      AND status = 'ACTIVE'
+    RETURNING * INTO settled_row;
+
+    IF FOUND THEN
+      new_points := least(p_max_points, greatest(0, new_points + (tr->>'points_delta')::int));
+      settled := settled || jsonb_build_array(to_jsonb(settled_row));
+    END IF;
+  END LOOP;
+
+  UPDATE profiles SET points = new_points WHERE user_id = p_user_id;
+  RETURN jsonb_build_object('points', new_points, 'tasks', settled);
+END;
+$$ LANGUAGE plpgsql;
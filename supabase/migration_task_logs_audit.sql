@@ -0,0 +1,14 @@
+-- 監査ログ (task_logs) をアプリから書き込むための変更
+-- main.py の AuditLog が受理・延長・完了・取り下げ・期限切れ失敗・ポイント増減・
+-- ゲームオーバー後のリセットをまとめて複数行 insert する。
+--
+-- - ポイント増減とリセットはタスクに紐付かないので task_id を NULL 可にする
+-- - リセットでタスクを削除しても履歴を残すため、tasks への外部キー（on delete cascade）を外す。
+--   書き込みはバックグラウンドで遅れて行われるので、その間に消えたタスクで insert が失敗しないためでもある
+-- - ユーザーごとに時系列で読むためのインデックス
+
+ALTER TABLE task_logs ALTER COLUMN task_id DROP NOT NULL;
+ALTER TABLE task_logs DROP CONSTRAINT IF EXISTS task_logs_task_id_fkey;
+
+CREATE INDEX IF NOT EXISTS task_logs_user_created_idx ON task_logs(user_id, created_at desc);
+CREATE INDEX IF NOT EXISTS task_logs_task_idx ON task_logs(task_id) WHERE task_id IS NOT NULL;
@@ -0,0 +1,49 @@
+-- GET /status 用のスナップショットを1回の往復で返す関数
+-- プロフィールの確認（無ければ作成）、ACTIVE タスク、直近のタスク、次のしきい値を
+-- 1つの JSON にまとめる。ACTIVE は tasks_user_active_idx、直近は tasks_user_created_idx を使う。
+--
+-- p_thresholds: ランクのしきい値（RANK_THRESHOLDS の値。定義はアプリ側に1つだけ置く）
+-- p_if_version: クライアントが持っている change_version。一致すればタスクを読まずに
+--               {"profile": {...}, "not_modified": true} だけを返す
+-- 戻り値: {"profile": {...}, "active_tasks": [...], "recent_tasks": [...], "next_threshold": n}
+
+CREATE OR REPLACE FUNCTION user_status(
+  p_user_id uuid,
+  p_thresholds int[] DEFAULT ARRAY[0, 10, 20, 40, 60, 80, 120],
+  p_recent_limit int DEFAULT 10,
+  p_if_version bigint DEFAULT NULL
+)
+RETURNS jsonb AS $$
+DECLARE
+  prof profiles%ROWTYPE;
+BEGIN
+  INSERT INTO profiles (user_id, points) VALUES (p_user_id, 10)
+    ON CONFLICT (user_id) DO NOTHING;
+  SELECT * INTO prof FROM profiles WHERE user_id = p_user_id;
+
+  IF p_if_version IS NOT NULL AND prof.change_version = p_if_version THEN
+    RETURN jsonb_build_object('profile', to_jsonb(prof), 'not_modified', true);
+  END IF;
+
+  RETURN jsonb_build_object(
+    'profile', to_jsonb(prof),
+    'active_tasks', coalesce((
+      SELECT jsonb_agg(to_jsonb(t))
+      FROM tasks t
+      WHERE t.user_id = p_user_id AND t.status = 'ACTIVE'
+    ), '[]'::jsonb),
+    'recent_tasks', coalesce((
+      SELECT jsonb_agg(to_jsonb(r) ORDER BY r.created_at DESC)
+      FROM (
+        SELECT * FROM tasks
+        WHERE user_id = p_user_id
+        ORDER BY created_at DESC
+        LIMIT p_recent_limit
+      ) r
+    ), '[]'::jsonb),
+    'next_threshold', coalesce((
+      SELECT min(th) FROM unnest(p_thresholds) AS th WHERE th > prof.points
+    ), 10)
+  );
+END;
+$$ LANGUAGE plpgsql;
@@ -2,7 +2,8 @@
 create table if not exists profiles (
   user_id uuid primary key default gen_random_uuid(),
   points int not null default 10,
-  created_at timestamptz not null default now()
+  created_at timestamptz not null default now(),
+  change_version bigint not null default 0
 );
 
 -- Tasks: lifecycle of tasks
@@ -18,22 +19,31 @@ create table if not exists tasks (
   extension_used boolean not null default false,
   completed_at timestamptz,
   self_report text,
-  failed_at timestamptz
+  failed_at timestamptz,
+  ai_completion_comment text,
+  ai_completion_comment_pending boolean not null default false,
+  -- 補正前のモデルの見積もり（分）。0 は実績から作った提案、null は不明
+  ai_estimate_minutes int
 );
 
 create index if not exists tasks_user_active_idx on tasks(user_id) where status = 'ACTIVE';
 create index if not exists tasks_user_created_idx on tasks(user_id, created_at desc);
+create index if not exists tasks_active_deadline_idx on tasks(deadline_at) where status = 'ACTIVE';
 
--- Task events / logs for audit
+-- Task events / logs for audit (written in batches by AuditLog in main.py)
+-- task_id is nullable (points / reset events) and has no foreign key so history survives task deletion
 create table if not exists task_logs (
   id bigserial primary key,
-  task_id uuid not null references tasks(id) on delete cascade,
+  task_id uuid,
   user_id uuid not null references profiles(user_id) on delete cascade,
   event_type text not null,
   payload jsonb,
   created_at timestamptz not null default now()
 );
 
+create index if not exists task_logs_user_created_idx on task_logs(user_id, created_at desc);
+create index if not exists task_logs_task_idx on task_logs(task_id) where task_id is not null;
+
 -- Simple function to ensure maximum 3 ACTIVE tasks per user
 create or replace function enforce_max_active_tasks() returns trigger as $$
 declare
@@ -56,3 +66,112 @@ end;$$ language plpgsql;
 create trigger trg_max_active_tasks
   before insert or update on tasks
   for each row execute procedure enforce_max_active_tasks();
+
+-- Per-user change version for ETag / conditional GET
+-- (see migration_change_version.sql for details)
+create or replace function bump_profile_version_from_task() returns trigger as $$
+begin
+  update profiles
+    set change_version = change_version + 1
+    where user_id = coalesce(new.user_id, old.user_id);
+  return null;
+end;$$ language plpgsql;
+
+create or replace function bump_profile_version_on_points() returns trigger as $$
+begin
+  if new.points is distinct from old.points then
+    new.change_version := old.change_version + 1;
+  end if;
+  return new;
+end;$$ language plpgsql;
+
+create trigger trg_tasks_bump_version
+  after insert or update or delete on tasks
+  for each row execute procedure bump_profile_version_from_task();
+
+create trigger trg_profiles_bump_version
+  before update on profiles
+  for each row execute procedure bump_profile_version_on_points();
+
+-- Atomic task settlement: status transition + clamped points delta in one transaction
+-- (see migration_settle_tasks.sql / migration_deferred_completion_comment.sql / migration_settle_points_delta.sql for details)
+create or replace function settle_tasks(p_user_id uuid, p_transitions jsonb, p_max_points int default 120)
+returns jsonb as $$
+declare
+  tr jsonb;
+  settled_row tasks%rowtype;
+  settled jsonb := '[]'::jsonb;
+  old_points int;
+  new_points int;
+begin
+  select points into old_points from profiles where user_id = p_user_id for update;
+  if not found then
+    raise exception 'Profile not found for user %', p_user_id;
+  end if;
+  new_points := old_points;
+
+  for tr in select * from jsonb_array_elements(p_transitions) loop
+    update tasks set
+      status = tr->>'status',
+      completed_at = coalesce((tr->>'completed_at')::timestamptz, completed_at),
+      failed_at = coalesce((tr->>'failed_at')::timestamptz, failed_at),
+      self_report = coalesce(tr->>'self_report', self_report),
+      ai_completion_comment = case when (tr->>'comment_pending')::boolean then null else ai_completion_comment end,
+      ai_completion_comment_pending = ai_completion_comment_pending or coalesce((tr->>'comment_pending')::boolean, false)
+    where id = (tr->>'task_id')::uuid
+      and user_id = p_user_id
+      and status = 'ACTIVE'
+    returning * into settled_row;
+
+    if found then
+      new_points := least(p_max_points, greatest(0, new_points + (tr->>'points_delta')::int));
+      settled := settled || jsonb_build_array(to_jsonb(settled_row));
+    end if;
+  end loop;
+
+  update profiles set points = new_points where user_id = p_user_id;
+  return jsonb_build_object('points', new_points, 'points_delta', new_points - old_points, 'tasks', settled);
+end;$$ language plpgsql;
+
+-- Status snapshot in one round trip: profile (created if missing), active tasks, recent tasks, next threshold
+-- (see migration_user_status.sql for details)
+create or replace function user_status(
+  p_user_id uuid,
+  p_thresholds int[] default array[0, 10, 20, 40, 60, 80, 120],
+  p_recent_limit int default 10,
+  p_if_version bigint default null
+)
+returns jsonb as $$
+declare
+  prof profiles%rowtype;
+begin
+  insert into profiles (user_id, points) values (p_user_id, 10)
+    on conflict (user_id) do nothing;
+  select * into prof from profiles where user_id = p_user_id;
+
+  if p_if_version is not null and prof.change_version = p_if_version then
+    return jsonb_build_object('profile', to_jsonb(prof), 'not_modified', true);
+  end if;
+
+  return jsonb_build_object(
+    'profile', to_jsonb(prof),
+    'active_tasks', coalesce((
+      select jsonb_agg(to_jsonb(t))
+      from tasks t
+      where t.user_id = p_user_id and t.status = 'ACTIVE'
+    ), '[]'::jsonb),
+    'recent_tasks', coalesce((
+      select jsonb_agg(to_jsonb(r) order by r.created_at desc)
+      from (
+        select * from tasks
+        where user_id = p_user_id
+        order by created_at desc
+        limit p_recent_limit
+      ) r
+    ), '[]'::jsonb),
+    'next_threshold', coalesce((
+      select min(th) from unnest(p_thresholds) as th where th > prof.points
+    ), 10)
+  );
+end;
+$$ language plpgsql;